@@ -13,7 +13,9 @@ __author__ = "Michael J. Harms"
 __date__ = "2016-05-20"
 
 import serial
-import re, warnings, multiprocessing, time, struct
+import re, warnings, multiprocessing, time, struct, threading, queue, collections
+
+from .message_parser import MessageParser
 
 class CmdMessenger:
     """
@@ -90,6 +92,15 @@ class CmdMessenger:
                                     self._byte_escape_sep,
                                     b'\0']
 
+        self._parser = MessageParser(self.field_separator,
+                                     self.command_separator,
+                                     self.escape_separator)
+        self._pending = collections.deque()           # Parsed by receive(), not returned yet
+        self._received = queue.Queue(maxsize=64)     # Parsed by the receive loop
+        self._receive_thread = None
+        self._receive_callback = None
+        self._receiving = False
+
         self._null_escape_re = re.compile(b'\0')
         self._escape_re = re.compile("([{}{}{}\0])".format(self.field_separator,
                                                            self.command_separator,
@@ -119,6 +130,14 @@ class CmdMessenger:
                               "?":self._recv_bool,
                               "g":self._recv_guess}
 
+        # Compile an encoder for each command, so send() doesn't have to work
+        # out the formats and escape every field each time.
+        self._encoders = {}
+        for i, c in enumerate(commands):
+            encoder = self._compile_encoder(i,c[1])
+            if encoder is not None:
+                self._encoders[c[0]] = encoder
+
     def send(self,cmd,*args,arg_formats=None):
         """
         Send a command (which may or may not have associated arguments) to an
@@ -130,6 +149,34 @@ class CmdMessenger:
         arg_formats supercedes formats specified on initialization.
         """
 
+        # Send the message.
+        self.board.write(self.encode(cmd,*args,arg_formats=arg_formats))
+
+    def send_many(self,commands):
+        """
+        Send several commands with a single write to the serial port.
+
+        commands is a list of (cmd, args) tuples, e.g.
+        [("set_pixel", (3, 255, 0, 0)), ("latch", ())]
+        """
+
+        if len(commands) == 0:
+            return
+
+        self.board.write(b"".join([self.encode(cmd,*args) for cmd, args in commands]))
+
+    def encode(self,cmd,*args,arg_formats=None):
+        """
+        Encode a command and its arguments as the bytes send() would write to
+        the serial port, without sending them.
+        """
+
+        # Use the precompiled encoder for the command, if there is one.
+        if arg_formats is None:
+            encoder = self._encoders.get(cmd)
+            if encoder is not None and len(args) == encoder[0]:
+                return encoder[1](args)
+
         # Turn the command into an integer.
         try:
             command_as_int = self._cmd_name_to_int[cmd]
@@ -166,13 +213,71 @@ class CmdMessenger:
         fields = ["{}".format(command_as_int).encode("ascii")]
         for i, a in enumerate(args):
             fields.append(self._send_methods[arg_format_list[i]](a))
-            fields[-1] = self._escape_re.sub(self._byte_escape_sep + r"\1".encode("ascii"),fields[-1])
+            fields[-1] = self._escape(fields[-1])
 
         # Make something that looks like cmd,field1,field2,field3;
         compiled_bytes = self._byte_field_sep.join(fields) + self._byte_command_sep
 
-        # Send the message.
-        self.board.write(compiled_bytes)
+        return compiled_bytes
+
+    def _escape(self,field):
+        """
+        Escape the separators in an encoded field.
+        """
+
+        return self._escape_re.sub(self._byte_escape_sep + r"\1".encode("ascii"),field)
+
+    def _compile_encoder(self,command_as_int,arg_formats):
+        """
+        Compile an encoder for a command with fixed size arguments (c, b, i,
+        I, l, L, f, d and ?).
+
+        The encoded and escaped bytes of the small values (0 to 255, which
+        covers pixel indexes and colors) are looked up in a table. Other values
+        are encoded as usual.
+
+        Returns a (number of arguments, encoder function) tuple, or None if the
+        command has string, guessed or repeated ("*") arguments.
+        """
+
+        fixed_formats = "cbiIlLfd?"
+        if any(f not in fixed_formats for f in arg_formats):
+            return None
+
+        header = "{}".format(command_as_int).encode("ascii")
+        field_sep = self._byte_field_sep
+        command_sep = self._byte_command_sep
+
+        # Commands without arguments always encode to the same bytes
+        if len(arg_formats) == 0:
+            compiled_bytes = header + command_sep
+            return 0, lambda args: compiled_bytes
+
+        send_methods = [self._send_methods[f] for f in arg_formats]
+        tables = []
+        for f in arg_formats:
+            table = {}
+            if f in "biIlL":
+                for value in range(256):
+                    table[value] = self._escape(self._send_methods[f](value))
+            elif f == "?":
+                for value in (False, True):
+                    table[value] = self._escape(self._send_bool(value))
+            tables.append(table)
+
+        escape = self._escape
+        formats = list(zip(tables,send_methods))
+
+        def encoder(args):
+            fields = [header]
+            for (table, send_method), value in zip(formats,args):
+                try:
+                    fields.append(table[value])
+                except (KeyError, TypeError):
+                    fields.append(escape(send_method(value)))
+            return field_sep.join(fields) + command_sep
+
+        return len(arg_formats), encoder
 
     def receive(self,arg_formats=None):
         """
@@ -181,79 +286,133 @@ class CmdMessenger:
         arg_formats is an optimal keyword that specifies the formats to use to
         parse incoming arguments.  If specified here, arg_formats supercedes
         the formats specified on initialization.
+
+        If the receive loop is running (see start_receiving), the next message
+        it queued is returned instead. None is returned if nothing arrives
+        before the board timeout.
         """
 
-        # Read serial input until a command separator or empty character is
-        # reached
-        msg = [[]]
-        raw_msg = []
-        escaped = False
-        command_sep_found = False
-        while True:
-
-            tmp = self.board.read()
-            raw_msg.append(tmp)
-
-            if escaped:
-
-                # Either drop the escape character or, if this wasn't really
-                # an escape, keep previous escape character and new character
-                if tmp in self._escaped_characters:
-                    msg[-1].append(tmp)
-                    escaped = False
-                else:
-                    msg[-1].append(self._byte_escape_sep)
-                    msg[-1].append(tmp)
-                    escaped = False
-            else:
+        if self._receive_thread is not None:
+            try:
+                fields = self._received.get(timeout=self.board.timeout)
+            except queue.Empty:
+                return None
+            return self._decode(fields,arg_formats)
 
-                # look for escape character
-                if tmp == self._byte_escape_sep:
-                    escaped = True
+        # Read whatever is available on the serial port, until a command
+        # separator is found or the read times out.
+        while not self._pending:
+            data = self.board.read_available()
 
-                # or field separator
-                elif tmp == self._byte_field_sep:
-                    msg.append([])
+            # No message received given timeouts
+            if data == b'':
+                partial = self._parser.get_partial()
+                self._parser.reset()
 
-                # or command separator
-                elif tmp == self._byte_command_sep:
-                    command_sep_found = True
-                    break
+                # empty message (likely from line endings being included)
+                if partial.strip() == b'':
+                    return None
 
-                # or any empty characater
-                elif tmp == b'':
-                    break
+                err = "Incomplete message ({})".format(partial.decode(errors="replace"))
+                raise EOFError(err)
 
-                # okay, must be something
-                else:
-                    msg[-1].append(tmp)
+            self._pending.extend(self._parser.feed(data))
 
-        # No message received given timeouts
-        if len(msg) == 1 and len(msg[0]) == 0:
-            return None
+        return self._decode(self._pending.popleft(),arg_formats)
+
+    def start_receiving(self,callback=None):
+        """
+        Receive the messages in a background thread, so reading the serial
+        port never blocks the caller.
+
+        callback is called with each (cmd_name, received, message_time)
+        message, from the background thread. The messages it doesn't handle
+        (it returns a falsy value), or all of them if there is no callback,
+        are queued for receive().
+        """
+
+        if self._receive_thread is not None:
+            return
+
+        self._receive_callback = callback
+        self._receiving = True
+        self._receive_thread = threading.Thread(target=self._receive_loop,name="stargate-dhd-receiver")
+        self._receive_thread.daemon = True
+        self._receive_thread.start()
+
+    def stop_receiving(self):
+        """
+        Stop the background receive loop. It stops within the board timeout.
+        """
 
-        # Make sure the message terminated properly
-        if not command_sep_found:
+        if self._receive_thread is None:
+            return
 
-            # empty message (likely from line endings being included)
-            joined_raw = b''.join(raw_msg)
-            if joined_raw.strip() == b'':
-                return  None
+        self._receiving = False
+        if self._receive_thread is not threading.current_thread():
+            self._receive_thread.join()
+        self._receive_thread = None
 
-            err = "Incomplete message ({})".format(joined_raw.decode())
-            raise EOFError(err)
+    def _receive_loop(self):
 
-        # Turn message into fields
-        fields = [b''.join(m) for m in msg]
+        # Hand over what was already read by receive()
+        while self._pending:
+            self._dispatch(self._pending.popleft())
+
+        while self._receiving:
+            try:
+                data = self.board.read_available()
+            except (serial.SerialException,OSError) as ex:
+                if self.board.log:
+                    self.board.log.log("DHD receive loop stopped: {}".format(ex))
+                self._receiving = False
+                return
+
+            try:
+                for fields in self._parser.feed(data):
+                    self._dispatch(fields)
+            except Exception as ex: # pylint: disable=broad-except
+                # One malformed frame must not stop the receiver
+                self._log_receive_error(ex)
+
+    def _log_receive_error(self,ex):
+        if self.board.log:
+            self.board.log.log("DHD receive loop: dropped a message ({}: {})".format(type(ex).__name__,ex))
+
+    def _dispatch(self,fields):
+
+        if self._receive_callback is not None:
+            try:
+                if self._receive_callback(self._decode(fields)):
+                    return
+            except (ValueError,OverflowError) as ex:
+                if self.give_warnings:
+                    warnings.warn("Could not decode message ({})".format(ex),Warning)
+                return
+            except Exception as ex: # pylint: disable=broad-except
+                self._log_receive_error(ex)
+                return
+
+        try:
+            self._received.put_nowait(fields)
+        except queue.Full:
+            # Nobody is reading the replies, drop the oldest one.
+            self._received.get_nowait()
+            self._received.put_nowait(fields)
+
+    def _decode(self,fields,arg_formats=None):
+        """
+        Turn the fields of a message into (cmd_name, received, message_time).
+        """
 
         # Get the command name.
         cmd = fields[0].strip().decode()
         try:
             cmd_name = self._int_to_cmd_name[int(cmd)]
-        except (ValueError,IndexError):
+        except (ValueError,KeyError,IndexError):
 
+            cmd_name = "unknown"
             if self.give_warnings:
-                cmd_name = "unknown"
                 w = "Recieved unrecognized command ({}).".format(cmd)
                 warnings.warn(w,Warning)
 
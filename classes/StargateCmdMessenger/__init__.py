@@ -7,7 +7,8 @@ library.
 """
 __author__ = "Michael J. Harms"
 __date__ = "2016-05-23"
-__all__ = ["PyCmdMessenger","arduino"]
+__all__ = ["PyCmdMessenger","arduino","message_parser"]
 
 from .PyCmdMessenger import CmdMessenger as CmdMessenger
 from .arduino import ArduinoBoard as ArduinoBoard
+from .message_parser import MessageParser as MessageParser
@@ -183,6 +183,15 @@ class ArduinoBoard:
 
         return self.comm.read()
 
+    def read_available(self):
+        """
+        Read all the bytes waiting in the serial buffer with a single call.
+        If nothing is waiting, wait up to the timeout for the next byte.
+        Returns b'' on timeout.
+        """
+
+        return self.comm.read(max(1, self.comm.in_waiting))
+
     def readline(self):
         """
         Wrap serial readline method.
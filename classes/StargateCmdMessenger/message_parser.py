@@ -0,0 +1,90 @@
+# pylint: skip-file
+
+__description__ = \
+"""
+Streaming parser for CmdMessenger messages, fed with whatever bytes are
+available on the serial port.
+"""
+
+class MessageParser:
+    """
+    Splits a stream of bytes into CmdMessenger messages. The bytes can arrive
+    in any chunks: a partial message is kept until the rest of it is fed.
+    """
+
+    def __init__(self,
+                 field_separator=",",
+                 command_separator=";",
+                 escape_separator="/"):
+
+        self._field_sep = ord(field_separator)
+        self._command_sep = ord(command_separator)
+        self._escape_sep = ord(escape_separator)
+        self._escaped_characters = (self._field_sep,
+                                    self._command_sep,
+                                    self._escape_sep,
+                                    0)
+        self.reset()
+
+    def reset(self):
+        """
+        Drop any partial message.
+        """
+
+        self._fields = []
+        self._field = bytearray()
+        self._escaped = False
+
+    def feed(self,data):
+        """
+        Parse a chunk of bytes.
+
+        Returns a list of the messages completed by this chunk. Each message
+        is a list of its fields as bytes, the command number first.
+        """
+
+        messages = []
+        field = self._field
+        escaped = self._escaped
+        field_sep = self._field_sep
+        command_sep = self._command_sep
+        escape_sep = self._escape_sep
+
+        for byte in data:
+
+            if escaped:
+
+                # Either drop the escape character or, if this wasn't really
+                # an escape, keep previous escape character and new character
+                if byte not in self._escaped_characters:
+                    field.append(escape_sep)
+                field.append(byte)
+                escaped = False
+
+            elif byte == escape_sep:
+                escaped = True
+
+            elif byte == field_sep:
+                self._fields.append(bytes(field))
+                field.clear()
+
+            elif byte == command_sep:
+                self._fields.append(bytes(field))
+                field.clear()
+                messages.append(self._fields)
+                self._fields = []
+
+            else:
+                field.append(byte)
+
+        self._escaped = escaped
+        return messages
+
+    def get_partial(self):
+        """
+        Return the bytes of the partial message, as they were received
+        (without the escape characters).
+        """
+
+        separator = bytes((self._field_sep,))
+        return separator.join(self._fields + [bytes(self._field)])
@@ -1,5 +1,4 @@
-from random import choice
-from time import sleep
+from gate_clock import monotonic
 
 class ChevronManager:
 
@@ -10,6 +9,7 @@ class ChevronManager:
         self.cfg = app.cfg
         self.audio = app.audio
         self.electronics = app.electronics
+        self.timer_wheel = app.timer_wheel
 
         self.chevrons = {}
         self.load_from_config()
@@ -18,7 +18,7 @@ class ChevronManager:
         # Retrieve the Chevron config and initialize the Chevron objects
         self.chevrons = {}
         for chevron_number in range(1,10):
-            self.chevrons[chevron_number] = Chevron( self.electronics, chevron_number, self.audio, self.cfg )
+            self.chevrons[chevron_number] = Chevron( self.electronics, chevron_number, self.audio, self.cfg, self.timer_wheel )
 
     def get( self, chevron_number ):
         return self.chevrons[int(chevron_number)]
@@ -29,25 +29,61 @@ class ChevronManager:
             row = {}
             row['position'] = chevron.position
             row['led_state'] = chevron.led_state
+            row['moving'] = chevron.is_moving()
             output[index] = row
         return output
 
-    def all_off(self, sound_on=None):
+    def cycle_outgoing(self, chevron_numbers, stagger=0):
         """
-        A helper method to turn off all the chevrons
-        :param sound_on: Set sound_on to 'on' if sound is desired when turning off a chevron light.
-        :param chevrons: the dictionary of chevrons
+        This method cycles several chevrons at the same time, eg for an "all chevrons" effect.
+        :param chevron_numbers: the chevrons to cycle
+        :param stagger: the seconds between the start of each chevron
+        :return: the list of TimerSequences is returned
+        """
+        return [self.get(chevron_number).cycle_outgoing(wait=False, delay=index * stagger)
+                for index, chevron_number in enumerate(chevron_numbers)]
+
+    def wait_until_stopped(self, timeout=None):
+        """
+        This method waits until none of the chevrons are moving.
+        :param timeout: the most seconds to wait for each chevron, or None to wait forever.
         :return: Nothing is returned
         """
         for chevron in self.chevrons.values():
-            if sound_on == 'on':
-                chevron.off(sound_on='on')
-            else:
-                chevron.off()
+            chevron.wait(timeout=timeout)
 
-    def all_lights_on(self):
-        for chevron in self.chevrons.values():
-            chevron.light_on()
+    def all_off(self, sound_on=None, stagger=0):
+        """
+        A helper method to turn off all the chevrons. Chevrons that are still moving are stopped first.
+        :param sound_on: Set sound_on to 'on' if sound is desired when turning off a chevron light.
+        :param stagger: the seconds between each chevron light, for an effect. 0 turns them all off at once.
+        :return: Nothing is returned
+        """
+        sound = 'on' if sound_on == 'on' else None
+        self.run_on_all(lambda chevron: chevron.off(sound=sound), stagger, stop_motors=True)
+
+    def all_lights_on(self, stagger=0):
+        """
+        A helper method to turn on all the chevron lights.
+        :param stagger: the seconds between each chevron light, for an effect. 0 turns them all on at once.
+        :return: Nothing is returned
+        """
+        self.run_on_all(lambda chevron: chevron.light_on(), stagger)
+
+    def run_on_all(self, action, stagger, stop_motors=False):
+        if stop_motors:
+            for chevron in self.chevrons.values():
+                chevron.stop()
+
+        if not stagger:
+            for chevron in self.chevrons.values():
+                action(chevron)
+            return
+
+        # Schedule the staggered effect on the timer wheel, and wait for it to finish
+        steps = [(index * stagger, lambda chevron=chevron: action(chevron), None)
+                 for index, chevron in enumerate(self.chevrons.values())]
+        self.timer_wheel.schedule_sequence(steps).wait()
 
 
 class Chevron:
@@ -57,11 +93,12 @@ class Chevron:
     The motor_number is the number for the motor as an int.
     """
 
-    def __init__(self, electronics, chevron_number, audio, cfg):
+    def __init__(self, electronics, chevron_number, audio, cfg, timer_wheel):
 
         self.cfg = cfg
         self.audio = audio
         self.electronics = electronics
+        self.timer_wheel = timer_wheel
 
         # Retrieve Configurations
         # TODO: Move to allow config to change without restart
@@ -77,32 +114,87 @@ class Chevron:
 
         self.position = "unknown"
         self.led_state = False
+        self.sequence = None # The TimerSequence of the current cycle
 
-    def cycle_outgoing(self):
-        self.move_down() # Motor down, light on
-        self.move_up() # Motor up, light unchanged
+    def get_outgoing_steps(self, sound_started=False):
+        """
+        This method lists the timed steps of an outgoing chevron lock: motor down, light on, motor up.
+        :param sound_started: True if the chevron down sound was already started, eg while the ring was decelerating.
+            The headstart is then skipped.
+        :return: a list of (offset in seconds, callback, milestone name or None) tuples, for the TimerWheel
+        """
+        steps = []
+        motor_down_time = 0
+        if not sound_started:
+            steps.append((0, lambda: self.audio.sound_start('chevron_1'), None)) # chev down audio
+            motor_down_time = self.audio_chevron_down_headstart
+        light_on_time = motor_down_time + self.chevron_down_time + self.chevron_down_wait_time
+        motor_up_time = light_on_time + self.chevron_down_wait_time
+        return steps + [
+            (motor_down_time, self.start_motor_down, None),
+            (motor_down_time + self.chevron_down_time, self.stop_motor_down, None),
+            (light_on_time, self.lock_light_on, 'locked'),
+            (motor_up_time, self.start_motor_up, 'rising'),
+            (motor_up_time + self.chevron_up_time, self.stop_motor_up, None)
+        ]
+
+    def cycle_outgoing(self, wait=True, delay=0, sound_started=False):
+        """
+        This method does the chevron locking thing: motor down, light on, motor up.
+        The steps run on the timer wheel, so other chevrons and the ring can move at the same time.
+        :param wait: True to return when the chevron is back up. False returns immediately, the caller can wait on the
+            returned TimerSequence: sequence.wait('locked'), sequence.wait('rising') or sequence.wait()
+        :param delay: the seconds to wait before starting.
+        :param sound_started: True if the chevron down sound was already started.
+        :return: the TimerSequence is returned
+        """
+        # Don't start over a chevron that is still moving
+        self.stop()
+        steps = self.get_outgoing_steps(sound_started)
+        self.sequence = self.timer_wheel.schedule_sequence(steps, start_time=monotonic() + delay)
+        if wait:
+            self.sequence.wait()
+        return self.sequence
+
+    def is_moving(self):
+        return self.sequence is not None and not self.sequence.is_done()
+
+    def wait(self, milestone=None, timeout=None):
+        """
+        This method waits for the current chevron cycle, if any.
+        :param milestone: 'locked' or 'rising' to wait for a step of the cycle, or None to wait for the whole cycle.
+        :param timeout: the most seconds to wait, or None to wait forever.
+        :return: True if it's done, False if the timeout expired.
+        """
+        if self.sequence is None:
+            return True
+        return self.sequence.wait(milestone, timeout)
 
-    def move_down(self):
-        ### Chevron Down ###
-        self.audio.sound_start('chevron_1') # chev down audio
-        sleep(self.audio_chevron_down_headstart)
+    def stop(self):
+        """
+        This method cancels the current chevron cycle, if any, and stops the motor.
+        :return: Nothing is returned
+        """
+        if self.is_moving():
+            self.sequence.cancel()
+            self.motor.throttle = None
 
+    def start_motor_down(self):
         self.motor.throttle = self.chevron_down_throttle # Start the motor
-        sleep(self.chevron_down_time) # Motor movement time
+
+    def stop_motor_down(self):
         self.motor.throttle = None # Stop the motor
         self.position = "unlocked"
 
-        ### Turn on the LED ###
-        sleep(self.chevron_down_wait_time) # wait time without motion
+    def lock_light_on(self):
         self.audio.sound_start('chevron_3') # led on audio
         self.light_on()
-        sleep(self.chevron_down_wait_time) # wait time without motion
 
-    def move_up(self):
-        ### Chevron Down ###
+    def start_motor_up(self):
         self.audio.sound_start('chevron_2') # chev up audio
         self.motor.throttle = self.chevron_up_throttle # Start the motor
-        sleep(self.chevron_up_time) # motor movement time
+
+    def stop_motor_up(self):
         self.motor.throttle = None # Stop the motor
         self.position = "locked"
 
@@ -119,7 +211,7 @@ class Chevron:
 
     def off(self, sound=None):
         if sound == 'on':
-            choice(self.audio.incoming_chevron_sounds).play()
+            self.audio.incoming_chevron()
         if self.led:
             self.led.off()
         self.led_state = False
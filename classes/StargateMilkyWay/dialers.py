@@ -1,6 +1,7 @@
 import os
-from time import sleep
+from threading import Lock
 from serial.serialutil import SerialException
+from gate_clock import sleep
 import StargateCmdMessenger
 
 class Dialer: # pylint: disable=too-few-public-methods
@@ -9,6 +10,7 @@ class Dialer: # pylint: disable=too-few-public-methods
 
         self.log = stargate.log
         self.cfg = stargate.cfg
+        self.electronics = stargate.electronics
 
         # Retrieve the configurations
         self.dhd_port = self.cfg.get("dhd_serial_port")
@@ -38,10 +40,14 @@ class Dialer: # pylint: disable=too-few-public-methods
         try:
             # If The DHD is disabled, raise an exception to jump to the except block and use KeyboardMode
             if not self.dhd_enable:
-                raise AttributeError
+                raise SerialException("The DHD is disabled")
 
             self.hardware = self._connect_dhd()
             self.type = "DHDv2"
+
+            # Time the serial writes, if the electronics profiler is on
+            if hasattr(self.electronics, 'profile_method'):
+                self.electronics.profile_method(self.hardware.board, 'write', 'serial.dhd.write')
         except SerialException:
             self.log.log('No DHD found or DHD is disabled. Switching to keyboard mode')
             self.hardware = KeyboardMode()
@@ -72,58 +78,99 @@ class Dialer: # pylint: disable=too-few-public-methods
 
         return dhd
 
-class DHDv2:
+class DHDv2: # pylint: disable=too-many-public-methods
+    """
+    This class drives the DHDv2 over serial, with the CmdMessenger protocol.
+
+    The pixel changes can be staged with the stage_* methods, and sent with flush(). The staged changes are compared
+    to what the DHD has in its RAM buffer, and only the difference is sent, with a single latch, in one serial write.
+    """
+
+    # The DHD LED for each symbol number. The center button is symbol 0.
+    SYMBOL_NUMBER_TO_DHD_LIGHT_MAP = {0: 0, 1: 34, 2: 2, 3: 21, 4: 20, 5: 36, 6: 29, 7: 31, 8: 18, 9: 37,
+                                      10: 10, 11: 23, 12: 25, 14: 4, 15: 15, 16: 12, 17: 3, 18: 5, 19: 33,
+                                      20: 38, 21: 22, 22: 32, 23: 6, 24: 30, 25: 1, 26: 7, 27: 17, 28: 11, 29: 28,
+                                      30: 13, 31: 16, 32: 35, 33: 9, 34: 26, 35: 14, 36: 19, 37: 24, 38: 27, 39: 8}
+    LED_COUNT = 39
+
+    # List of command names (and formats for their associated arguments). These must
+    # be in the same order as in the sketch.
+    COMMANDS = [
+        ["get_fw_version", "s"],
+        ["get_hw_version", "s"],
+        ["get_identifier", "s"],
+        ["reset", ""],
+        ["evt_error", "s"],
+        ["evt_ack", ""],
+
+        ["message_bool", "?"],
+        ["message_string", "s"],
+        ["message_int", "i"],
+        ["message_long", "l"],
+        ["message_double", "d"],
+        ["message_color", "iii"],
+
+        ["clear_all", ""],  # Turns off all pixels in the RAM buffer.
+        ["clear_pixel", "i"],
+        # Turns off the pixel at the provided index, in the RAM buffer. [ pixelIndex ]. Index starts at 0.
+        ["set_all", "iii"],  # Sets all pixels to color provided, in the RAM buffer. [ red, green, blue ]
+        ["set_pixel", "iiii"],
+        # Sets pixel to color provided, in the RAM buffer.[ pixelIndex, red, green, blue ]. Index starts at 0.
+
+        ["get_pixel_count", "i"],  # Returns the number of pixels managed by the library instance
+
+        ["set_brightness_symbols", "i"],  # Set brightness for the symbol rings' LEDs.
+        # ** Per library documentation: "Intended to be called once, in setup(),
+        # to limit the current/brightness of the LEDs throughout the life of the
+        # sketch. It is not intended as an animation effect itself! The operation
+        # of this function is “lossy” — it modifies the current pixel data in RAM,
+        # not in the show() call — in order to meet NeoPixels’ strict timing
+        # requirements. Certain animation effects are better served by leaving the
+        # brightness setting at the default maximum, modulating pixel brightness
+        # in your own sketch logic and redrawing the full strip with setPixel()."
+        ["set_brightness_center", "i"],  # Set brightness for the center LED. Call this once: cautions as above.
+
+        ["latch", ""],  # Transmits the current pixel configuration in the RAM buffer out to the pixels
+    ]
 
     def __init__(self, port, baud_rate, log):
         # Initialize an ArduinoBoard instance.
         self.board = StargateCmdMessenger.ArduinoBoard(port, baud_rate=baud_rate, log=log)
 
-        # List of command names (and formats for their associated arguments). These must
-        # be in the same order as in the sketch.
-        self.commands = [
-            ["get_fw_version", "s"],
-            ["get_hw_version", "s"],
-            ["get_identifier", "s"],
-            ["reset", ""],
-            ["evt_error", "s"],
-            ["evt_ack", ""],
-
-            ["message_bool", "?"],
-            ["message_string", "s"],
-            ["message_int", "i"],
-            ["message_long", "l"],
-            ["message_double", "d"],
-            ["message_color", "iii"],
-
-            ["clear_all", ""],  # Turns off all pixels in the RAM buffer.
-            ["clear_pixel", "i"],
-            # Turns off the pixel at the provided index, in the RAM buffer. [ pixelIndex ]. Index starts at 0.
-            ["set_all", "iii"],  # Sets all pixels to color provided, in the RAM buffer. [ red, green, blue ]
-            ["set_pixel", "iiii"],
-            # Sets pixel to color provided, in the RAM buffer.[ pixelIndex, red, green, blue ]. Index starts at 0.
-
-            ["get_pixel_count", "i"],  # Returns the number of pixels managed by the library instance
-
-            ["set_brightness_symbols", "i"],  # Set brightness for the symbol rings' LEDs.
-            # ** Per library documentation: "Intended to be called once, in setup(),
-            # to limit the current/brightness of the LEDs throughout the life of the
-            # sketch. It is not intended as an animation effect itself! The operation
-            # of this function is “lossy” — it modifies the current pixel data in RAM,
-            # not in the show() call — in order to meet NeoPixels’ strict timing
-            # requirements. Certain animation effects are better served by leaving the
-            # brightness setting at the default maximum, modulating pixel brightness
-            # in your own sketch logic and redrawing the full strip with setPixel()."
-            ["set_brightness_center", "i"],  # Set brightness for the center LED. Call this once: cautions as above.
-
-            ["latch", ""],  # Transmits the current pixel configuration in the RAM buffer out to the pixels
-        ]
+        self.commands = self.COMMANDS
 
         self.color_symbols = None
         self.color_center = None
 
+        # What we know of the DHD RAM buffer: {led_id: (red, green, blue)}. LEDs we don't know are missing.
+        self.pixel_state = {}
+        # The changes waiting for flush(): {led_id: (red, green, blue)}
+        self.staged_pixels = {}
+        # The DHD is driven from the main loop, the keyboard and the web server threads.
+        self.lock = Lock()
+
+        self.log = log
+
         # Initialize the messenger
         self.c = StargateCmdMessenger.CmdMessenger(self.board, self.commands) # pylint: disable=invalid-name
 
+        # Read the replies and events from the DHD in the background, so a slow or silent DHD never blocks the gate.
+        self.c.start_receiving(self.handle_message)
+
+    def handle_message(self, message):
+        """
+        This method handles the events sent by the DHD, from the receive thread.
+        :param message: the (command name, arguments, time) tuple
+        :return: True if the message was handled. Other messages (the replies) are queued for receive().
+        """
+        cmd_name, arguments = message[0], message[1]
+        if cmd_name == "evt_error":
+            self.log.log(f"DHD error: {arguments[0] if arguments else 'unknown'}")
+            return True
+        if cmd_name == "evt_ack":
+            return True
+        return False
+
     def get_firmware_version(self):
         self.c.send("get_fw_version")
         return self.c.receive()[1][0]
@@ -145,58 +192,138 @@ class DHDv2:
         return self.c.receive()[1][0]
 
     def set_brightness_symbols(self, brightness):
-        self.c.send("set_brightness_symbols", brightness)
+        with self.lock:
+            self.c.send("set_brightness_symbols", brightness)
+            # The brightness is applied to the pixels in the RAM buffer, we no longer know their colors.
+            self.pixel_state = {}
         return True
 
     def set_brightness_center(self, brightness):
-        self.c.send("set_brightness_center", brightness)
+        with self.lock:
+            self.c.send("set_brightness_center", brightness)
+            self.pixel_state = {}
         return True
 
     def set_all_pixels_to_color(self, red, green, blue):
-        self.c.send("set_all", red, green, blue)
+        with self.lock:
+            self.c.send("set_all", red, green, blue)
+            self.pixel_state = dict.fromkeys(range(self.LED_COUNT), (red, green, blue))
         return True
 
     def set_pixel(self, pixel_index, red, green, blue):
-        symbol_number_to_dhd_light_map = {0: 0, 1: 34, 2: 2, 3: 21, 4: 20, 5: 36, 6: 29, 7: 31, 8: 18, 9: 37,
-                                          10: 10, 11: 23, 12: 25, 14: 4, 15: 15, 16: 12, 17: 3, 18: 5, 19: 33,
-                                          20: 38, 21: 22, 22: 32, 23: 6, 24: 30, 25: 1, 26: 7, 27: 17, 28: 11, 29: 28,
-                                          30: 13, 31: 16, 32: 35, 33: 9, 34: 26, 35: 14, 36: 19, 37: 24, 38: 27, 39: 8}
-        self.c.send("set_pixel", symbol_number_to_dhd_light_map[pixel_index], red, green, blue)
+        self.set_pixel_use_led_id(self.SYMBOL_NUMBER_TO_DHD_LIGHT_MAP[pixel_index], red, green, blue)
         return True
 
     def set_pixel_use_led_id(self, pixel_index, red, green, blue):
-        self.c.send("set_pixel", pixel_index, red, green, blue)
+        with self.lock:
+            self.c.send("set_pixel", pixel_index, red, green, blue)
+            self.pixel_state[pixel_index] = (red, green, blue)
         return True
 
     def clear_all_pixels(self):
-        self.c.send("clear_all")
+        with self.lock:
+            self.c.send("clear_all")
+            self.pixel_state = dict.fromkeys(range(self.LED_COUNT), (0, 0, 0))
         return True
 
     def clear_pixel(self, pixel_index):
-        self.c.send("clear_pixel", pixel_index)
+        with self.lock:
+            self.c.send("clear_pixel", pixel_index)
+            self.pixel_state[pixel_index] = (0, 0, 0)
         return True
 
     def latch(self):
-        self.c.send("latch")
+        with self.lock:
+            self.c.send("latch")
         return True
 
+    def stage_pixel(self, symbol_number, red, green, blue):
+        """
+        This method stages a color change for the LED of a symbol. Nothing is sent before flush() is called.
+        :param symbol_number: the symbol number. The center button is 0.
+        :return: Nothing is returned
+        """
+        self.stage_pixel_use_led_id(self.SYMBOL_NUMBER_TO_DHD_LIGHT_MAP[symbol_number], red, green, blue)
+
+    def stage_pixel_use_led_id(self, pixel_index, red, green, blue):
+        with self.lock:
+            self.staged_pixels[pixel_index] = (red, green, blue)
+
+    def stage_all_pixels(self, red, green, blue):
+        with self.lock:
+            self.staged_pixels = dict.fromkeys(range(self.LED_COUNT), (red, green, blue))
+
+    def flush(self):
+        """
+        This method sends the staged changes to the DHD, and latches them. LEDs that already have the staged color
+        are skipped. When most of the LEDs end up with the same color, they are all set at once, and the others are
+        set after.
+        :return: True if anything was sent, False if the DHD already showed the staged changes.
+        """
+        with self.lock:
+            commands = self.get_frame_commands(self.staged_pixels)
+            self.staged_pixels = {}
+            if not commands:
+                return False
+
+            commands.append(("latch", ()))
+            self.c.send_many(commands)
+            return True
+
+    def get_frame_commands(self, staged_pixels):
+        """
+        This method works out the fewest commands needed to apply the staged changes, and updates pixel_state.
+        :param staged_pixels: the changes, as a dict of {led_id: (red, green, blue)}
+        :return: a list of (command, args) tuples, without the latch.
+        """
+        changed = {led: color for led, color in staged_pixels.items() if self.pixel_state.get(led) != color}
+        if not changed:
+            return []
+
+        final_state = dict(self.pixel_state)
+        final_state.update(staged_pixels)
+        commands = [self.get_pixel_command(led, color) for led, color in sorted(changed.items())]
+
+        # Setting all the LEDs at once needs the final color of each LED, to set the others back after.
+        if len(final_state) == self.LED_COUNT:
+            for fill_color in set(changed.values()):
+                others = sorted(led for led, color in final_state.items() if color != fill_color)
+                if len(others) + 1 < len(commands):
+                    commands = [self.get_fill_command(fill_color)]
+                    commands += [self.get_pixel_command(led, final_state[led]) for led in others]
+
+        self.pixel_state = final_state
+        return commands
+
+    @staticmethod
+    def get_pixel_command(led, color):
+        if color == (0, 0, 0):
+            return ("clear_pixel", (led,))
+        return ("set_pixel", (led,) + color)
+
+    @staticmethod
+    def get_fill_command(color):
+        if color == (0, 0, 0):
+            return ("clear_all", ())
+        return ("set_all", color)
+
     def clear_lights(self):
-        self.set_all_pixels_to_color(0, 0, 0) # All Off
-        self.latch()
+        self.stage_all_pixels(0, 0, 0) # All Off
+        self.flush()
 
     def set_center_on( self ):
-        self.set_pixel(0, self.color_center[0], self.color_center[1], self.color_center[2]) # LED 0, Pure red.
-        self.latch()
+        self.stage_pixel(0, *self.color_center) # LED 0, Pure red.
+        self.flush()
 
     def set_symbol_on( self, symbol_number ):
-        self.set_pixel(symbol_number, self.color_symbols[0], self.color_symbols[1], self.color_symbols[2])
-        self.latch()
+        self.stage_pixel(symbol_number, *self.color_symbols)
+        self.flush()
 
     def set_color_center(self, color_tuple):
-        self.color_center = color_tuple
+        self.color_center = tuple(color_tuple)
 
     def set_color_symbols(self, color_tuple):
-        self.color_symbols = color_tuple
+        self.color_symbols = tuple(color_tuple)
 
     @staticmethod
     def get_dhd_port():
@@ -217,7 +344,7 @@ class DHDv2:
         return None
 
 
-class KeyboardMode:
+class KeyboardMode: # pylint: disable=too-many-public-methods
     """
     This is just a fallback class that disables all the DHD LED functions in case the DHD is not present. You can use a regular keyboard instead.
     To dial Aphopis's base, just hit cFX1K98A on your keyboard.
@@ -260,12 +387,8 @@ class KeyboardMode:
 
     @staticmethod
     def set_pixel(pixel_index, red, green, blue): # pylint: disable=unused-argument
-        # pylint: disable-next=unused-variable
-        symbol_number_to_dhd_light_map = {0: 0, 1: 34, 2: 2, 3: 21, 4: 20, 5: 36, 6: 29, 7: 31, 8: 18, 9: 37,
-                                          10: 10, 11: 23, 12: 25, 14: 4, 15: 15, 16: 12, 17: 3, 18: 5, 19: 33,
-                                          20: 38, 21: 22, 22: 32, 23: 6, 24: 30, 25: 1, 26: 7, 27: 17, 28: 11, 29: 28,
-                                          30: 13, 31: 16, 32: 35, 33: 9, 34: 26, 35: 14, 36: 19, 37: 24, 38: 27, 39: 8}
         # TODO: initialize dummy data instead
+        pass
 
     @staticmethod
     def set_pixel_use_led_id(pixel_index, red, green, blue):
@@ -283,6 +406,22 @@ class KeyboardMode:
     def latch():
         pass
 
+    @staticmethod
+    def stage_pixel(symbol_number, red, green, blue):
+        pass
+
+    @staticmethod
+    def stage_pixel_use_led_id(pixel_index, red, green, blue):
+        pass
+
+    @staticmethod
+    def stage_all_pixels(red, green, blue):
+        pass
+
+    @staticmethod
+    def flush():
+        pass
+
     @staticmethod
     def clear_lights():
         pass
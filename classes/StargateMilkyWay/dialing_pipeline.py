@@ -0,0 +1,147 @@
+from gate_clock import monotonic, time
+
+class DialingPipeline:
+    """
+    This class locks the outgoing symbols: move the ring, lock the chevron, send the symbols over subspace.
+
+    In "canon" mode the stages run one after the other, like in the show.
+    In "fast" mode they overlap:
+     - The chevron sound starts while the ring is decelerating, instead of after it stopped.
+     - The symbols are sent over subspace while the chevron engages.
+     - The next ring move is planned while the chevron engages, and starts as soon as the chevron is rising.
+
+    The time spent in each stage is recorded for each chevron, in milliseconds.
+    """
+
+    CANON = 'canon'
+    FAST = 'fast'
+
+    def __init__(self, stargate):
+        self.stargate = stargate
+        self.log = stargate.log
+        self.cfg = stargate.cfg
+        self.audio = stargate.audio
+        self.ring = stargate.ring
+        self.chevrons = stargate.chevrons
+
+        self.mode = self.CANON
+        self.timings = []
+        self.dial_start_time = None
+        self.chevron_sequence = None # The TimerSequence of the last chevron, while it's moving
+        self.next_move = None        # The (symbol, chevron, RingMove) planned ahead
+
+    def reset(self):
+        self.mode = self.cfg.get("dialing_pipeline_mode")
+        self.timings = []
+        self.dial_start_time = monotonic()
+        self.chevron_sequence = None
+        self.next_move = None
+
+    def get_timing_report(self):
+        """
+        This method reports the time spent in each stage, for the chevrons locked in the current (or last) dial.
+        :return: a dict is returned
+        """
+        return {
+            "mode": self.mode,
+            "chevrons": list(self.timings),
+            "total_ms": self.timings[-1]['elapsed_ms'] if self.timings else 0
+        }
+
+    def lock_next_symbol(self):
+        """
+        This method locks the next symbol in the outgoing address buffer.
+        :return: Nothing is returned
+        """
+        stargate = self.stargate
+        if stargate.locked_chevrons_outgoing == 0:
+            self.reset()
+        fast = self.mode == self.FAST
+
+        chevron_number = stargate.locked_chevrons_outgoing + 1
+        symbol_number = stargate.address_buffer_outgoing[chevron_number - 1]
+        timing = { "chevron": chevron_number, "symbol": symbol_number }
+        stage_start = monotonic()
+
+        ### Wait for the previous chevron to release the ring ###
+        if self.chevron_sequence:
+            self.chevron_sequence.wait('rising')
+            self.chevron_sequence = None
+        stage_start = self.record_stage(timing, 'wait_ms', stage_start)
+
+        ### Move the ring ###
+        planned_move = None
+        if self.next_move and self.next_move[0:2] == (symbol_number, chevron_number):
+            planned_move = self.next_move[2]
+        self.next_move = None
+
+        sound_started = []
+        def start_chevron_sound():
+            self.audio.sound_start('chevron_1') # chev down audio
+            sound_started.append(True)
+
+        self.ring.move_symbol_to_chevron(symbol_number, chevron_number, planned_move,
+                                         on_decelerate=start_chevron_sound if fast else None) # Dial the symbol
+        stargate.locked_chevrons_outgoing += 1  # Increment the locked chevrons variable.
+        stage_start = self.record_stage(timing, 'ring_ms', stage_start)
+
+        # If the gate shutdown requested, stop doing things.
+        if not stargate.running:
+            return
+
+        ### Lock the chevron ###
+        try:
+            chevron = self.chevrons.get(chevron_number)
+        except KeyError:  # If we dialed more chevrons than the stargate can handle.
+            chevron = None  # Just continue without activating a chevron.
+
+        if not fast:
+            if chevron:
+                chevron.cycle_outgoing() # Do the chevron locking thing.
+            stage_start = self.record_stage(timing, 'chevron_ms', stage_start)
+            self.log_locked(chevron_number)
+            stargate.send_locked_symbols_to_fan_gate()
+            self.record_stage(timing, 'subspace_ms', stage_start)
+        else:
+            if chevron:
+                self.chevron_sequence = chevron.cycle_outgoing(wait=False, sound_started=bool(sound_started))
+
+            # While the chevron engages
+            stargate.send_locked_symbols_to_fan_gate()
+            subspace_end = monotonic()
+            self.plan_next_move(chevron_number)
+
+            if self.chevron_sequence:
+                self.chevron_sequence.wait('locked')
+            timing['subspace_ms'] = round((subspace_end - stage_start) * 1000, 1)
+            self.record_stage(timing, 'chevron_ms', stage_start)
+            self.log_locked(chevron_number)
+
+        stargate.last_activity_time = time()  # update the last_activity_time
+        timing['elapsed_ms'] = round((monotonic() - self.dial_start_time) * 1000, 1)
+        self.timings.append(timing)
+        self.log.log(f"Chevron {chevron_number} timing ({self.mode}): " +
+                     ", ".join(f"{key[:-3]} {value:.0f}ms" for key, value in timing.items() if key.endswith('_ms')))
+
+    def plan_next_move(self, chevron_number):
+        """
+        This method plans the ring move for the next symbol, if it was already dialed, from where the ring is now.
+        :return: Nothing is returned
+        """
+        address = self.stargate.address_buffer_outgoing
+        if len(address) > chevron_number:
+            next_symbol = address[chevron_number]
+            self.next_move = (next_symbol, chevron_number + 1,
+                              self.ring.plan_move_symbol_to_chevron(next_symbol, chevron_number + 1))
+
+    def log_locked(self, chevron_number):
+        try:
+            self.log.log(f'Chevron {chevron_number} locked with symbol: {self.stargate.address_buffer_outgoing[chevron_number - 1]}')
+        except IndexError:
+            pass
+
+    @staticmethod
+    def record_stage(timing, name, stage_start):
+        now = monotonic()
+        timing[name] = round((now - stage_start) * 1000, 1)
+        return now
@@ -1,3 +1,6 @@
+from gate_clock import monotonic
+
+from stargate_config import StargateConfig
 
 # Hardware Mode enums
 HARDWARE_MODE_NONE = 0
@@ -7,6 +10,17 @@ HARDWARE_MODE_MAINBOARD_1V1 = 2
 class Electronics: # pylint: disable=too-few-public-methods
 
     def __new__(cls, app):
+        electronics = cls.get_electronics(app)
+
+        # Time the hardware calls, for the debug page
+        if app.cfg.get("electronics_profiler_enable"):
+            from electronics_profiler import ElectronicsProfiler # pylint: disable=import-outside-toplevel
+            app.log.log("The electronics profiler is enabled")
+            return ElectronicsProfiler(electronics)
+        return electronics
+
+    @staticmethod
+    def get_electronics(app):
         # Detect Hardware
         hw_mode = HardwareDetector(app).get_hardware_mode()
 
@@ -25,15 +39,32 @@ class Electronics: # pylint: disable=too-few-public-methods
 
 
 class HardwareDetector:
+    """
+    This class detects the electronics from the devices on the I2C bus.
+    The detected hardware mode is cached. On the next boot, only the signature addresses of the cached mode are probed,
+    then the signatures of the other modes. The full bus is only scanned when no signature matches.
+    """
+
+    # The I2C addresses that identify each hardware mode, in detection order
+    SIGNATURES = {
+        HARDWARE_MODE_ORIGINAL: [0x60, 0x61, 0x62],  # The Adafruit motor shields
+        HARDWARE_MODE_MAINBOARD_1V1: [0x66, 0x6f]
+    }
+    NAMES = {
+        HARDWARE_MODE_NONE: "None",
+        HARDWARE_MODE_ORIGINAL: "Original",
+        HARDWARE_MODE_MAINBOARD_1V1: "Mainboard v1.1"
+    }
 
     def __init__(self, app):
         self.log = app.log
         self.hardware_mode = None
         self.hardware_mode_name = None
 
-        # TODO: Refactor this to loop over the signatures in an array
-        self.signature_adafruit_shields = ['0x60', '0x61', '0x62'] # HARDWARE_MODE_ORIGINAL
-        self.signature_mainboard_1v1 = ['0x66', '0x6f'] # HARDWARE_MODE_MAINBOARD_1V1
+        # The hardware mode detected on the last boot
+        self.cache = StargateConfig(app.base_path, "hardware_cache", app.galaxy_path)
+        self.cache.set_log(self.log)
+        self.cache.load()
 
         self.smbus = False
         self.import_smbus()
@@ -48,7 +79,23 @@ class HardwareDetector:
             self.log.log("Failed to import smbus. Assuming no I2C devices.")
             return
 
+    @staticmethod
+    def probe(bus, address):
+        """
+        This method checks if a device answers on an I2C address.
+        :return: True if the device is present, False if not.
+        """
+        try:
+            bus.read_byte(address)
+            return True
+        except: # exception if read_byte fails # pylint: disable=bare-except
+            return False
+
     def get_i2c_devices(self):
+        """
+        This method scans the whole I2C bus. It's slow, each absent address times out.
+        :return: the list of the addresses that answered, as hex strings
+        """
         devices = []
         # If we don't have smbus, we have no i2c devices, return an empty array
         if not self.smbus:
@@ -56,23 +103,46 @@ class HardwareDetector:
 
         bus = self.smbus.SMBus(1) # 1 indicates /dev/i2c-1
         for device in range(128):
-            try:
-                bus.read_byte(device)
+            if self.probe(bus, device):
                 devices.append(hex(device))
-            except: # exception if read_byte fails # pylint: disable=bare-except
-                pass
         return devices
 
+    def match_signatures(self, modes):
+        """
+        This method probes the signature addresses of some hardware modes.
+        :param modes: the hardware modes to check, in order
+        :return: the first hardware mode with all its signature addresses present, or None.
+        """
+        bus = self.smbus.SMBus(1) # 1 indicates /dev/i2c-1
+        for mode in modes:
+            if all(self.probe(bus, address) for address in self.SIGNATURES[mode]):
+                return mode
+        return None
+
+    def detect_hardware_mode(self):
+        if not self.smbus:
+            return HARDWARE_MODE_NONE, "no I2C"
+
+        # Verify the cached mode first, then the other signatures
+        cached_mode = self.cache.get('hardware_mode')
+        modes = sorted(self.SIGNATURES, key=lambda mode: mode != cached_mode)
+        mode = self.match_signatures(modes)
+        if mode is not None:
+            return mode, "cached" if mode == cached_mode else "signature probe"
+
+        # No known hardware, scan the bus for the log
+        self.log.log(f"No known electronics found. I2C devices: {self.get_i2c_devices()}")
+        return HARDWARE_MODE_NONE, "full scan"
+
     def get_hardware_mode(self):
         if self.hardware_mode is None:
-            devices = self.get_i2c_devices()
-
-            if all( item in devices for item in self.signature_adafruit_shields ):
-                self.hardware_mode = HARDWARE_MODE_ORIGINAL
-            elif all( item in devices for item in self.signature_mainboard_1v1 ):
-                self.hardware_mode = HARDWARE_MODE_MAINBOARD_1V1
-            else:
-                self.hardware_mode = HARDWARE_MODE_NONE
+            start_time = monotonic()
+            self.hardware_mode, method = self.detect_hardware_mode()
+            self.hardware_mode_name = self.NAMES[self.hardware_mode]
+            self.log.log(f"Detected electronics: {self.hardware_mode_name} ({method}, {(monotonic() - start_time) * 1000:.0f}ms)")
+
+            if self.cache.get('hardware_mode') != self.hardware_mode:
+                self.cache.set('hardware_mode', self.hardware_mode)
 
         return self.hardware_mode
 
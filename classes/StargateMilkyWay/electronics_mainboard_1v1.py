@@ -14,6 +14,7 @@ import adafruit_mcp3xxx.mcp3002 as MCP # pylint: disable=import-error
 from adafruit_mcp3xxx.analog_in import AnalogIn # pylint: disable=import-error
 
 from hardware_simulation import DCMotorSim, StepperSim, LEDSim
+from pca9685_batch import PCA9685BatchWriter, BatchedDCMotor, BatchedStepper
 from stargate_config import StargateConfig
 
 # pylint: disable=too-many-public-methods
@@ -57,6 +58,9 @@ class ElectronicsMainBoard1V1:
 
         self._pca_1 = None
         self._pca_2 = None
+        self._pca_1_writer = None
+        self._pca_2_writer = None
+        self._motors = {}
         self.motor_channels = None
         self.led_channels = None
         self.glyph_stepper = None
@@ -99,6 +103,10 @@ class ElectronicsMainBoard1V1:
         self._pca_2 = PCA9685(self.i2c, address=self._pca_2_addr)
         self._pca_2.frequency = self._pwm_frequency
 
+        # Coalesce the channel writes of the motors and the stepper
+        self._pca_1_writer = PCA9685BatchWriter(self._pca_1)
+        self._pca_2_writer = PCA9685BatchWriter(self._pca_2)
+
     def init_aux_1_in(self):
         self.aux_1_in = Button(self.aux_1_pin)
 
@@ -223,60 +231,69 @@ class ElectronicsMainBoard1V1:
     def get_wormhole_pixel_count(self):
         return self.neopixel_led_count
 
-    def _motor(
-        self, controller, motor_name: int, channels: Tuple[int, int, int]
-    ) -> adafruit_motor.motor.DCMotor:
-
-        motor_name = "_motor" + str(motor_name)
+    def get_i2c_statistics(self):
+        return {
+            "pca_1": self._pca_1_writer.get_statistics(),
+            "pca_2": self._pca_2_writer.get_statistics()
+        }
 
-        controller.channels[channels[0]].duty_cycle = 0xFFFF
-        setattr(
-            self,
-            motor_name,
-            adafruit_motor.motor.DCMotor(
-                controller.channels[channels[1]], controller.channels[channels[2]]
-            ),
-        )
-        return getattr(self, motor_name)
+    def _motor(
+        self, writer, motor_number: int, channels: Tuple[int, int, int]
+    ) -> BatchedDCMotor:
+
+        # The motor objects are created once, and reused
+        if motor_number not in self._motors:
+            writer.channels[channels[0]].duty_cycle = 0xFFFF
+            self._motors[motor_number] = BatchedDCMotor(
+                adafruit_motor.motor.DCMotor(
+                    writer.channels[channels[1]], writer.channels[channels[2]]
+                ),
+                writer
+            )
+        return self._motors[motor_number]
 
     @property
-    def motor1(self) -> adafruit_motor.motor.DCMotor:
-        return self._motor(self._pca_2, 1, (9, 11, 10)) # Tuple is: [ PWM, IN_POS, IN_NEG ]
+    def motor1(self) -> BatchedDCMotor:
+        return self._motor(self._pca_2_writer, 1, (9, 11, 10)) # Tuple is: [ PWM, IN_POS, IN_NEG ]
 
     @property
-    def motor2(self) -> adafruit_motor.motor.DCMotor:
-        return self._motor(self._pca_2, 2, (6, 8, 7))
+    def motor2(self) -> BatchedDCMotor:
+        return self._motor(self._pca_2_writer, 2, (6, 8, 7))
 
     @property
-    def motor3(self) -> adafruit_motor.motor.DCMotor:
-        return self._motor(self._pca_2, 3, (3, 5, 4))
+    def motor3(self) -> BatchedDCMotor:
+        return self._motor(self._pca_2_writer, 3, (3, 5, 4))
 
     @property
-    def motor4(self) -> adafruit_motor.motor.DCMotor:
-        return self._motor(self._pca_2, 4, (0, 2, 1))
+    def motor4(self) -> BatchedDCMotor:
+        return self._motor(self._pca_2_writer, 4, (0, 2, 1))
 
     @property
-    def motor5(self) -> adafruit_motor.motor.DCMotor:
-        return self._motor(self._pca_1, 4, (12, 14, 13))
+    def motor5(self) -> BatchedDCMotor:
+        return self._motor(self._pca_1_writer, 5, (12, 14, 13))
 
     @property
-    def motor6(self) -> adafruit_motor.motor.DCMotor:
-        return self._motor(self._pca_1, 4, (5, 3, 4))
+    def motor6(self) -> BatchedDCMotor:
+        return self._motor(self._pca_1_writer, 6, (5, 3, 4))
 
     @property
-    def motor7(self) -> adafruit_motor.motor.DCMotor:
-        return self._motor(self._pca_1, 4, (0, 2, 1))
+    def motor7(self) -> BatchedDCMotor:
+        return self._motor(self._pca_1_writer, 7, (0, 2, 1))
 
     @property
-    def stepper(self) -> adafruit_motor.stepper.StepperMotor:
+    def stepper(self) -> BatchedStepper:
         if not self.glyph_stepper:
-            self._pca_1.channels[6].duty_cycle = 0xFFFF     # PWMA
-            self._pca_1.channels[11].duty_cycle = 0xFFFF    # PWMB
-            self.glyph_stepper = adafruit_motor.stepper.StepperMotor(
-                self._pca_1.channels[8],    # AIN1
-                self._pca_1.channels[7],    # AIN2
-                self._pca_1.channels[9],    # BIN1
-                self._pca_1.channels[10],   # BIN2
-                microsteps=self._stepper_microsteps,
+            channels = self._pca_1_writer.channels
+            channels[6].duty_cycle = 0xFFFF     # PWMA
+            channels[11].duty_cycle = 0xFFFF    # PWMB
+            self.glyph_stepper = BatchedStepper(
+                adafruit_motor.stepper.StepperMotor(
+                    channels[8],    # AIN1
+                    channels[7],    # AIN2
+                    channels[9],    # BIN1
+                    channels[10],   # BIN2
+                    microsteps=self._stepper_microsteps,
+                ),
+                self._pca_1_writer
             )
         return self.glyph_stepper
@@ -8,6 +8,7 @@ class ElectronicsNone:
     def __init__(self):
 
         self.name = "Impaired - No Motor, LED, and/or NeoPixel Hardware"
+        self.simulated = True # The gate can run on a VirtualClock
 
         self.neopixel_pin = None
         self.neopixel_led_count = 122 # must be non-zero
@@ -0,0 +1,167 @@
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+
+class LatencyHistogram:
+    """
+    The latencies of one kind of hardware call, in buckets.
+    """
+
+    # The upper bounds of the buckets, in microseconds. The last bucket is everything slower.
+    BUCKETS_US = [10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_US) + 1)
+        self.calls = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds):
+        self.counts[bisect_left(self.BUCKETS_US, seconds * 1000000)] += 1
+        self.calls += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self):
+        labels = [f"<={bound}us" for bound in self.BUCKETS_US] + [f">{self.BUCKETS_US[-1]}us"]
+        return {
+            "calls": self.calls,
+            "total_ms": round(self.total * 1000, 2),
+            "average_us": round(self.total / self.calls * 1000000, 1) if self.calls else 0,
+            "max_us": round(self.max * 1000000, 1),
+            "histogram": { label: count for label, count in zip(labels, self.counts) if count }
+        }
+
+
+class ProfiledProxy:
+    """
+    This class wraps a hardware object (a motor, the stepper, the neopixels...), and times some of its methods and
+    property writes. Everything else is passed through to the wrapped object.
+    """
+
+    def __init__(self, target, profiler, prefix, methods=(), properties=()):
+        object.__setattr__(self, '_profiled_target', target)
+        object.__setattr__(self, '_profiled_properties', { name: f"{prefix}.{name}" for name in properties })
+        object.__setattr__(self, '_profiled_profiler', profiler)
+        object.__setattr__(self, '_profiled_methods', {
+            name: profiler.wrap_function(getattr(target, name), f"{prefix}.{name}") for name in methods
+        })
+
+    def __getattr__(self, name):
+        # Only called for the attributes the proxy doesn't have
+        method = self._profiled_methods.get(name)
+        if method is not None:
+            return method
+        return getattr(self._profiled_target, name)
+
+    def __setattr__(self, name, value):
+        metric = self._profiled_properties.get(name)
+        if metric is None:
+            setattr(self._profiled_target, name, value)
+            return
+        start_time = perf_counter()
+        setattr(self._profiled_target, name, value)
+        self._profiled_profiler.record(metric, perf_counter() - start_time)
+
+    def __getitem__(self, index):
+        return self._profiled_target[index]
+
+    def __setitem__(self, index, value):
+        self._profiled_target[index] = value
+
+    def __len__(self):
+        return len(self._profiled_target)
+
+    def __iter__(self):
+        return iter(self._profiled_target)
+
+
+class ElectronicsProfiler:
+    """
+    This class wraps the Electronics (ElectronicsOriginal, ElectronicsMainBoard1V1 or ElectronicsNone), and records how
+    long the hardware calls take: I2C (stepper steps, motor throttle), GPIO (chevron LEDs), the neopixels, the ADC and
+    the DHD serial writes. Comparing the totals with the dialing timing tells how much of a slow dial is hardware, and
+    how much is Python.
+
+    It's only used when electronics_profiler_enable is on, so it costs nothing otherwise.
+    """
+
+    def __init__(self, electronics):
+        self.electronics = electronics
+        self.name = electronics.name
+        self.lock = Lock()
+        self.histograms = {}
+        self.proxies = {}
+
+    def __getattr__(self, name):
+        # Everything that isn't profiled is passed through to the electronics
+        return getattr(self.electronics, name)
+
+    def record(self, metric, seconds):
+        with self.lock:
+            histogram = self.histograms.get(metric)
+            if histogram is None:
+                histogram = self.histograms[metric] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def wrap_function(self, function, metric):
+        def profiled(*args, **kwargs):
+            start_time = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(metric, perf_counter() - start_time)
+        return profiled
+
+    def wrap(self, target, prefix, methods=(), properties=()):
+        """
+        This method returns the profiled proxy of a hardware object. The proxies are cached, so the same object always
+        gets the same proxy.
+        :return: the ProfiledProxy is returned, or None if target is None.
+        """
+        if target is None:
+            return None
+        key = (id(target), prefix)
+        if key not in self.proxies:
+            self.proxies[key] = ProfiledProxy(target, self, prefix, methods, properties)
+        return self.proxies[key]
+
+    def profile_method(self, target, name, metric):
+        """
+        This method times a method of an object outside the electronics, eg the serial writes of the DHD.
+        :return: Nothing is returned
+        """
+        setattr(target, name, self.wrap_function(getattr(target, name), metric))
+
+    def get_profile(self):
+        """
+        This method summarizes the recorded latencies.
+        :return: a dict of metric name: statistics, sorted by name
+        """
+        with self.lock:
+            return { metric: self.histograms[metric].to_dict() for metric in sorted(self.histograms) }
+
+    def reset_profile(self):
+        with self.lock:
+            self.histograms = {}
+
+    ### The profiled hardware ###
+
+    def get_chevron_motor(self, chevron_number):
+        return self.wrap(self.electronics.get_chevron_motor(chevron_number), "i2c.motor", properties=['throttle'])
+
+    def get_chevron_led(self, chevron_number):
+        return self.wrap(self.electronics.get_chevron_led(chevron_number), "gpio.led", methods=['on', 'off'])
+
+    def get_stepper(self):
+        return self.wrap(self.electronics.get_stepper(), "i2c.stepper", methods=['onestep', 'release'])
+
+    def get_wormhole_pixels(self):
+        return self.wrap(self.electronics.get_wormhole_pixels(), "neopixel", methods=['show', 'fill'])
+
+    def get_homing_sensor_voltage(self):
+        start_time = perf_counter()
+        try:
+            return self.electronics.get_homing_sensor_voltage()
+        finally:
+            self.record("spi.adc.homing_sensor", perf_counter() - start_time)
@@ -0,0 +1,77 @@
+from threading import Event
+from gate_clock import time, get_clock
+
+class FrameScheduler:
+    """
+    This class paces the wormhole animations at a fixed frame rate.
+    If a frame is shown late, the following frames are dropped to catch up, so an animation always takes the same time.
+    Waiting for the next frame can be cancelled from another thread with cancel().
+    """
+
+    def __init__(self, fps):
+        self.fps = fps
+        self.cancel_event = Event()
+        self.next_frame_time = None
+
+        # Statistics
+        self.frames = 0
+        self.dropped_frames = 0
+
+    def start(self):
+        """
+        This method starts the frame clock. Call it right before showing the first frame of an animation.
+        :return: Nothing is returned
+        """
+        self.next_frame_time = time()
+
+    def wait_next_frame(self, frame_time=None, hold=0):
+        """
+        This method waits until it's time to show the next frame.
+        :param frame_time: the time between frames in seconds. If left blank, 1/fps is used.
+        :param hold: an extra delay in seconds before the next frame.
+        :return: the number of frames to advance. 1 when on time, more than 1 if frames were dropped, 0 if cancelled.
+        """
+        if self.next_frame_time is None:
+            self.start()
+        if frame_time is None:
+            frame_time = 1 / self.fps
+
+        self.frames += 1
+        self.next_frame_time += frame_time + hold
+        delay = self.next_frame_time - time()
+        advance = 1
+
+        if delay > 0:
+            if get_clock().wait_event(self.cancel_event, delay):
+                return 0
+        elif -delay >= frame_time:
+            # We are more than a frame late. Drop frames to catch up, instead of slowing down the animation.
+            dropped = int(-delay / frame_time)
+            self.dropped_frames += dropped
+            self.next_frame_time += dropped * frame_time
+            advance += dropped
+
+        if self.cancel_event.is_set():
+            return 0
+        return advance
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def reset(self):
+        self.cancel_event.clear()
+        self.next_frame_time = None
+
+    def reset_statistics(self):
+        self.frames = 0
+        self.dropped_frames = 0
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def get_status(self):
+        return {
+            "fps": self.fps,
+            "frames": self.frames,
+            "dropped_frames": self.dropped_frames
+        }
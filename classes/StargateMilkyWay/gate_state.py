@@ -0,0 +1,107 @@
+from collections import namedtuple
+from threading import Lock, Condition
+
+# One immutable snapshot of the dialing/wormhole state. The address buffers are tuples.
+GateState = namedtuple('GateState', [
+    'version',                  # Incremented by each change
+    'address_buffer_outgoing',  # The dialed outgoing address
+    'address_buffer_incoming',  # The dialed incoming address
+    'locked_chevrons_outgoing', # The current number of locked outgoing chevrons
+    'locked_chevrons_incoming', # The current number of locked incoming chevrons
+    'centre_button_outgoing',   # The state of the centre button, outgoing
+    'centre_button_incoming',   # The state of the centre button, incoming
+    'wormhole_active',          # False, True, 'outgoing' or 'incoming'
+    'black_hole',               # Did we dial the black hole?
+    'fan_gate_online_status',   # Is the dialed fan_gate online? Assume it is until proven otherwise
+    'fan_gate_incoming_ip',     # The IP address of the remote gate that establishes a wormhole
+    'connected_planet_name',
+    'last_activity_time'        # The last user input time
+])
+
+class GateStateStore:
+    """
+    This class holds the state of the gate, shared by the main loop, the web server, the keyboard and the subspace threads.
+
+    The state is an immutable GateState snapshot. Reading it is a single reference read, without a lock, and the
+    snapshot stays consistent while it's used. Changes are made under a lock, and replace the snapshot with a new
+    version, so concurrent changes can't corrupt it.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.changed = Condition(self.lock)
+        self.state = self.get_idle_state(0)
+
+    @staticmethod
+    def get_idle_state(version):
+        return GateState(
+            version=version,
+            address_buffer_outgoing=(),
+            address_buffer_incoming=(),
+            locked_chevrons_outgoing=0,
+            locked_chevrons_incoming=0,
+            centre_button_outgoing=False,
+            centre_button_incoming=False,
+            wormhole_active=False,
+            black_hole=False,
+            fan_gate_online_status=True,
+            fan_gate_incoming_ip=None,
+            connected_planet_name=None,
+            last_activity_time=None
+        )
+
+    def get(self):
+        """
+        This method returns the current state.
+        :return: the GateState snapshot is returned
+        """
+        return self.state
+
+    def update(self, **changes):
+        """
+        This method changes some fields of the state, atomically.
+        :param changes: the new values, eg: wormhole_active=False
+        :return: the new GateState is returned
+        """
+        with self.lock:
+            self.set_state(self.state._replace(**changes))
+            return self.state
+
+    def transition(self, function):
+        """
+        This method changes the state based on its current value, atomically. eg: appending a symbol.
+        :param function: called with the current GateState, under the lock. It returns a dict of changes, or None to
+            leave the state unchanged.
+        :return: the new GateState is returned, or None if nothing changed.
+        """
+        with self.lock:
+            changes = function(self.state)
+            if not changes:
+                return None
+            self.set_state(self.state._replace(**changes))
+            return self.state
+
+    def reset(self):
+        """
+        This method puts the gate back in to an idle state.
+        :return: the new GateState is returned
+        """
+        with self.lock:
+            self.set_state(self.get_idle_state(self.state.version))
+            return self.state
+
+    def set_state(self, state):
+        # Must be called with the lock held
+        self.state = state._replace(version=self.state.version + 1)
+        self.changed.notify_all()
+
+    def wait_for_change(self, version, timeout=None):
+        """
+        This method waits until the state is newer than a version, eg for long polling.
+        :param version: the version the caller has already seen
+        :param timeout: the most seconds to wait, or None to wait forever.
+        :return: the current GateState is returned. Its version is unchanged if the timeout expired.
+        """
+        with self.lock:
+            self.changed.wait_for(lambda: self.state.version != version, timeout)
+            return self.state
@@ -1,12 +1,11 @@
-from time import sleep
+from gate_clock import sleep
 import adafruit_pixelbuf
 
 class StepperSim:
 
     def __init__(self):
 
-        self.onestep_time = 0.0038 # in seconds, how long does a step take to exec on real HW
-        #self.onestep_time = 0 # For testing in "turbo sim" mode
+        self.onestep_time = 0.0038 # in seconds, how long does a step take to exec on real HW. Faster with a VirtualClock
 
     def onestep(self, direction, style): # pylint: disable=unused-argument
         sleep(self.onestep_time)
@@ -0,0 +1,177 @@
+import struct
+from contextlib import contextmanager
+from threading import RLock
+
+class PCA9685BatchWriter:
+    """
+    This class coalesces the PWM register writes to a PCA9685.
+
+    Each channel has 4 registers (LEDn_ON_L/H, LEDn_OFF_L/H), and adafruit_pca9685 writes them in one I2C transaction
+    per channel. Inside batch(), the writes are staged instead, and flushed at the end: the channels that didn't change
+    are dropped, and consecutive channels are written as one block. This relies on the register auto-increment (the AI
+    bit of MODE1), which adafruit_pca9685 turns on when the frequency is set.
+    """
+
+    LED0_ON_L = 0x06
+    CHANNEL_COUNT = 16
+    MAX_GAP = 1 # Rewrite up to this many unchanged channels, to merge two blocks in to one transaction
+
+    def __init__(self, pca):
+        self.pca = pca
+        self.lock = RLock()
+        self.registers = [None] * self.CHANNEL_COUNT # The (on, off) values last written, None if unknown
+        self.staged = {}
+        self.batch_depth = 0
+        self.channels = [PCA9685BatchChannel(self, index) for index in range(self.CHANNEL_COUNT)]
+
+        # Statistics
+        self.transactions = 0
+        self.channel_writes = 0
+        self.skipped_writes = 0
+
+    @contextmanager
+    def batch(self):
+        """
+        This method stages the channel writes made in the with block, and writes them when it ends.
+        :return: a context manager
+        """
+        with self.lock:
+            self.batch_depth += 1
+            try:
+                yield self
+            finally:
+                self.batch_depth -= 1
+                if self.batch_depth == 0:
+                    staged, self.staged = self.staged, {}
+                    self.write_channels(staged)
+
+    def get_registers(self, index):
+        with self.lock:
+            if index in self.staged:
+                return self.staged[index]
+            if self.registers[index] is None:
+                self.registers[index] = tuple(self.pca.pwm_regs[index])
+            return self.registers[index]
+
+    def set_registers(self, index, registers):
+        with self.lock:
+            if self.batch_depth:
+                self.staged[index] = registers
+            else:
+                self.write_channels({index: registers})
+
+    def write_channels(self, channels):
+        """
+        This method writes the changed channels, one I2C transaction per block of consecutive channels.
+        :param channels: a dict of channel index: (on, off)
+        :return: Nothing is returned
+        """
+        changed = sorted(index for index, registers in channels.items() if self.registers[index] != registers)
+        self.skipped_writes += len(channels) - len(changed)
+        if not changed:
+            return
+
+        # Group the channels in to blocks, bridging small gaps of known channels
+        blocks = [[changed[0]]]
+        for index in changed[1:]:
+            gap = range(blocks[-1][-1] + 1, index)
+            if len(gap) <= self.MAX_GAP and all(self.registers[other] is not None for other in gap):
+                blocks[-1].extend(gap)
+                blocks[-1].append(index)
+            else:
+                blocks.append([index])
+
+        for block in blocks:
+            buffer = bytearray([self.LED0_ON_L + 4 * block[0]])
+            for index in block:
+                buffer += struct.pack('<HH', *channels.get(index, self.registers[index]))
+            with self.pca.i2c_device as i2c:
+                i2c.write(buffer)
+            for index in block:
+                self.registers[index] = channels.get(index, self.registers[index])
+            self.transactions += 1
+            self.channel_writes += len(block)
+
+    def get_statistics(self):
+        return {
+            "transactions": self.transactions,
+            "channel_writes": self.channel_writes,
+            "skipped_writes": self.skipped_writes
+        }
+
+
+class PCA9685BatchChannel:
+    """
+    A PCA9685 channel, with the same API as adafruit_pca9685.PWMChannel, that writes through a PCA9685BatchWriter.
+    """
+
+    def __init__(self, writer, index):
+        self.writer = writer
+        self.index = index
+
+    @property
+    def frequency(self):
+        return self.writer.pca.frequency
+
+    @frequency.setter
+    def frequency(self, _):
+        raise NotImplementedError("frequency cannot be set on individual channels")
+
+    @property
+    def duty_cycle(self):
+        on, off = self.writer.get_registers(self.index)
+        if on == 0x1000:
+            return 0xFFFF
+        if off == 0x1000:
+            return 0x0000
+        return off << 4
+
+    @duty_cycle.setter
+    def duty_cycle(self, value):
+        if not 0 <= value <= 0xFFFF:
+            raise ValueError(f"Out of range: value {value} not 0 <= value <= 65,535")
+
+        if value == 0xFFFF:
+            registers = (0x1000, 0)     # Fully on
+        elif value < 0x0010:
+            registers = (0, 0x1000)     # Fully off
+        else:
+            registers = (0, value >> 4) # The PCA9685 is 12 bits
+        self.writer.set_registers(self.index, registers)
+
+
+class BatchedDCMotor: # pylint: disable=too-few-public-methods
+    """
+    An adafruit_motor DCMotor on PCA9685BatchChannels. Setting the throttle writes both channels in one batch.
+    """
+
+    def __init__(self, motor, writer):
+        self.motor = motor
+        self.writer = writer
+
+    @property
+    def throttle(self):
+        return self.motor.throttle
+
+    @throttle.setter
+    def throttle(self, value):
+        with self.writer.batch():
+            self.motor.throttle = value
+
+
+class BatchedStepper:
+    """
+    An adafruit_motor StepperMotor on PCA9685BatchChannels. Each step writes the four coils in one batch.
+    """
+
+    def __init__(self, stepper, writer):
+        self.stepper = stepper
+        self.writer = writer
+
+    def onestep(self, **kwargs):
+        with self.writer.batch():
+            return self.stepper.onestep(**kwargs)
+
+    def release(self):
+        with self.writer.batch():
+            self.stepper.release()
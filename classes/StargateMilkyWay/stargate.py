@@ -1,7 +1,8 @@
+from enum import Enum
 from threading import Thread
-from time import time, sleep
 from random import randrange
 
+from gate_clock import time, sleep
 from symbol_manager import StargateSymbolManager
 from chevrons import ChevronManager
 from dialers import Dialer
@@ -13,11 +14,58 @@ from subspace_client import SubspaceClient
 from wormhole_manager import WormholeManager
 from subspace_server import SubspaceServer
 from dialing_log import DialingLog
+from dialing_pipeline import DialingPipeline
+from input_event_bus import InputEventBus
+from gate_state import GateStateStore
+from timer_wheel import TimerWheel
+
+class StargatePhase(Enum):
+    """
+    The phases of the main loop.
+    """
+    IDLE = 'idle'                   # Nothing dialed
+    DIALING = 'dialing'             # All the dialed symbols are locked, waiting for more symbols or the center button
+    LOCKING = 'locking'             # Some dialed symbols are not locked yet
+    ESTABLISHING = 'establishing'   # The address is complete, deciding if a wormhole can be established
+    WORMHOLE = 'wormhole'           # The wormhole is open
+    CLOSING = 'closing'             # The gate is shutting down, back to idle
+
+def state_property(name):
+    """
+    This helper creates a property for a field of the gate state, so it can be read and set like an attribute.
+    The address buffers are returned as new lists: change them through the state store, not by appending to them.
+    """
+    def getter(self):
+        value = getattr(self.state.get(), name)
+        return list(value) if isinstance(value, tuple) else value
+
+    def setter(self, value):
+        self.state.update(**{name: tuple(value) if isinstance(value, list) else value})
+
+    return property(getter, setter)
 
 class Stargate:
     """
     This is the class to create the stargate object itself.
     """
+
+    # The dialing/wormhole state is kept in self.state, a GateStateStore. These read and set it like attributes.
+    address_buffer_outgoing = state_property('address_buffer_outgoing')
+    address_buffer_incoming = state_property('address_buffer_incoming')
+    locked_chevrons_outgoing = state_property('locked_chevrons_outgoing')
+    locked_chevrons_incoming = state_property('locked_chevrons_incoming')
+    centre_button_outgoing = state_property('centre_button_outgoing')
+    centre_button_incoming = state_property('centre_button_incoming')
+    wormhole_active = state_property('wormhole_active')
+    black_hole = state_property('black_hole')
+    fan_gate_online_status = state_property('fan_gate_online_status')
+    fan_gate_incoming_ip = state_property('fan_gate_incoming_ip')
+    connected_planet_name = state_property('connected_planet_name')
+    last_activity_time = state_property('last_activity_time')
+
+    # The most time the main loop sleeps without an event, in seconds. Just in case something changed without one.
+    MAX_IDLE_WAIT = 60
+
     def __init__(self, app):
 
         self.app = app
@@ -39,19 +87,15 @@ class Stargate:
 
         # Initialize the state variables
         self.running = True
-        self.address_buffer_outgoing = [] #Storage buffer for dialed outgoing address
-        self.address_buffer_incoming = [] #Storage buffer for dialed incoming address
-        self.last_activity_time = None # A variable to store the last user input time
-        self.centre_button_outgoing = False #A variable for the state of the centre button, outgoing.
-        self.centre_button_incoming = False #A variable for the state of the centre button, incoming.
-        self.locked_chevrons_outgoing = 0 # The current number of locked outgoing chevrons
-        self.locked_chevrons_incoming = 0 # The current number of locked outgoing chevrons
-        self.wormhole_active = False # The state of the wormhole.
-        self.black_hole = False # Did we dial the black hole?
-        self.fan_gate_online_status = True # To keep track of the dialed fan_gate status. Assume it's online until proven otherwise
-        self.fan_gate_incoming_ip = None # To keep track of the IP address for the remote gate that establishes a wormhole
-        self.connected_planet_name = None
+        self.state = GateStateStore() # The address buffers, chevrons, centre buttons and wormhole state
         self.dhd_test = False
+        self.phase = StargatePhase.IDLE
+
+        # The inputs from the keyboard/DHD, web and subspace threads are handled by the main loop
+        self.input_events = InputEventBus()
+
+        # The timed hardware effects (chevrons...) run on a shared timer thread, so they can overlap
+        self.timer_wheel = TimerWheel(self.log)
 
         ### Set up the needed classes and make them ready to use ###
         self.symbol_manager = StargateSymbolManager(self.galaxy_path)
@@ -59,6 +103,7 @@ class Stargate:
         self.addr_manager = StargateAddressManager(self)
         self.chevrons = ChevronManager(self)
         self.ring = SymbolRing(self)
+        self.dialing_pipeline = DialingPipeline(self)
         self.dialer = Dialer(self) # A "Dialer" is either a Keyboard or DHDv2
         self.keyboard = KeyboardManager(self, app.is_daemon)
         self.wh_manager = WormholeManager(self)
@@ -87,118 +132,224 @@ class Stargate:
         :return:
         """
         # Reset/initialize the state variables and address buffers
-        self.address_buffer_outgoing = [] #Storage buffer for dialed outgoing address
-        self.address_buffer_incoming = [] #Storage buffer for dialed incoming address
-        self.last_activity_time = None # A variable to store the last user input time
-        self.centre_button_outgoing = False #A variable for the state of the centre button, outgoing.
-        self.centre_button_incoming = False #A variable for the state of the centre button, incoming.
-        self.locked_chevrons_outgoing = 0 # The current number of locked outgoing chevrons
-        self.locked_chevrons_incoming = 0 # The current number of locked outgoing chevrons
-        self.wormhole_active = False # The state of the wormhole.
-        self.black_hole = False # Did we dial the black hole?
-        self.fan_gate_online_status = True # To keep track of the dialed fan_gate status. Assume it's online until proven otherwise
-        self.fan_gate_incoming_ip = None # To keep track of the IP address for the remote gate that establishes a wormhole
-        self.connected_planet_name = None
+        self.state.reset()
 
     def update(self):
         """
-        This is the main method to keep the stargate running and make decisions based on the manipulated objects variables.
-        There are basically two main phases, the dialing phase and the wormhole phase.
+        This is the main method to keep the stargate running. It's a state machine, driven by the input events:
+        idle -> dialing -> locking -> establishing -> wormhole -> closing -> idle.
+        When there is nothing to do, it sleeps until the next input, the inactivity timeout or the next scheduled job.
+        While the wormhole is open, it's animated by the render thread, and this loop keeps handling the inputs.
         :return: Nothing is returned.
         """
         while self.running: # If we have not aborted
 
-            ### The Dialing phase###
-            if not self.wormhole_active and self.running: # If we are in the dialing phase
-
-                ## Outgoing dialing ##
-                self.outgoing_dialing()
+            ### Apply the inputs from the other threads ###
+            self.handle_input_events()
+            self.phase = self.get_phase()
+            busy = False
 
-                ## Incoming dialing ##
-                self.incoming_dialing()
+            ### Lock the next dialed symbol ###
+            if self.phase == StargatePhase.LOCKING:
+                busy = self.outgoing_dialing()
+                busy = self.incoming_dialing() or busy
 
-                ## Establishing wormhole ##
+            ### Establishing wormhole ###
+            elif self.phase == StargatePhase.ESTABLISHING:
                 self.establishing_wormhole()
-
-                ### Check for inactivity ###
-                # If there are something in the buffers and no activity for 1 minute while dialing.
-                # TODO: Use Schedule
-                if self.inactivity( self.inactivity_timeout ):
-                    self.log.log('Inactivity detected, aborting.')
-                    self.shutdown()
+                busy = True
 
             ### The wormhole phase ###
-            elif self.wormhole_active: # If wormhole
-                self.ring.release() # Release the stepper motor.
-                self.wh_manager.establish_wormhole() # This will establish the wormhole and keep it running until self.wormhole_active is False
-                #When the wormhole is no longer running
-                self.shutdown(cancel_sound=False)
+            elif self.phase == StargatePhase.WORMHOLE:
+                if not self.wh_manager.is_open():
+                    self.ring.release() # Release the stepper motor.
+                    self.wh_manager.open_wormhole()
+                    busy = True
+                # Close the wormhole when self.wormhole_active is False, or when it runs out of time
+                elif not self.wormhole_active or not self.wh_manager.poll():
+                    self.close_wormhole()
+                    busy = True
+
+            ### Check for inactivity ###
+            # If there are something in the buffers and no activity for a while while dialing.
+            if self.phase in (StargatePhase.DIALING, StargatePhase.LOCKING) and self.inactivity( self.inactivity_timeout ):
+                self.log.log('Inactivity detected, aborting.')
+                self.shutdown()
 
             self.schedule.run_pending() # Run any scheduled items
 
-            sleep(0.1) # Give the CPU a break (and yield to other threads)
+            # Sleep until there is something to do
+            if not busy and self.running:
+                self.input_events.wait(self.get_wait_timeout())
 
         # When the stargate is no longer running.
-        self.shutdown(cancel_sound=False)
+        if self.wh_manager.is_open():
+            self.close_wormhole()
+        else:
+            self.shutdown(cancel_sound=False)
+
+    def get_phase(self):
+        """
+        This method works out the phase of the gate from the state variables.
+        :return: the StargatePhase is returned
+        """
+        state = self.state.get()
+        if state.wormhole_active or self.wh_manager.is_open():
+            return StargatePhase.WORMHOLE
+
+        # Symbols to lock. Incoming symbols are only locked when we are not dialing out.
+        if len(state.address_buffer_outgoing) > state.locked_chevrons_outgoing or \
+            len(state.address_buffer_outgoing) == 0 and len(state.address_buffer_incoming) > state.locked_chevrons_incoming:
+            return StargatePhase.LOCKING
+
+        # The center button was pressed, and all the symbols are locked
+        if state.centre_button_outgoing and 0 < len(state.address_buffer_outgoing) == state.locked_chevrons_outgoing or \
+            state.centre_button_incoming and 0 < len(state.address_buffer_incoming) == state.locked_chevrons_incoming:
+            return StargatePhase.ESTABLISHING
+
+        if len(state.address_buffer_outgoing) > 0 or len(state.address_buffer_incoming) > 0:
+            return StargatePhase.DIALING
+        return StargatePhase.IDLE
+
+    def get_wait_timeout(self):
+        """
+        This method works out how long the main loop can sleep, if no input arrives.
+        :return: the number of seconds is returned
+        """
+        timeouts = [self.MAX_IDLE_WAIT]
+
+        # The next scheduled job
+        idle_seconds = self.schedule.idle_seconds()
+        if idle_seconds is not None:
+            timeouts.append(idle_seconds)
+
+        # The inactivity timeout, while dialing
+        if self.phase in (StargatePhase.DIALING, StargatePhase.LOCKING) and self.last_activity_time:
+            timeouts.append(self.last_activity_time + self.inactivity_timeout - time())
+
+        # The wormhole can be closed from another thread, without an input event
+        if self.wh_manager.is_open():
+            timeouts.append(self.wh_manager.POLL_INTERVAL)
+
+        return max(0, min(timeouts))
+
+
+    def handle_input_events(self):
+        """
+        This method applies the queued input events to the gate state. It's run by the main loop, so the state is
+        only changed from one thread.
+        :return: Nothing is returned
+        """
+        for event in self.input_events.get_all():
+            self.handle_input_event(event)
+            self.input_events.record_reaction(event)
+
+            if event.type != InputEventBus.WAKE:
+                self.last_activity_time = time() # Any input while dialing delays the inactivity timeout
 
+    def handle_input_event(self, event):
+        """
+        This method applies one input event to the gate state.
+        :param event: the InputEvent
+        :return: Nothing is returned
+        """
+        if event.type == InputEventBus.SYMBOL:
+            def append_symbol(state):
+                # If we have not yet activated the centre_button
+                if state.wormhole_active or event.value in state.address_buffer_outgoing or \
+                    state.centre_button_outgoing or state.centre_button_incoming:
+                    return None
+                # Append the symbol to the outgoing address buffer
+                return { 'address_buffer_outgoing': state.address_buffer_outgoing + (event.value,) }
+
+            state = self.state.transition(append_symbol)
+            if state:
+                self.dialer.hardware.set_symbol_on(event.value) # Light this symbol on the DHD
+                self.log.log(f'address_buffer_outgoing: {list(state.address_buffer_outgoing)}') # Log the address_buffer
+
+        elif event.type == InputEventBus.CENTER_BUTTON:
+            # If we are dialing
+            if self.state.transition(lambda state: { 'centre_button_outgoing': True } \
+                if len(state.address_buffer_outgoing) > 0 and not state.wormhole_active else None):
+                self.dialer.hardware.set_center_on() # Activate the centre_button_outgoing light
+
+        elif event.type == InputEventBus.ABORT_DIALING:
+            state = self.state.get()
+            if not state.wormhole_active and len(state.address_buffer_outgoing) > 0:
+                self.dialing_log.dialing_fail(list(state.address_buffer_outgoing))
+                self.shutdown(cancel_sound=False, wormhole_fail_sound=False)
+
+        elif event.type == InputEventBus.SHUTDOWN:
+            self.shutdown(cancel_sound=False, wormhole_fail_sound=False)
+
+        elif event.type == InputEventBus.INCOMING_SYMBOLS:
+            def append_incoming_symbols(state):
+                new_symbols = tuple(symbol for symbol in dict.fromkeys(event.value) if not symbol in state.address_buffer_incoming)
+                if not new_symbols:
+                    return None
+                return { 'address_buffer_incoming': state.address_buffer_incoming + new_symbols }
+
+            self.state.transition(append_incoming_symbols)
+
+        elif event.type == InputEventBus.INCOMING_CENTER_BUTTON:
+            # If there are not already a saved IP, or if we dialed an none fan_gate, save the IP address when establishing a wormhole.
+            self.state.transition(lambda state: {
+                'centre_button_incoming': True,
+                'fan_gate_incoming_ip': state.fan_gate_incoming_ip or event.value
+            })
 
     def outgoing_dialing(self):
         """
         This method handles the outgoing dialing of the stargate. It's kept in it's own method so not to clutter up the update method too much.
-        :return: Nothing is returned
+        The ring, chevron and subspace stages are run by the DialingPipeline.
+        :return: True if a symbol was dialed, False if not.
         """
         if len(self.address_buffer_outgoing) > self.locked_chevrons_outgoing:
-            self.ring.move_symbol_to_chevron(self.address_buffer_outgoing[self.locked_chevrons_outgoing], self.locked_chevrons_outgoing + 1)  # Dial the symbol
-            self.locked_chevrons_outgoing += 1  # Increment the locked chevrons variable.
+            self.dialing_pipeline.lock_next_symbol()
 
             # If the gate shutdown requested, play the stop-dialing sound, and stop doing things.
             if not self.running:
                 self.shutdown(cancel_sound=False, wormhole_fail_sound=True)
                 sleep(0.5) # Time to allow the wormhole_fail_sound to finish
-                return
+            return True
+        return False
 
-            try:
-                self.chevrons.get(self.locked_chevrons_outgoing).cycle_outgoing()  # Do the chevron locking thing.
-            except KeyError:  # If we dialed more chevrons than the stargate can handle.
-                pass  # Just pass without activating a chevron.
+    def send_locked_symbols_to_fan_gate(self):
+        """
+        This method sends the locked symbols to the remote gate, if we are dialing a fan_gate.
+        :return: Nothing is returned
+        """
+        # TODO: Some of this belongs in Subspace. For example, deciding whether to send a message based
+        #         on gate status should be handled by Subspace. outgoing_dialing() doesn't need to worry about that.
 
-            try:
-                self.log.log(f'Chevron {self.locked_chevrons_outgoing} locked with symbol: {self.address_buffer_outgoing[self.locked_chevrons_outgoing - 1]}')
-            except IndexError:
-                pass
-            self.last_activity_time = time()  # update the last_activity_time
-
-            # TODO: Some of this belongs in Subspace. For example, deciding whether to send a message based
-            #         on gate status should be handled by Subspace. outgoing_dialing() doesn't need to worry about that.
-
-            ## If we are dialing a fan_gate, send the symbols to the remote gate.
-            if self.addr_manager.is_fan_made_stargate(self.address_buffer_outgoing):
-                # If the gate is presumed to be online, send it.
-                if self.fan_gate_online_status:
-                    # send the locked symbols to the remote gate.
-
-                    this_gate_ip = self.addr_manager.get_ip_from_stargate_address(self.address_buffer_outgoing )
-                    this_message = str( self.address_buffer_outgoing[0:self.locked_chevrons_outgoing] )
-                    has_connection = self.subspace_client.send_to_remote_stargate( this_gate_ip, this_message)[0] # Attempt to send
-
-                    # Check for success
-                    if has_connection:
-                        self.log.log(f'Subspace Sent: {self.address_buffer_outgoing[0:self.locked_chevrons_outgoing]}')
-
-                        # Check if the recipient is busy. If so, stop sending subspace messages to it.
-                        is_busy = self.subspace_client.get_status_of_remote_gate(this_gate_ip)
-                        if is_busy:
-                            self.log.log("The dialed Stargate is busy, can't establish a wormhole.")
-                        self.fan_gate_online_status = not is_busy
-
-                    else:
-                        self.log.log('This Gate is offline. Skipping Subspace sends for remainder of this dialing attempt.')
-                        self.fan_gate_online_status = False # Gate is offline, don't keep sending messages during this dialing attempt
+        ## If we are dialing a fan_gate, send the symbols to the remote gate.
+        if self.addr_manager.is_fan_made_stargate(self.address_buffer_outgoing):
+            # If the gate is presumed to be online, send it.
+            if self.fan_gate_online_status:
+                # send the locked symbols to the remote gate.
+
+                this_gate_ip = self.addr_manager.get_ip_from_stargate_address(self.address_buffer_outgoing )
+                this_message = str( self.address_buffer_outgoing[0:self.locked_chevrons_outgoing] )
+                has_connection = self.subspace_client.send_to_remote_stargate( this_gate_ip, this_message)[0] # Attempt to send
+
+                # Check for success
+                if has_connection:
+                    self.log.log(f'Subspace Sent: {self.address_buffer_outgoing[0:self.locked_chevrons_outgoing]}')
+
+                    # Check if the recipient is busy. If so, stop sending subspace messages to it.
+                    is_busy = self.subspace_client.get_status_of_remote_gate(this_gate_ip)
+                    if is_busy:
+                        self.log.log("The dialed Stargate is busy, can't establish a wormhole.")
+                    self.fan_gate_online_status = not is_busy
+
+                else:
+                    self.log.log('This Gate is offline. Skipping Subspace sends for remainder of this dialing attempt.')
+                    self.fan_gate_online_status = False # Gate is offline, don't keep sending messages during this dialing attempt
 
     def incoming_dialing(self):
         """
         This method handles the incoming dialing of the stargate. It's kept in it's own method so not to clutter up the update method too much.
-        :return: Nothing is returned
+        :return: True if a symbol was locked, False if not.
         """
 
         # If there are dialed incoming symbols that are not yet locked and we are currently not dialing out.
@@ -235,8 +386,10 @@ class Stargate:
                 self.log.log(f'Incoming: Chevron {self.locked_chevrons_incoming} locked with symbol {self.address_buffer_incoming[self.locked_chevrons_incoming - 1]}')
 
                 sleep(delay)  # if there's a delay, use it.
-            else:
-                self.log.log("Address is not a match for this gate")
+                return True
+
+            self.log.log("Address is not a match for this gate")
+        return False
 
     # TODO: Some of this belongs in Subspace.
     def try_sending_centre_button(self):
@@ -324,6 +477,19 @@ class Stargate:
                 self.shutdown(cancel_sound=False, wormhole_fail_sound=True)
 
 
+    def close_wormhole(self):
+        """
+        This method closes the open wormhole, and puts the gate back in to an idle state.
+        :return: Nothing is returned
+        """
+        self.wh_manager.close()
+
+        # The DHD and web presses made while the wormhole was closing are not a new dial
+        dropped = self.input_events.discard(InputEventBus.SYMBOL, InputEventBus.CENTER_BUTTON)
+        if dropped:
+            self.log.log(f'Ignored {dropped} DHD inputs made while the wormhole was closing')
+        self.shutdown(cancel_sound=False)
+
     def shutdown(self, cancel_sound=True, wormhole_fail_sound=False):
         """
         This method shuts down and resets the Stargate.
@@ -331,6 +497,7 @@ class Stargate:
         """
 
         self.log.log('Shutting down the gate...')
+        self.phase = StargatePhase.CLOSING
 
         # Play the cancel sound
         if cancel_sound:
@@ -351,9 +518,13 @@ class Stargate:
 
         # Put the gate back in to an idle state
         self.initialize_gate_state_vars()
+        self.phase = StargatePhase.IDLE
 
         self.dialing_log.shutdown()
 
+        # Let the main loop know, if the gate was shut down from another thread
+        self.input_events.publish(InputEventBus.WAKE, source="shutdown")
+
     def inactivity(self, seconds):
         """
         This functions checks if there has been more than the variable seconds of inactivity:
@@ -1,8 +1,12 @@
-from time import sleep
+from collections import namedtuple
+from gate_clock import sleep
 
 from stargate_config import StargateConfig
 from symbol_ring_homing_manager import SymbolRingHomingManager
 
+# A move of the symbol ring, from start_position to end_position
+RingMove = namedtuple('RingMove', ['start_position', 'steps', 'direction', 'end_position'])
+
 class SymbolRing:
     """
     The dialing sequence.
@@ -122,12 +126,13 @@ class SymbolRing:
             return max_steps - position
         return 0
 
-    def move(self, steps, direction):
+    def move(self, steps, direction, on_decelerate=None):
         """
         This method moves the stepper motor the desired number of steps in the desired direction and updates the
         saved position with the new value. This method does NOT release the stepper. Do this with the release method.
         :param steps: the number of steps to move as int.
         :param direction: the direction to move. Must be either self.forward_direction or self.backward_direction
+        :param on_decelerate: an optional function, called once when the ring starts decelerating.
         :return: Nothing is returned
         """
 
@@ -169,6 +174,8 @@ class SymbolRing:
                     sleep(self.current_speed)
                 ## deceleration
                 elif i > (steps - self.cfg.get("stepper_acceleration_steps")):
+                    if on_decelerate and self.drive_status != "Decelerating":
+                        on_decelerate()
                     self.current_speed += (self.cfg.get("stepper_speed_slow") - self.cfg.get("stepper_speed_normal")) / self.cfg.get("stepper_acceleration_steps")
                     self.drive_status = "Decelerating"
                     sleep(self.current_speed)
@@ -197,14 +204,18 @@ class SymbolRing:
 
         self.audio.sound_stop('rolling_ring')  # stop the audio
 
-    def calculate_steps(self, chevron_number, symbol_number):
+    def calculate_steps(self, chevron_number, symbol_number, position=None):
         """
         Helper function to determine the needed number of steps to move symbol_number, to chevron
+        :param position: the ring position to move from. Defaults to the current position.
         :return: The number of steps to move is returned as an int.
         """
+        if position is None:
+            position = self.get_position()
+
         # How many steps are needed:
         try:
-            steps = self.chevron_step_positions[chevron_number] - ((self.get_position() + self.symbol_step_positions[symbol_number]) % self.cfg.get("stepper_one_revolution_steps"))
+            steps = self.chevron_step_positions[chevron_number] - ((position + self.symbol_step_positions[symbol_number]) % self.cfg.get("stepper_one_revolution_steps"))
         except KeyError: # If we dial more chevrons than the stargate can handle. Don't return any steps.
             return None
 
@@ -215,39 +226,53 @@ class SymbolRing:
             return new_steps
         return steps
 
-    def move_symbol_to_chevron(self, symbol_number, chevron_number ):
-
+    def plan_move_symbol_to_chevron(self, symbol_number, chevron_number, position=None):
         """
-        This function moves the symbol_number to the desired chevron. It also updates the ring position file.
+        This method works out the move that brings symbol_number to the chevron, without moving the ring.
         :param symbol_number: the number of the symbol
-        :param chevron: the number of the chevron
-        :return: nothing is returned
+        :param chevron_number: the number of the chevron
+        :param position: the ring position to move from, eg where the current move will end. Defaults to the current position.
+        :return: the RingMove is returned. Its steps are 0 if there is nothing to move.
         """
-        calc_steps = self.calculate_steps(chevron_number, symbol_number) # calculate the steps
+        if position is None:
+            position = self.get_position()
+        calc_steps = self.calculate_steps(chevron_number, symbol_number, position) # calculate the steps
+        if not calc_steps: # If None or 0
+            return RingMove(position, 0, None, position)
 
         # Choose which ring direction mode to use
         if self.cfg.get("dialing_ring_direction_mode") is False:
             ## Option one. This will move the symbol the shortest direction, cc or ccw.
-            if calc_steps: # If not None
-                ## Determine the direction
-                if calc_steps >= 0:  # If steps is positive move forward
-                    direction = self.forward_direction
-                else:  # if steps is negative move backward
-                    calc_steps = abs(calc_steps)
-                    direction = self.backward_direction
-
-                self.move(calc_steps, direction) # move the ring the calc_steps steps.
+            if calc_steps >= 0:  # If steps is positive move forward
+                steps, direction = calc_steps, self.forward_direction
+            else:  # if steps is negative move backward
+                steps, direction = abs(calc_steps), self.backward_direction
         else:
             ## Option two. This will move the symbol the longest direction, cc or ccw.
-            if calc_steps: # If not None
-                if calc_steps >= 0:
-                    calc_steps = (self.cfg.get("stepper_one_revolution_steps") - calc_steps)
-                    direction = self.backward_direction
-                    self.move(calc_steps, direction)  # move the ring, but the long way in the opposite direction.
-                else:
-                    calc_steps = self.cfg.get("stepper_one_revolution_steps") - abs(calc_steps)
-                    direction = self.forward_direction
-                    self.move(calc_steps, direction)  # move the ring, but the long way in the opposite direction.
+            if calc_steps >= 0:
+                steps, direction = self.cfg.get("stepper_one_revolution_steps") - calc_steps, self.backward_direction
+            else:
+                steps, direction = self.cfg.get("stepper_one_revolution_steps") - abs(calc_steps), self.forward_direction
+
+        offset = steps if direction == self.forward_direction else steps * -1
+        return RingMove(position, steps, direction, (position + offset) % self.cfg.get("stepper_one_revolution_steps"))
+
+    def move_symbol_to_chevron(self, symbol_number, chevron_number, planned_move=None, on_decelerate=None):
+
+        """
+        This function moves the symbol_number to the desired chevron. It also updates the ring position file.
+        :param symbol_number: the number of the symbol
+        :param chevron_number: the number of the chevron
+        :param planned_move: the RingMove from plan_move_symbol_to_chevron(), if it was planned ahead. It's only used
+            if the ring is where the plan expects it to be.
+        :param on_decelerate: an optional function, called once when the ring starts decelerating.
+        :return: nothing is returned
+        """
+        if planned_move is None or planned_move.start_position != self.get_position():
+            planned_move = self.plan_move_symbol_to_chevron(symbol_number, chevron_number)
+
+        if planned_move.steps: # If there is something to move
+            self.move(planned_move.steps, planned_move.direction, on_decelerate) # move the ring the calculated steps.
 
     def get_position(self):
         return self.position_store.get('ring_position')
@@ -1,9 +1,16 @@
-from time import sleep
 from random import choice, randint
 from wormhole_pattern_manager import WormholePatternManager
+from wormhole_fade_engine import WormholeFadeEngine
+from wormhole_frame_writer import WormholeFrameWriter
+from wormhole_frame_cache import WormholeFrameCache
+from frame_scheduler import FrameScheduler
+from wormhole_timeline import WormholeTimelineCompiler, WormholeTimelineLibrary
 
 class WormholeAnimationManager:
 
+    # The kawoosh is a quick flash, it runs at a higher frame rate than the other animations.
+    KAWOOSH_FPS = 100
+
     def __init__(self, stargate):
         self.stargate = stargate
 
@@ -13,36 +20,97 @@ class WormholeAnimationManager:
         self.tot_leds = None
         self.pixels = None
         self.pattern_manager = None
+        self.fade_engine = None
+        self.frame_writer = None
+        self.frame_cache = None
+        self.timeline_library = None
+        self.current_frame = None # The frame currently shown on the led strip. 3 bytes (r, g, b) per led.
+
+        # Retrieve the configurations
+        self.fps = self.stargate.cfg.get("wormhole_animation_fps")
+        self.fade_duration = self.stargate.cfg.get("wormhole_fade_duration")
+        self.fade_gamma_correct = self.stargate.cfg.get("wormhole_fade_gamma_correct")
+        self.frame_cache_size = self.stargate.cfg.get("wormhole_frame_cache_kb") * 1024
+        self.timeline_percent = self.stargate.cfg.get("wormhole_timeline_percent")
+
+        # Paces all the animations, and allows the render thread to cancel them within one frame.
+        self.scheduler = FrameScheduler(self.fps)
 
     def after_init(self, wh_manager):
         self.wh_manager = wh_manager
         self.tot_leds = self.wh_manager.tot_leds
         self.pixels = self.wh_manager.pixels
         self.pattern_manager = WormholePatternManager(self.tot_leds)
+        self.fade_engine = WormholeFadeEngine(self.tot_leds, self.fps, self.fade_gamma_correct)
+        self.current_frame = bytearray(self.tot_leds * 3)
+        self.frame_writer = WormholeFrameWriter(self.pixels, self.tot_leds)
         self.clear_wormhole() # Turn off all the LEDs
 
+        # Pre-render the kawoosh, the sweeps and rotations are rendered when they are first used.
+        self.frame_cache = WormholeFrameCache(self.frame_writer, self.tot_leds, self.frame_cache_size)
+        patterns = self.pattern_manager.get_patterns() + self.pattern_manager.get_patterns(black_hole=True)
+        self.frame_cache.set_patterns([self.pattern_manager.pattern_to_frame(pattern) for pattern in patterns + [self.pattern_manager.pattern_off()]])
+        self.frame_cache.get_kawoosh()
+
+        # Load and compile the wormhole timelines
+        compiler = WormholeTimelineCompiler(self.pattern_manager, self.frame_cache, self.fps, self.fade_duration, self.fade_gamma_correct)
+        self.timeline_library = WormholeTimelineLibrary(self.stargate.base_path, self.stargate.galaxy_path, self.stargate.log, compiler, self.frame_cache)
+        self.timeline_library.load()
+
     def animate_kawoosh(self):
-        for i in range(20):
-            self.pixels.fill(((i // 2) * 2, i * 2, i * 2))
-            self.pixels.show()
-        sleep(0.5)
-        for i in range(20, 128):
-            self.pixels.fill(((i // 2) * 2, i * 2, i * 2))
-            self.pixels.show()
-        for i in range(255, 50, -2):
-            self.pixels.fill((i // 2, i, i))
-            self.pixels.show()
-        sleep(0.3)
+        self.play_sequence(self.frame_cache.get_kawoosh(), self.KAWOOSH_FPS, check_active=False)
+
+    def is_cancelled(self, check_active=True):
+        """
+        This method checks if the running animation should stop.
+        :param check_active: True to also stop if the wormhole is no longer active.
+        :return: True if the animation is cancelled, False if not.
+        """
+        return self.scheduler.is_cancelled() or (check_active and not self.stargate.wormhole_active)
+
+    def play_sequence(self, sequence, fps=None, check_active=True):
+        """
+        This method streams a pre-rendered FrameSequence to the led strip at a fixed frame rate.
+        If we fall behind, frames are dropped, but the last frame is always shown.
+        :param sequence: the FrameSequence to play
+        :param fps: the frame rate. If left blank, the configured wormhole_animation_fps is used.
+        :param check_active: True to stop playing if the wormhole is cancelled.
+        :return: True if the whole sequence was played, False if it was cancelled.
+        """
+        frame_time = 1 / (fps or self.fps)
+        last_index = len(sequence.frames) - 1
+        index = 0
+
+        self.scheduler.start()
+        while True:
+            if self.is_cancelled(check_active):
+                return False
+            self.frame_writer.show(sequence.frames[index], sequence.rgb_frames[index])
+            self.current_frame[:] = sequence.rgb_frames[index]
+
+            advance = self.scheduler.wait_next_frame(frame_time, sequence.holds.get(index, 0))
+            if not advance:
+                return False
+            if index == last_index:
+                return True
+            index = min(index + advance, last_index)
+
+    def show_frame(self, frame):
+        """
+        This method sets a frame on the led strip, and displays it.
+        :param frame: the frame as a bytearray with 3 bytes (r, g, b) for each led.
+        :return: Nothing is returned
+        """
+        self.current_frame[:] = frame
+        self.frame_writer.show_frame(frame)
 
     def set_wormhole_pattern(self, pattern):
         """
         This method sets the pattern on the led strip, and displays it. No fading!
-        pixels: The pixel object where to set the pattern. eg self.pixels
-        :return: The pattern is returned as a string. (Am i sure it's not a list? Is this a typo?)
+        :param pattern: the pattern as a list of rgb tuples
+        :return: The pattern is returned as a list.
         """
-        for index, led_state in enumerate(pattern):
-            self.pixels[index] = led_state
-        self.pixels.show()
+        self.show_frame(self.pattern_manager.pattern_to_frame(pattern))
         return pattern
 
     def clear_wormhole(self):
@@ -63,86 +131,59 @@ class WormholeAnimationManager:
         :return: Noting is returned
         """
         ### Determine what pattern to spin ###
-        ## convert NeoPixel object to list ###
         if pattern is None:
-            pix = self.pixels
-            current_pattern = []
-            for led in pix:
-                current_pattern.append(led)
+            frame = self.current_frame
         else:
-            current_pattern = pattern
+            frame = self.pattern_manager.pattern_to_frame(pattern)
+
+        if direction != 'cw':
+            direction = 'ccw'
 
-        ### direction ###
-        rot_direction = -1
-        if direction == 'cw':
-            rot_direction = 1
+        ### The speed is the delay between each step, in 1/100 seconds. It can't be faster than the frame rate.
+        fps = self.fps
+        if speed > 0:
+            fps = min(fps, 100 / speed)
 
         ### Rotate the pattern ###
+        sequence = self.frame_cache.get_rotation(frame, direction)
         for revolution in range(revolutions): # pylint: disable=unused-variable
-            for rotate in range(len(current_pattern)): # pylint: disable=unused-variable
-                if not self.stargate.wormhole_active:  # if the wormhole is cancelled
-                    return  # this exits the whole for loop, even if nested.
-                current_pattern = [current_pattern[(i + rot_direction) % len(current_pattern)]
-                                   for i, x in enumerate(current_pattern)]
-                self.set_wormhole_pattern(current_pattern)
-                sleep(speed / 100)
-
-    def fade_transition(self, new_pattern):
-        """
-        This functions tries to fade the existing pattern over to the new_pattern. The new patterns are lists of tuples for each led.
-        :new_pattern: This is the new pattern to match, as a list
-        """
-        pix = self.pixels  # these are the current pixels from the strip as neopixel object.
-
-        def create_tween_pattern(current_pattern, new_pattern):
-            """
-            This function takes two pattern lists, and creates a tween pattern list one step faded towards the new list.
-            :param current: the current_list as is on the led strip
-            :param new: the new list to fade towards
-            :return: a new tween list is returned.
-            """
-            tween_pattern = []
-
-            # For the length of the new pattern list
-            for index, new_led in enumerate(new_pattern):
-
-                # Get the current LED's color tuple, to gradually match.
-                current_led = current_pattern[index]
-                red = current_led[0]
-                green = current_led[1]
-                blue = current_led[2]
-
-                ## increment/decrement the red
-                if current_led[0] > new_led[0]:
-                    red = current_led[0] - 1
-                elif current_led[0] < new_led[0]:
-                    red = current_led[0] + 1
-                ## increment/decrement the green
-                if current_led[1] > new_led[1]:
-                    green = current_led[1] - 1
-                elif current_led[1] < new_led[1]:
-                    green = current_led[1] + 1
-                ## increment/decrement the blue
-                if current_led[2] > new_led[2]:
-                    blue = current_led[2] - 1
-                elif current_led[2] < new_led[2]:
-                    blue = current_led[2] + 1
-                # print ((r,g,b))
-                tween_pattern.append((red, green, blue))
-            return tween_pattern
-
-        ## convert NeoPixel object to list ###
-        current_pattern = []
-        for led in pix:
-            current_pattern.append(led)
-
-        ## These are the two lists we are working with.
-        # print(current_pattern)
-        # print(new_pattern)
-        while current_pattern != new_pattern and self.stargate.wormhole_active:
-            tween_pattern = create_tween_pattern(current_pattern, new_pattern)
-            current_pattern = tween_pattern
-            self.set_wormhole_pattern(tween_pattern)
+            if not self.play_sequence(sequence, fps):
+                return  # the wormhole is cancelled
+
+    def fade_transition(self, new_pattern, duration=None):
+        """
+        This functions fades the existing pattern over to the new_pattern. The new patterns are lists of tuples for each led.
+        :param new_pattern: This is the new pattern to match, as a list
+        :param duration: The duration of the fade in seconds. If left blank, the configured wormhole_fade_duration is used.
+        :return: Nothing is returned
+        """
+        self.fade_to_frame(self.pattern_manager.pattern_to_frame(new_pattern), duration)
+
+    def fade_to_frame(self, new_frame, duration=None):
+        """
+        This functions fades the current frame over to new_frame.
+        All the leds are faded at once, over a fixed number of frames given by the duration and the animation frame rate.
+        :param new_frame: the frame as a bytearray with 3 bytes (r, g, b) for each led.
+        :param duration: The duration of the fade in seconds. If left blank, the configured wormhole_fade_duration is used.
+        :return: Nothing is returned
+        """
+        if duration is None:
+            duration = self.fade_duration
+
+        frame_count = self.fade_engine.prepare(self.current_frame, new_frame, duration)
+        step = 1
+
+        self.scheduler.start()
+        while True:
+            if self.is_cancelled():  # if the wormhole is cancelled
+                return
+            self.show_frame(self.fade_engine.render(step))
+
+            # Keep a steady frame rate, so the fade takes the same time on any hardware.
+            advance = self.scheduler.wait_next_frame()
+            if not advance or step == frame_count:
+                return
+            step = min(step + advance, frame_count)
 
     def sweep_transition(self, new_pattern):
         """
@@ -150,25 +191,30 @@ class WormholeAnimationManager:
         :param new_pattern:
         :return: Noting is returned
         """
-        pix = self.pixels
-        ## convert NeoPixel object to list ###
-        current_pattern = []
-        for led in pix:
-            current_pattern.append(led)
+        new_frame = self.pattern_manager.pattern_to_frame(new_pattern)
 
         # random direction
         directions = ['forward', 'backwards']
         direction = choice(directions)
-        if direction == 'backwards':
-            for led in reversed(range(self.tot_leds)):
-                current_pattern[led] = new_pattern[led]
-                self.set_wormhole_pattern(current_pattern)
-        else:
-            for led in range(self.tot_leds):
-                current_pattern[led] = new_pattern[led]
-                self.set_wormhole_pattern(current_pattern)
+        self.play_sequence(self.frame_cache.get_sweep(self.current_frame, new_frame, direction))
+
+    def play_timeline(self, timeline):
+        """
+        This method plays a compiled wormhole timeline. We first fade from the current frame to the start of the timeline.
+        :param timeline: the timeline as a dict, from WormholeTimelineLibrary.get_timelines()
+        :return: Nothing is returned
+        """
+        sequence = self.timeline_library.get_sequence(timeline)
+        self.fade_to_frame(sequence.rgb_frames[0])
+        self.play_sequence(sequence, self.timeline_library.get_fps(timeline))
 
     def do_random_transitions(self, is_black_hole=False):
+        ## Sometimes play one of the wormhole timelines instead
+        timelines = self.timeline_library.get_timelines(is_black_hole)
+        if timelines and randint(1, 100) <= self.timeline_percent:
+            self.play_timeline(choice(timelines))
+            return
+
         ## Lists of possible transition methods and directions
         possible_transitions = ['fade', 'sweep']
         possible_directions = ['cw', 'ccw']
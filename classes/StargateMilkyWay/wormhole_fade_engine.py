@@ -0,0 +1,111 @@
+class WormholeFadeEngine:
+    """
+    This class creates the in-between frames when fading the wormhole from one frame to another.
+    A frame is a flat bytearray with 3 bytes (r, g, b) per led. The number of frames is given by the fade duration and
+    the frame rate, not by the distance between the colors.
+
+    The wormhole patterns only use a few colors, so the channels are grouped by their (start, end) value. Each frame,
+    the interpolated value of each group is computed once into a 256 byte table, and bytes.translate() maps the group
+    index of every channel through it, in C. A fade with more than 256 groups falls back to a per-channel Python loop.
+    """
+
+    def __init__(self, tot_leds, fps, gamma_correct=True, gamma=2.2):
+        self.tot_leds = tot_leds
+        self.fps = fps
+        self.gamma_correct = gamma_correct
+
+        # Preallocated buffers. These are reused for every fade.
+        self.frame = bytearray(tot_leds * 3)
+        self._start = [0] * (tot_leds * 3)
+        self._delta = [0] * (tot_leds * 3)
+        self._end = bytearray(tot_leds * 3)
+        self._frame_count = 1
+
+        # The channels grouped by their (start, end) value: the group of each channel, and the (start, delta) of each group
+        self._groups = None
+        self._group_index = bytearray(tot_leds * 3)
+        self._table = bytearray(256)
+
+        # Lookup tables for the gamma-correct fade. The 8-bit colors are decoded to 12-bit linear light values,
+        # interpolated, and encoded back to 8 bits. This keeps the fade from looking like it "jumps" at the dark end.
+        self._linear_max = 4095
+        self._to_linear = [round(((value / 255) ** gamma) * self._linear_max) for value in range(256)]
+        self._from_linear = bytes(round(((value / self._linear_max) ** (1 / gamma)) * 255) for value in range(self._linear_max + 1))
+
+    def get_frame_count(self, duration):
+        """
+        This method calculates how many frames a fade of duration seconds takes.
+        :param duration: the duration of the fade in seconds
+        :return: the number of frames as an int. At least 1.
+        """
+        return max(1, round(duration * self.fps))
+
+    def prepare(self, start_frame, end_frame, duration):
+        """
+        This method prepares a fade from start_frame to end_frame. Use render() to get the frames.
+        :param start_frame: the frame to fade from, as a bytearray (or bytes).
+        :param end_frame: the frame to fade to, as a bytearray (or bytes).
+        :param duration: the duration of the fade in seconds.
+        :return: the number of frames in the fade is returned.
+        """
+        self._frame_count = self.get_frame_count(duration)
+        self._end[:] = end_frame
+
+        if self.gamma_correct:
+            to_linear = self._to_linear
+            self._start[:] = [to_linear[value] for value in start_frame]
+            self._delta[:] = [to_linear[value] - start for value, start in zip(end_frame, self._start)]
+        else:
+            self._start[:] = start_frame
+            self._delta[:] = [value - start for value, start in zip(end_frame, self._start)]
+
+        groups = {}
+        for channel, pair in enumerate(zip(self._start, self._delta)):
+            group = groups.setdefault(pair, len(groups))
+            if group > 255:
+                self._groups = None
+                break
+            self._group_index[channel] = group
+        else:
+            self._groups = list(groups)
+
+        return self._frame_count
+
+    def render(self, step):
+        """
+        This method renders one frame of the prepared fade. The last frame is always equal to end_frame.
+        The same (preallocated) bytearray is returned every time, so copy it if you need to keep it.
+        :param step: the frame number, from 1 to the number of frames returned by prepare().
+        :return: the frame is returned as a bytearray.
+        """
+        frame = self.frame
+        frame_count = self._frame_count
+
+        if step >= frame_count:
+            # The lookup tables don't round-trip exactly, so finish on the exact end frame.
+            frame[:] = self._end
+        elif self._groups is not None:
+            table = self._table
+            if self.gamma_correct:
+                from_linear = self._from_linear
+                for group, (start, delta) in enumerate(self._groups):
+                    table[group] = from_linear[start + delta * step // frame_count]
+            else:
+                for group, (start, delta) in enumerate(self._groups):
+                    table[group] = start + delta * step // frame_count
+            frame[:] = self._group_index.translate(table)
+        elif self.gamma_correct:
+            from_linear = self._from_linear
+            frame[:] = bytes([from_linear[start + delta * step // frame_count] for start, delta in zip(self._start, self._delta)])
+        else:
+            frame[:] = bytes([start + delta * step // frame_count for start, delta in zip(self._start, self._delta)])
+        return frame
+
+    def fade(self, start_frame, end_frame, duration):
+        """
+        This generator yields all the frames for a fade from start_frame to end_frame.
+        :return: the frames are yielded one at a time.
+        """
+        frame_count = self.prepare(start_frame, end_frame, duration)
+        for step in range(1, frame_count + 1):
+            yield self.render(step)
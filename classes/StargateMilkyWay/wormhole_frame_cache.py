@@ -0,0 +1,193 @@
+from collections import OrderedDict
+
+class FrameSequence: # pylint: disable=too-few-public-methods
+    """
+    A pre-rendered animation. The frames are slices of one contiguous buffer, already encoded for the led strip.
+    rgb_frames holds the same frames as plain (r, g, b) bytes, so we always know what is shown on the strip.
+    holds is a dict of {frame_index: seconds} to pause after a frame.
+    """
+
+    def __init__(self, encoded, rgb, frame_count, holds=None):
+        frame_size = len(rgb) // frame_count if frame_count else 0
+        encoded_view = memoryview(encoded)
+        rgb_view = memoryview(rgb)
+
+        self.frames = [encoded_view[index * frame_size:(index + 1) * frame_size] for index in range(frame_count)]
+        self.rgb_frames = [rgb_view[index * frame_size:(index + 1) * frame_size] for index in range(frame_count)]
+        self.holds = holds or {}
+
+        # The encoded buffer is the rgb buffer when the writer has no fast path. Don't count it twice.
+        self.size = len(rgb) if encoded is rgb else len(rgb) + len(encoded)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def append(self, other, repeat=1, times=1):
+        """
+        This method appends the frames of another sequence to this one. The frames are shared, not copied.
+        :param other: the FrameSequence to append
+        :param repeat: how many times to show each frame of other, to slow it down.
+        :param times: how many times to append other, eg for several revolutions of a rotation.
+        :return: Nothing is returned
+        """
+        for turn in range(times): # pylint: disable=unused-variable
+            for index, frame in enumerate(other.frames):
+                self.frames.extend([frame] * repeat)
+                self.rgb_frames.extend([other.rgb_frames[index]] * repeat)
+                if index in other.holds:
+                    self.holds[len(self.frames) - 1] = other.holds[index]
+        self.size += other.size
+
+
+class WormholeFrameCache:
+    """
+    This class pre-renders the wormhole animations into FrameSequences, and keeps them in a LRU cache.
+    The kawoosh is rendered at startup, the sweeps and rotations are rendered the first time they are used.
+    Only the sweeps and rotations of the wormhole patterns are cached, keyed on the pattern number. Other frames,
+    eg the end of a timeline or of a cancelled fade, rarely show up twice, and would evict the patterns.
+    """
+
+    def __init__(self, frame_writer, tot_leds, max_bytes):
+        self.frame_writer = frame_writer
+        self.tot_leds = tot_leds
+        self.max_bytes = max_bytes
+
+        self.sequences = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+
+        self.pattern_ids = {} # {frame bytes: pattern number}, see set_patterns()
+
+    def get(self, key, render):
+        """
+        This method returns the FrameSequence for key, and renders (and caches) it if needed.
+        :param key: a hashable key for the sequence
+        :param render: a function returning the FrameSequence if it's not in the cache
+        :return: the FrameSequence is returned
+        """
+        try:
+            sequence = self.sequences[key]
+            self.sequences.move_to_end(key)
+            self.hits += 1
+            return sequence
+        except KeyError:
+            pass
+
+        self.misses += 1
+        sequence = render()
+        self.put(key, sequence)
+        return sequence
+
+    def put(self, key, sequence):
+        # Don't cache a sequence larger than the whole cache
+        if sequence.size > self.max_bytes:
+            return
+
+        self.sequences[key] = sequence
+        self.size += sequence.size
+
+        # Evict the least recently used sequences
+        while self.size > self.max_bytes:
+            evicted_key, evicted = self.sequences.popitem(last=False) # pylint: disable=unused-variable
+            self.size -= evicted.size
+
+    def set_patterns(self, frames):
+        """
+        This method sets the frames of the wormhole patterns, so their sweeps and rotations can be cached.
+        :param frames: a list of frames, 3 bytes (r, g, b) per led
+        :return: Nothing is returned
+        """
+        self.pattern_ids = {bytes(frame): index for index, frame in enumerate(frames)}
+
+    def clear(self):
+        self.sequences.clear()
+        self.size = 0
+
+    def get_status(self):
+        return {
+            "sequences": len(self.sequences),
+            "size": self.size,
+            "max_size": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "uncached": self.uncached
+        }
+
+    def create_sequence(self, rgb, frame_count, holds=None):
+        return FrameSequence(self.frame_writer.encode(rgb), rgb, frame_count, holds)
+
+    def get_kawoosh(self):
+        return self.get(('kawoosh',), self.render_kawoosh)
+
+    def get_sweep(self, current_frame, new_frame, direction):
+        current_id = self.pattern_ids.get(bytes(current_frame))
+        new_id = self.pattern_ids.get(bytes(new_frame))
+        if current_id is None or new_id is None:
+            self.uncached += 1
+            return self.render_sweep(current_frame, new_frame, direction)
+
+        key = ('sweep', current_id, new_id, direction)
+        return self.get(key, lambda: self.render_sweep(current_frame, new_frame, direction))
+
+    def get_rotation(self, frame, direction):
+        pattern_id = self.pattern_ids.get(bytes(frame))
+        if pattern_id is None:
+            self.uncached += 1
+            return self.render_rotation(frame, direction)
+
+        key = ('rotate', pattern_id, direction)
+        return self.get(key, lambda: self.render_rotation(frame, direction))
+
+    def render_kawoosh(self):
+        """
+        This method renders the kawoosh: a quick flash of light from black, fading down to the wormhole blue.
+        :return: the FrameSequence is returned
+        """
+        colors = [((i // 2) * 2, i * 2, i * 2) for i in range(128)]
+        colors += [(i // 2, i, i) for i in range(255, 50, -2)]
+
+        rgb = bytearray()
+        for color in colors:
+            rgb += bytes(color) * self.tot_leds
+
+        # Pause after the first 20 frames, and at the end.
+        holds = {19: 0.5, len(colors) - 1: 0.3}
+        return self.create_sequence(rgb, len(colors), holds)
+
+    def render_sweep(self, current_frame, new_frame, direction):
+        """
+        This method renders a sweep from current_frame to new_frame, one led at a time.
+        :param direction: 'forward' or 'backwards'
+        :return: the FrameSequence is returned
+        """
+        rgb = bytearray()
+        if direction == 'backwards':
+            for led in reversed(range(self.tot_leds)):
+                rgb += current_frame[:led * 3] + new_frame[led * 3:]
+        else:
+            for led in range(self.tot_leds):
+                rgb += new_frame[:(led + 1) * 3] + current_frame[(led + 1) * 3:]
+        return self.create_sequence(rgb, self.tot_leds)
+
+    def render_rotation(self, frame, direction):
+        """
+        This method renders one full revolution of frame along the led strip. Each rotated frame is a slice
+        of the frame repeated twice, so a whole revolution takes no more memory than two frames.
+        :param direction: 'cw' or 'ccw'
+        :return: the FrameSequence is returned
+        """
+        doubled_rgb = bytearray(frame) + bytearray(frame)
+        doubled_encoded = self.frame_writer.encode(doubled_rgb)
+        frame_size = self.tot_leds * 3
+
+        sequence = FrameSequence(doubled_encoded, doubled_rgb, 0)
+        for step in range(1, self.tot_leds + 1):
+            if direction == 'cw':
+                start = step * 3
+            else:
+                start = (self.tot_leds - step) * 3
+            sequence.frames.append(memoryview(doubled_encoded)[start:start + frame_size])
+            sequence.rgb_frames.append(memoryview(doubled_rgb)[start:start + frame_size])
+        return sequence
@@ -0,0 +1,92 @@
+class WormholeFrameWriter:
+    """
+    This class converts frames (3 bytes (r, g, b) per led) to the byte order and brightness of the led strip,
+    and writes them straight into the pixel buffer of the NeoPixel driver.
+    If the driver doesn't expose its pixel buffer, the frames are set one pixel at a time instead.
+    """
+
+    def __init__(self, pixels, tot_leds):
+        self.pixels = pixels
+        self.tot_leds = tot_leds
+
+        # The byte order of the strip. NeoPixels are usually "GRB".
+        byteorder = getattr(pixels, 'byteorder', 'GRB')
+        self.red_index = byteorder.index('R')
+        self.green_index = byteorder.index('G')
+        self.blue_index = byteorder.index('B')
+
+        # The pure python adafruit_pixelbuf keeps the bytes sent to the strip in _post_brightness_buffer.
+        # We can only write to it directly for plain 3 byte-per-pixel strips.
+        self.buffer = getattr(pixels, '_post_brightness_buffer', None)
+        self.offset = getattr(pixels, '_offset', 0)
+        self.fast_path = self.buffer is not None and len(byteorder) == 3
+        self.end = self.offset + tot_leds * 3
+
+        # When the brightness isn't 1, adafruit_pixelbuf also keeps the colors before brightness.
+        # We keep it up to date, so reading the pixels or changing the brightness still works.
+        self.pre_brightness_buffer = getattr(pixels, '_pre_brightness_buffer', None)
+
+        # A lookup table to apply the strip brightness to each byte, the same way adafruit_pixelbuf does.
+        # The brightness is baked into the encoded frames, so it must not be changed after this.
+        brightness = getattr(pixels, 'brightness', 1.0)
+        self.brightness_table = bytes(int(value * brightness) for value in range(256))
+
+    def encode(self, frames):
+        """
+        This method converts one or more frames to the byte order and brightness of the led strip.
+        :param frames: one frame, or several frames back to back, as a bytearray with 3 bytes (r, g, b) for each led.
+        :return: the encoded frames are returned as a bytearray. Without the fast path, the frames are returned unchanged.
+        """
+        if not self.fast_path:
+            return frames
+
+        encoded = bytearray(len(frames))
+        encoded[self.red_index::3] = frames[0::3]
+        encoded[self.green_index::3] = frames[1::3]
+        encoded[self.blue_index::3] = frames[2::3]
+        return bytearray(encoded.translate(self.brightness_table))
+
+    def show(self, encoded_frame, rgb_frame=None):
+        """
+        This method writes an encoded frame to the led strip, and displays it.
+        :param encoded_frame: a single frame, as returned by encode()
+        :param rgb_frame: the same frame as (r, g, b) bytes. Needed to keep the pixel colors readable when brightness isn't 1.
+        :return: Nothing is returned
+        """
+        if self.fast_path:
+            self.buffer[self.offset:self.end] = encoded_frame
+            if self.pre_brightness_buffer is not None and rgb_frame is not None:
+                self.write_channels(self.pre_brightness_buffer, rgb_frame)
+        else:
+            for index in range(self.tot_leds):
+                offset = index * 3
+                self.pixels[index] = (encoded_frame[offset], encoded_frame[offset + 1], encoded_frame[offset + 2])
+        self.pixels.show()
+
+    def show_frame(self, frame):
+        """
+        This method converts a single frame, and displays it. Each color channel is converted and written straight into
+        the pixel buffer, without building an encoded copy of the frame first.
+        :param frame: the frame as a bytearray with 3 bytes (r, g, b) for each led.
+        :return: Nothing is returned
+        """
+        if not self.fast_path:
+            self.show(frame)
+            return
+
+        self.write_channels(self.buffer, frame, self.brightness_table)
+        if self.pre_brightness_buffer is not None:
+            self.write_channels(self.pre_brightness_buffer, frame)
+        self.pixels.show()
+
+    def write_channels(self, buffer, frame, table=None):
+        """
+        This helper method writes the color channels of frame into buffer, in the byte order of the led strip.
+        :param table: an optional lookup table (eg brightness_table) to apply to the colors.
+        :return: Nothing is returned
+        """
+        for channel, index in enumerate((self.red_index, self.green_index, self.blue_index)):
+            values = frame[channel::3]
+            if table is not None:
+                values = values.translate(table)
+            buffer[self.offset + index:self.end:3] = values
@@ -1,14 +1,20 @@
-from time import sleep, time
 from datetime import timedelta
 from pathlib import Path
 import math
 
+from gate_clock import sleep, time
 from wormhole_animation_manager import WormholeAnimationManager
+from wormhole_renderer import WormholeRenderer
 
 class WormholeManager:
     """
     This class handles all things wormhole. It takes the stargate object as input.
+    The main loop opens the wormhole, polls it on each pass while it's open, and closes it. The animations run in
+    the render thread meanwhile, so the main loop keeps handling the inputs.
     """
+
+    # The most seconds between two polls of an open wormhole, so the main loop notices when it's closed from another thread.
+    POLL_INTERVAL = 0.1
     def __init__(self, stargate):
 
         # For convenience
@@ -22,6 +28,7 @@ class WormholeManager:
         self.pixels = self.electronics.get_wormhole_pixels()
         self.tot_leds = self.electronics.get_wormhole_pixel_count()
         self.animation_manager = WormholeAnimationManager(stargate)
+        self.renderer = WormholeRenderer(self.animation_manager)
 
         self.root_path = Path(__file__).parent.absolute()
 
@@ -38,18 +45,85 @@ class WormholeManager:
         self.wormhole_max_time = self.wormhole_max_time_default
 
         self.open_time = None
+        self.random_audio_start_time = None
+        self.audio_group = "audio_clips"
 
     def initialize_animation_manager(self):
         self.animation_manager.after_init(self)
 
     def open_wormhole(self):
         """
-        Method for opening the wormhole. For some reason i did not use the fade_transition function here..
+        This method opens the wormhole: the kawoosh, then the animations are started in the render thread.
+        The wormhole stays open until close() is called. Call poll() on each pass of the main loop meanwhile.
         :return: Nothing is returned.
         """
+        self.log.log('Opening Wormhole!')
         self.audio.sound_start('wormhole_open')  # Open wormhole audio
         self.animation_manager.animate_kawoosh()
 
+        # this will play the worm hole active audio. It lasts about 4min 22sec. With the audio mixer it loops until the wormhole closes.
+        self.audio.sound_start('wormhole_established')
+
+        self.open_time = time()
+        self.random_audio_start_time = self.open_time
+
+        # Assume we did not dial a black hole
+        self.audio_group = "audio_clips"
+
+        # If we dialed the black hole planet, change some variables
+        if self.stargate.black_hole:  # If we dialed the black hole.
+            self.wormhole_max_time = self.wormhole_max_time_blackhole * 60  # Make it 10 years...
+            self.audio_clip_wait_time = self.audio_clip_wait_time_blackhole
+            self.audio_group = "audio_clips/black_hole"
+
+        # Change the patterns/animations around with transitions. This runs in the render thread.
+        self.renderer.start(self.stargate.black_hole)
+
+    def is_open(self):
+        return self.open_time is not None
+
+    def poll(self):
+        """
+        This method keeps the wormhole open: it plays the random audio clips. It doesn't block.
+        :return: True if the wormhole can stay open, False if it ran out of power/time.
+        """
+        if self.get_time_remaining() <= 0:
+            return False
+
+        # Play random audio clips if there has been "silence" for more than audio_clip_wait_time
+        if self.audio_play_random_clips and (time() - self.random_audio_start_time) > self.audio_clip_wait_time:
+            self.audio.play_random_clip(self.audio_group) # Won't play if a clip is already playing
+            self.random_audio_start_time = time()
+        return True
+
+    def close(self):
+        """
+        This method stops the animations and closes the wormhole.
+        :return: Nothing is returned.
+        """
+        # Did it close because it ran out of power/time?
+        if self.get_time_remaining() < 1:  # if the wormhole closes due to the 38min time limit.
+            if self.audio.random_clip_is_playing():  # If the random audio clip is still playing:
+                self.audio.random_clip_wait_done()  # wait until it's finished.
+
+            self.audio.play_random_clip("38min")  # The 38min ones.
+            self.audio.random_clip_wait_done()  # wait until it's finished.
+
+        # Stop the animations, then close the wormhole from this thread.
+        self.renderer.stop()
+        scheduler_status = self.animation_manager.scheduler.get_status()
+        self.log.log(f'Wormhole animation: {scheduler_status["frames"]} frames, {scheduler_status["dropped_frames"]} dropped')
+
+        self.close_wormhole()
+        if self.audio.is_playing('wormhole_established'):
+            self.audio.sound_stop('wormhole_established')
+        self.log.log(f'Disengaged Wormhole after {timedelta(seconds=int(time() - self.open_time))}')
+        self.open_time = None
+
+        # Reset the variables for the next wormhole
+        self.wormhole_max_time = self.wormhole_max_time_default
+        self.audio_clip_wait_time = self.audio_clip_wait_time_default
+
     def close_wormhole(self):
         """
         Method to disengage the wormhole
@@ -80,58 +154,3 @@ class WormholeManager:
             time_elapsed = time() - self.open_time
             return math.floor(self.wormhole_max_time - time_elapsed)
         return 0
-
-    def establish_wormhole(self):
-        """
-        This is the main method in the wormhole class that opens and maintains a wormhole
-        :return: Nothing is returned.
-        """
-
-        # Open The wormhole
-        self.log.log('Opening Wormhole!')
-        self.open_wormhole()
-
-        # this will play the worm hole active audio. It lasts about 4min 22sec. It is deliberately not looping or restarting.
-        self.audio.sound_start('wormhole_established')
-
-        self.open_time = time()
-        random_audio_start_time = self.open_time
-
-        # Assume we did not dial a black hole
-        audio_group = "audio_clips"
-
-        # If we dialed the black hole planet, change some variables
-        if self.stargate.black_hole:  # If we dialed the black hole.
-            self.wormhole_max_time = self.wormhole_max_time_blackhole * 60  # Make it 10 years...
-            self.audio_clip_wait_time = self.audio_clip_wait_time_blackhole
-            audio_group = "audio_clips/black_hole"
-
-        # Keep the wormhole open
-        while self.stargate.wormhole_active and self.get_time_remaining() > 0:  # as long as stargate.wormhole_active, but for less time than the wormhole_max_time.
-
-            # TODO: These take a long time, and as a result we don't have tight timing
-            # on wormhole close/timeout, and the random clips.
-            #    Maybe the Neopixel stuff should run in it's own thread?
-
-            # Change the patterns/animations around with transitions
-            self.animation_manager.do_random_transitions(self.stargate.black_hole)
-
-            # Play random audio clips if wormhole not closing
-            if self.audio_play_random_clips and self.stargate.wormhole_active and (time() - random_audio_start_time) > self.audio_clip_wait_time:  # If there has been "silence" for more than audio_clip_wait_time
-                self.audio.play_random_clip(audio_group) # Won't play if a clip is already playing
-                random_audio_start_time = time()
-
-        # Wormhole is closing. Did it close because it ran out of power/time?
-        if self.get_time_remaining() < 1:  # if the wormhole closes due to the 38min time limit.
-            if self.audio.random_clip_is_playing():  # If the random audio clip is still playing:
-                self.audio.random_clip_wait_done()  # wait until it's finished.
-
-            self.audio.play_random_clip("38min")  # The 38min ones.
-            self.audio.random_clip_wait_done()  # wait until it's finished.
-
-        self.close_wormhole()
-        if self.audio.is_playing('wormhole_established'):
-            self.audio.sound_stop('wormhole_established')
-        self.stargate.wormhole_active = False # The close_wormhole method also does this.. shouldn't be needed.
-        self.log.log(f'Disengaged Wormhole after {timedelta(seconds=int(time() - self.open_time))}')
-        self.open_time = None
@@ -18,6 +18,24 @@ class WormholePatternManager:
             off_pattern.append((0, 0, 0))
         return off_pattern
 
+    @staticmethod
+    def pattern_to_frame(pattern):
+        """
+        This helper method flattens a pattern into a frame. A frame is a bytearray with 3 bytes (r, g, b) for each led.
+        :param pattern: the pattern as a list of rgb tuples
+        :return: the frame is returned as a bytearray
+        """
+        return bytearray(channel for led in pattern for channel in led)
+
+    @staticmethod
+    def frame_to_pattern(frame):
+        """
+        This helper method converts a frame back into a pattern.
+        :param frame: the frame as a bytearray with 3 bytes (r, g, b) for each led
+        :return: the pattern is returned as a list of rgb tuples
+        """
+        return [tuple(frame[index:index + 3]) for index in range(0, len(frame), 3)]
+
     def pattern1(self, color1, color2):
         """
         This method creates the wormhole pattern1
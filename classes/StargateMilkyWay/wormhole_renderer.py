@@ -0,0 +1,45 @@
+from threading import Thread
+
+class WormholeRenderer:
+    """
+    This class runs the wormhole animations in their own thread, so the main loop stays responsive while the
+    wormhole is established. The animations are paced by the FrameScheduler of the WormholeAnimationManager,
+    and stop within one frame when the renderer is stopped.
+    """
+
+    def __init__(self, animation_manager):
+        self.animation_manager = animation_manager
+        self.thread = None
+
+    def start(self, is_black_hole=False):
+        """
+        This method starts running random transitions in the render thread.
+        :param is_black_hole: True to use the black hole patterns.
+        :return: Nothing is returned
+        """
+        self.animation_manager.scheduler.reset()
+        self.animation_manager.scheduler.reset_statistics()
+        self.thread = Thread(name="stargate-wormhole-render", target=self.run, args=(is_black_hole,), daemon=True)
+        self.thread.start()
+
+    def run(self, is_black_hole):
+        while not self.animation_manager.is_cancelled():
+            self.animation_manager.do_random_transitions(is_black_hole)
+
+    def stop(self):
+        """
+        This method stops the render thread, and waits for it to finish the current frame.
+        :return: Nothing is returned
+        """
+        if self.thread is None:
+            return
+
+        self.animation_manager.scheduler.cancel()
+        self.thread.join()
+        self.thread = None
+
+        # Make the scheduler ready for animations on the calling thread, eg close_wormhole()
+        self.animation_manager.scheduler.reset()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
@@ -0,0 +1,249 @@
+import json
+from glob import glob
+from os import path
+
+from wormhole_fade_engine import WormholeFadeEngine
+from wormhole_frame_cache import FrameSequence
+
+class WormholeTimelineCompiler:
+    """
+    This class compiles a wormhole timeline into a FrameSequence, ahead of time.
+    A timeline is a dict (loaded from JSON) like this:
+
+    {
+      "name": "Blue Ripple",
+      "black_hole": false,
+      "fps": 50,
+      "palette": { "deep": [0, 26, 74], "bright": [64, 229, 247] },
+      "keyframes": [
+        { "type": "set", "pattern": "pattern3", "colors": ["deep"], "size": 12 },
+        { "type": "rotate", "direction": "cw", "speed": 4, "revolutions": 2 },
+        { "type": "fade", "duration": 2.0, "pattern": "pattern1", "colors": ["deep", "bright"] },
+        { "type": "hold", "duration": 1.5 },
+        { "type": "sweep", "direction": "backwards", "pattern": "solid", "colors": ["bright"] }
+      ]
+    }
+
+    fps, black_hole and palette are optional. Colors are palette names or [r, g, b] lists.
+    The patterns are: off, solid (1 color), repeat (any number of colors), pattern1 (2 colors),
+    pattern2 and pattern3 (1 color and a size).
+    The rotate speed is the delay between each step in 1/100 seconds, like WormholeAnimationManager.rotate_pattern().
+    """
+
+    PATTERNS = ('off', 'solid', 'repeat', 'pattern1', 'pattern2', 'pattern3')
+
+    def __init__(self, pattern_manager, frame_cache, default_fps, default_fade_duration, gamma_correct=True):
+        self.pattern_manager = pattern_manager
+        self.frame_cache = frame_cache
+        self.tot_leds = pattern_manager.tot_leds
+        self.default_fps = default_fps
+        self.default_fade_duration = default_fade_duration
+        self.gamma_correct = gamma_correct
+
+        # The fade engines for each frame rate. The animation manager has its own, used by the render thread.
+        self.fade_engines = {}
+
+    def get_fps(self, timeline):
+        return timeline.get('fps', self.default_fps)
+
+    def compile(self, timeline):
+        """
+        This method compiles a timeline into a FrameSequence.
+        :param timeline: the timeline as a dict
+        :return: the FrameSequence is returned. A ValueError is raised if the timeline is invalid.
+        """
+        fps = self.get_fps(timeline)
+        if not isinstance(fps, (int, float)) or not 1 <= fps <= 100:
+            raise ValueError(f"fps must be a number from 1 to 100, not {fps!r}")
+
+        palette = timeline.get('palette', {})
+        keyframes = timeline.get('keyframes')
+        if not keyframes:
+            raise ValueError("The timeline has no keyframes")
+
+        # The sequence starts out empty, and shares the frames of each compiled step.
+        empty = bytearray()
+        sequence = FrameSequence(empty, empty, 0)
+        current_frame = bytearray(self.tot_leds * 3)
+
+        for index, keyframe in enumerate(keyframes):
+            try:
+                current_frame = self.compile_keyframe(keyframe, sequence, current_frame, palette, fps)
+            except (KeyError, TypeError, ValueError) as ex:
+                raise ValueError(f"Keyframe {index + 1}: {ex}") from ex
+
+        if not sequence.frames:
+            raise ValueError("The timeline has no frames")
+        return sequence
+
+    def compile_keyframe(self, keyframe, sequence, current_frame, palette, fps):
+        """
+        This method compiles one keyframe, and appends its frames to sequence.
+        :return: the last frame of the keyframe is returned.
+        """
+        keyframe_type = keyframe['type']
+
+        if keyframe_type == 'set':
+            new_frame = self.get_frame(keyframe, palette)
+            sequence.append(self.frame_cache.create_sequence(new_frame, 1))
+            return new_frame
+
+        if keyframe_type == 'fade':
+            new_frame = self.get_frame(keyframe, palette)
+            sequence.append(self.render_fade(current_frame, new_frame, keyframe.get('duration', self.default_fade_duration), fps))
+            return new_frame
+
+        if keyframe_type == 'sweep':
+            new_frame = self.get_frame(keyframe, palette)
+            direction = keyframe.get('direction', 'forward')
+            if direction not in ('forward', 'backwards'):
+                raise ValueError(f"Unknown sweep direction {direction!r}")
+            sequence.append(self.frame_cache.render_sweep(current_frame, new_frame, direction))
+            return new_frame
+
+        if keyframe_type == 'rotate':
+            direction = keyframe.get('direction', 'ccw')
+            if direction not in ('cw', 'ccw'):
+                raise ValueError(f"Unknown rotate direction {direction!r}")
+            # Show each step for speed/100 seconds. A full revolution ends on the frame it started from.
+            repeat = max(1, round(keyframe.get('speed', 0) * fps / 100))
+            rotation = self.frame_cache.render_rotation(current_frame, direction)
+            sequence.append(rotation, repeat, int(keyframe.get('revolutions', 1)))
+            return current_frame
+
+        if keyframe_type == 'hold':
+            if not sequence.frames:
+                # Nothing is shown yet. Hold the black frame we start from.
+                sequence.append(self.frame_cache.create_sequence(bytearray(current_frame), 1))
+            last_index = len(sequence.frames) - 1
+            sequence.holds[last_index] = sequence.holds.get(last_index, 0) + float(keyframe['duration'])
+            return current_frame
+
+        raise ValueError(f"Unknown keyframe type {keyframe_type!r}")
+
+    def render_fade(self, current_frame, new_frame, duration, fps):
+        """
+        This method renders a fade from current_frame to new_frame.
+        :param duration: the duration of the fade in seconds
+        :return: the FrameSequence is returned
+        """
+        fade_engine = self.get_fade_engine(fps)
+        frame_count = fade_engine.prepare(current_frame, new_frame, duration)
+        rgb = bytearray()
+        for step in range(1, frame_count + 1):
+            rgb += fade_engine.render(step)
+        return self.frame_cache.create_sequence(rgb, frame_count)
+
+    def get_fade_engine(self, fps):
+        if fps not in self.fade_engines:
+            self.fade_engines[fps] = WormholeFadeEngine(self.tot_leds, fps, self.gamma_correct)
+        return self.fade_engines[fps]
+
+    def get_frame(self, keyframe, palette):
+        """
+        This method creates the frame for the pattern of a keyframe.
+        :return: the frame is returned as a bytearray
+        """
+        pattern_name = keyframe['pattern']
+        colors = [self.get_color(color, palette) for color in keyframe.get('colors', [])]
+        size = int(keyframe.get('size', 10))
+
+        if pattern_name == 'off':
+            return bytearray(self.tot_leds * 3)
+        if pattern_name not in self.PATTERNS:
+            raise ValueError(f"Unknown pattern {pattern_name!r}")
+        if not colors or (pattern_name == 'pattern1' and len(colors) < 2):
+            raise ValueError(f"Not enough colors for {pattern_name}")
+        if pattern_name in ('pattern2', 'pattern3') and size < 1:
+            raise ValueError(f"The size must be at least 1, not {size}")
+
+        if pattern_name == 'solid':
+            return bytearray(bytes(colors[0]) * self.tot_leds)
+        if pattern_name == 'repeat':
+            pattern = [colors[led % len(colors)] for led in range(self.tot_leds)]
+        elif pattern_name == 'pattern1':
+            pattern = self.pattern_manager.pattern1(colors[0], colors[1])
+        elif pattern_name == 'pattern2':
+            pattern = self.pattern_manager.pattern2(colors[0], size)
+        else:
+            pattern = self.pattern_manager.pattern3(colors[0], size)
+        return self.pattern_manager.pattern_to_frame(pattern)
+
+    @staticmethod
+    def get_color(color, palette):
+        """
+        This helper method looks up a color.
+        :param color: a palette name, or a list of [r, g, b] values
+        :return: the color is returned as a tuple of rgb values
+        """
+        if isinstance(color, str):
+            try:
+                color = palette[color]
+            except KeyError:
+                raise ValueError(f"Unknown palette color {color!r}") from None
+
+        if len(color) != 3 or not all(isinstance(value, int) and 0 <= value <= 255 for value in color):
+            raise ValueError(f"Invalid color {color!r}")
+        return tuple(color)
+
+
+class WormholeTimelineLibrary:
+    """
+    This class loads the wormhole timelines, and keeps them compiled in the frame cache.
+    The timelines shipped with the software are in config/defaults-<galaxy>/wormhole_timelines/*.json.dist.
+    Your own timelines go in config/<galaxy>-wormhole_timelines/*.json. A timeline with the same name replaces
+    the shipped one.
+    """
+
+    def __init__(self, base_path, galaxy_path, log, compiler, frame_cache):
+        self.log = log
+        self.compiler = compiler
+        self.frame_cache = frame_cache
+
+        conf_dir = base_path + "/config" #No trailing slash
+        self.default_dir = conf_dir + "/defaults-" + galaxy_path + "/wormhole_timelines"
+        self.user_dir = conf_dir + "/" + galaxy_path + "-wormhole_timelines"
+
+        self.timelines = {}
+
+    def load(self):
+        """
+        This method loads all the timelines, and compiles them. Invalid timelines are logged and skipped.
+        :return: Nothing is returned
+        """
+        files = sorted(glob(self.default_dir + "/*.json.dist")) + sorted(glob(self.user_dir + "/*.json"))
+
+        self.timelines = {}
+        for file_path in files:
+            try:
+                with open(file_path, "r", encoding="utf8") as file:
+                    timeline = json.load(file)
+                name = timeline.setdefault('name', path.basename(file_path).split('.')[0])
+                sequence = self.compiler.compile(timeline)
+            except (OSError, ValueError, AttributeError) as ex:
+                self.log.log(f"Wormhole timeline {file_path} is invalid: {ex}")
+                continue
+
+            self.timelines[name] = timeline
+            self.frame_cache.put(self.get_key(timeline), sequence)
+
+        if self.timelines:
+            self.log.log(f"Loaded {len(self.timelines)} wormhole timelines")
+
+    @staticmethod
+    def get_key(timeline):
+        return ('timeline', timeline['name'])
+
+    def get_timelines(self, black_hole=False):
+        return [timeline for timeline in self.timelines.values() if bool(timeline.get('black_hole', False)) == black_hole]
+
+    def get_sequence(self, timeline):
+        """
+        This method returns the compiled timeline. It's compiled again if it was evicted from the frame cache.
+        :param timeline: the timeline as a dict, from get_timelines()
+        :return: the FrameSequence is returned
+        """
+        return self.frame_cache.get(self.get_key(timeline), lambda: self.compiler.compile(timeline))
+
+    def get_fps(self, timeline):
+        return self.compiler.get_fps(timeline)
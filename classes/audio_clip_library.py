@@ -0,0 +1,135 @@
+from os import scandir, stat
+from random import choice
+from collections import OrderedDict
+from threading import RLock
+import simpleaudio as sa
+
+class AudioClipLibrary:
+    """
+    This class keeps the random audio clips (DHD, startup, 38min, ...) ready to play.
+    Each clip directory is indexed once, and only scanned again when it changes.
+    The decoded clips are kept in memory, up to max_bytes. The least recently used clips are evicted first.
+    """
+
+    def __init__(self, sound_fx_root, max_bytes, log):
+        self.sound_fx_root = sound_fx_root
+        self.max_bytes = max_bytes
+        self.log = log
+
+        self.indexes = {} # {directory: (mtime_ns, [(file_path, mtime_ns, size), ...])}
+        self.clips = OrderedDict() # {(file_path, mtime_ns, size): WaveObject}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+        # The clips are played from the main loop, the keyboard and the web server threads.
+        self.lock = RLock()
+
+    def get_clips(self, directory):
+        """
+        This method lists the clips in a directory. The directory is only scanned again if it was modified.
+        :param directory: the directory, relative to the sound_fx_root. eg: "DHD"
+        :return: a list of (file_path, mtime_ns, size) tuples is returned. The list is empty if there are no clips.
+        """
+        path_to_folder = self.sound_fx_root + "/" + directory
+        try:
+            dir_mtime = stat(path_to_folder).st_mtime_ns
+        except FileNotFoundError:
+            return []
+
+        index = self.indexes.get(directory)
+        if index is None or index[0] != dir_mtime:
+            clips = []
+            with scandir(path_to_folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.lower().endswith('.wav'):
+                        file_stat = entry.stat()
+                        clips.append((entry.path, file_stat.st_mtime_ns, file_stat.st_size))
+            index = (dir_mtime, sorted(clips))
+            self.indexes[directory] = index
+        return index[1]
+
+    def choose_clip(self, directory):
+        """
+        This method picks a random clip from the directory, without loading it.
+        :param directory: the directory, relative to the sound_fx_root. eg: "DHD"
+        :return: a (file_path, mtime_ns, size) tuple is returned, or None if the directory has no clips.
+        """
+        with self.lock:
+            clips = self.get_clips(directory)
+            if not clips:
+                return None
+            return choice(clips)
+
+    def get_random_clip(self, directory):
+        """
+        This method picks a random clip from the directory.
+        :param directory: the directory, relative to the sound_fx_root. eg: "DHD"
+        :return: the decoded simpleaudio WaveObject is returned, or None if the directory has no clips.
+        """
+        with self.lock:
+            clip = self.choose_clip(directory)
+            if clip is None:
+                return None
+            return self.get_wave_object(clip)
+
+    def get_wave_object(self, clip):
+        """
+        This method returns the decoded clip, from memory if possible.
+        :param clip: a (file_path, mtime_ns, size) tuple, from get_clips()
+        :return: the simpleaudio WaveObject is returned
+        """
+        with self.lock:
+            try:
+                wave_object = self.clips[clip]
+                self.clips.move_to_end(clip)
+                self.hits += 1
+                return wave_object
+            except KeyError:
+                pass
+
+            self.misses += 1
+            wave_object = sa.WaveObject.from_wave_file(clip[0])
+            self.put(clip, wave_object)
+            return wave_object
+
+    def put(self, clip, wave_object):
+        clip_size = len(wave_object.audio_data)
+
+        # Don't keep a clip larger than the whole budget
+        if clip_size > self.max_bytes:
+            return
+
+        self.clips[clip] = wave_object
+        self.size += clip_size
+
+        # Evict the least recently used clips
+        while self.size > self.max_bytes:
+            evicted_clip, evicted = self.clips.popitem(last=False) # pylint: disable=unused-variable
+            self.size -= len(evicted.audio_data)
+
+    def preload(self, directory):
+        """
+        This method decodes all the clips in a directory, as long as they fit in the memory budget.
+        :param directory: the directory, relative to the sound_fx_root. eg: "DHD"
+        :return: Nothing is returned
+        """
+        with self.lock:
+            for clip in self.get_clips(directory):
+                if clip in self.clips:
+                    continue
+                try:
+                    self.get_wave_object(clip)
+                except Exception as ex: # pylint: disable=broad-except
+                    self.log.log(f"Unable to load audio clip {clip[0]}: {ex}")
+                if self.size >= self.max_bytes:
+                    return
+
+    def get_status(self):
+        return {
+            "clips": len(self.clips),
+            "size": self.size,
+            "max_size": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,502 @@
+import sys
+from array import array
+from threading import Thread, Lock, Event
+from time import sleep
+from weakref import WeakKeyDictionary
+import mmap
+import struct
+
+try:
+    import audioop # pylint: disable=deprecated-module
+except ModuleNotFoundError:
+    # Removed in Python 3.13. It's only used to resample the clips that are not at the stream rate.
+    audioop = None # pylint: disable=invalid-name
+
+SAMPLE_MIN = -32768
+SAMPLE_MAX = 32767
+
+def to_samples(data):
+    """
+    This function reads 16 bit little-endian PCM audio as an array of samples.
+    :return: an array('h') is returned
+    """
+    samples = array('h')
+    samples.frombytes(data)
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return samples
+
+def from_samples(samples):
+    """
+    This function writes an array of samples as 16 bit little-endian PCM audio.
+    :return: the audio as bytes
+    """
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return samples.tobytes()
+
+def scale(data, volume):
+    """
+    This function changes the volume of 16 bit audio. The samples are clipped instead of wrapping around.
+    :return: the audio as bytes
+    """
+    samples = to_samples(data)
+    if volume <= 1.0:
+        return from_samples(array('h', [int(sample * volume) for sample in samples]))
+    return from_samples(array('h', [min(SAMPLE_MAX, max(SAMPLE_MIN, int(sample * volume))) for sample in samples]))
+
+def mix(chunks):
+    """
+    This function adds up chunks of 16 bit audio of the same length. The sum is clipped instead of wrapping around.
+    :return: the mixed audio as bytes
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+    sums = map(sum, zip(*[to_samples(chunk) for chunk in chunks]))
+    return from_samples(array('h', [SAMPLE_MAX if value > SAMPLE_MAX else SAMPLE_MIN if value < SAMPLE_MIN else value
+                                    for value in sums]))
+
+class MixerVoice:
+    """
+    One clip playing on the AudioMixer. It works like the simpleaudio PlayObject: is_playing(), stop() and wait_done().
+    """
+
+    def __init__(self, audio_data, frame_size, volume=1.0, loop=False, start_frame=0):
+        self.audio_data = audio_data
+        self.frame_size = frame_size
+        self.volume = volume
+        self.loop = loop
+        self.start_frame = start_frame
+
+        self.position = 0 # in bytes
+        self.done_event = Event()
+
+    def read(self, period_start, period_frames):
+        """
+        This method returns the part of the clip to mix into the period starting at mixer frame period_start.
+        :return: the audio as bytes for the whole period, or None if the voice doesn't play in this period.
+        """
+        offset = self.start_frame - period_start
+        if offset >= period_frames or self.done_event.is_set():
+            return None
+        offset = max(0, offset)
+
+        needed = (period_frames - offset) * self.frame_size
+        chunk = self.take(needed)
+        if len(chunk) < needed:
+            # Pad the end of the clip with silence
+            chunk += bytes(needed - len(chunk))
+            self.done_event.set()
+
+        if offset:
+            # Sample-accurate start: begin in the middle of the period
+            chunk = bytes(offset * self.frame_size) + chunk
+        if self.volume != 1.0:
+            chunk = scale(chunk, self.volume)
+        return chunk
+
+    def take(self, needed):
+        """
+        This method takes the next part of the clip, looping back to the start if needed.
+        :param needed: the number of bytes to take
+        :return: the audio as bytes. It's shorter than needed at the end of the clip.
+        """
+        chunk = self.audio_data[self.position:self.position + needed]
+        self.position += len(chunk)
+        while self.loop and self.audio_data and len(chunk) < needed:
+            loop_chunk = self.audio_data[:needed - len(chunk)]
+            self.position = len(loop_chunk)
+            chunk += loop_chunk
+        return chunk
+
+    def close(self):
+        pass
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+    def is_playing(self):
+        return not self.done_event.is_set()
+
+    def stop(self):
+        self.done_event.set()
+
+    def wait_done(self):
+        self.done_event.wait()
+
+
+class WaveFile:
+    """
+    A PCM WAV file, memory-mapped instead of read into memory.
+    """
+
+    def __init__(self, file_path):
+        with open(file_path, 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self.mmap, 'madvise'):
+            self.mmap.madvise(mmap.MADV_SEQUENTIAL)
+
+        self.num_channels = None
+        self.bytes_per_sample = None
+        self.sample_rate = None
+        self.data_offset = None
+        self.data_size = 0
+
+        try:
+            self.parse_header()
+        except (ValueError, struct.error):
+            self.close()
+            raise
+
+    def parse_header(self):
+        data = self.mmap
+        if data[0:4] != b'RIFF' or data[8:12] != b'WAVE':
+            raise ValueError("Not a WAV file")
+
+        position = 12
+        while position + 8 <= len(data):
+            chunk_id = data[position:position + 4]
+            chunk_size = struct.unpack('<I', data[position + 4:position + 8])[0]
+            if chunk_id == b'fmt ':
+                audio_format, self.num_channels, self.sample_rate = struct.unpack('<HHI', data[position + 8:position + 16])
+                self.bytes_per_sample = struct.unpack('<H', data[position + 22:position + 24])[0] // 8
+                if audio_format not in (1, 0xFFFE): # PCM or WAVE_FORMAT_EXTENSIBLE
+                    raise ValueError("Only PCM WAV files are supported")
+            elif chunk_id == b'data':
+                self.data_offset = position + 8
+                self.data_size = min(chunk_size, len(data) - self.data_offset)
+                break
+            position += 8 + chunk_size + (chunk_size & 1)
+
+        if self.num_channels is None or self.data_offset is None:
+            raise ValueError("Invalid WAV file")
+
+        # Only whole frames
+        frame_size = self.num_channels * self.bytes_per_sample
+        self.data_size -= self.data_size % frame_size
+
+    def read(self, start, end):
+        """
+        This method reads part of the audio data, and lets the kernel drop it from memory once it's been read.
+        :param start: the start, in bytes from the start of the audio data
+        :param end: the end, in bytes from the start of the audio data
+        :return: the audio data as bytes
+        """
+        start += self.data_offset
+        end += self.data_offset
+        data = self.mmap[start:end]
+
+        if hasattr(self.mmap, 'madvise'):
+            # Drop the whole pages we have read, and ask the kernel to read ahead the next part.
+            page_start = -(-start // mmap.PAGESIZE) * mmap.PAGESIZE
+            page_end = end // mmap.PAGESIZE * mmap.PAGESIZE
+            if page_end > page_start:
+                self.mmap.madvise(mmap.MADV_DONTNEED, page_start, page_end - page_start)
+            read_ahead = min(end - start, len(self.mmap) - page_end)
+            if read_ahead > 0:
+                self.mmap.madvise(mmap.MADV_WILLNEED, page_end, read_ahead)
+        return data
+
+    def close(self):
+        self.mmap.close()
+
+
+class StreamingVoice(MixerVoice):
+    """
+    A long clip playing on the AudioMixer, read from the file a chunk at a time. The memory used doesn't depend on
+    the length of the clip. It can also seek.
+    """
+
+    CHUNK_FRAMES = 8192
+
+    def __init__(self, wave_file, mixer, volume=1.0, loop=False, start_frame=0):
+        super().__init__(b'', mixer.frame_size, volume, loop, start_frame)
+        self.wave_file = wave_file
+        self.mixer = mixer
+
+        self.source_position = 0 # in bytes of the file's audio data
+        self.source_chunk_size = self.CHUNK_FRAMES * wave_file.num_channels * wave_file.bytes_per_sample
+        self.pending = bytearray() # converted audio, not played yet
+        self.convert_state = None
+        self.seek_to = None
+
+    def take(self, needed):
+        if self.seek_to is not None:
+            self.source_position, self.seek_to = self.seek_to, None
+            self.pending.clear()
+            self.convert_state = None
+
+        while len(self.pending) < needed:
+            if self.source_position >= self.wave_file.data_size:
+                if not self.loop or not self.wave_file.data_size:
+                    break
+                self.source_position = 0
+            self.fill()
+
+        chunk = bytes(self.pending[:needed])
+        del self.pending[:needed]
+        return chunk
+
+    def fill(self):
+        end = min(self.source_position + self.source_chunk_size, self.wave_file.data_size)
+        data = self.wave_file.read(self.source_position, end)
+        self.source_position = end
+        converted, self.convert_state = self.mixer.convert(data, self.wave_file, self.convert_state)
+        self.pending += converted
+
+    def seek(self, seconds):
+        """
+        This method moves the playback to another time in the clip. It happens at the next mixer period.
+        :param seconds: the time from the start of the clip
+        :return: Nothing is returned
+        """
+        frame_size = self.wave_file.num_channels * self.wave_file.bytes_per_sample
+        frame = max(0, round(seconds * self.wave_file.sample_rate))
+        self.seek_to = min(frame * frame_size, self.wave_file.data_size)
+
+    def close(self):
+        self.wave_file.close()
+
+
+class AudioMixer:
+    """
+    This class keeps one ALSA output stream open, and mixes all the clips into it in software.
+    Starting a clip doesn't open a new stream, so the sounds start quickly, and any number of clips can overlap.
+    It uses pyalsaaudio. If that is not available, start() returns False and the clips should be played with simpleaudio.
+    """
+
+    MAX_WRITE_FAILURES = 50 # Consecutive failed periods before reopening the stream
+    MAX_REOPENS = 3         # Reopens without a successful write before giving up
+
+    def __init__(self, log, sample_rate=44100, channels=2, period_frames=512, device='default'):
+        self.log = log
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.period_frames = period_frames
+        self.device = device
+
+        self.sample_width = 2 # 16 bit
+        self.frame_size = self.sample_width * channels
+
+        self.alsaaudio = None
+        self.pcm = None
+        self.thread = None
+        self.running = False
+        self.frame_position = 0 # The next frame to mix, counted since the stream was opened.
+
+        self.voices = []
+        self.lock = Lock()
+        self.converted = WeakKeyDictionary() # {WaveObject: audio data in the format of the stream}
+
+    def start(self):
+        """
+        This method opens the output stream, and starts the mixer thread.
+        :return: True if the mixer is running, False if it could not be started.
+        """
+        try:
+            import alsaaudio  # pylint: disable=import-outside-toplevel
+        except ModuleNotFoundError:
+            self.log.log("Failed to import alsaaudio. Using simpleaudio for the sounds.")
+            return False
+
+        self.alsaaudio = alsaaudio
+        if not self.open_device():
+            return False
+
+        self.running = True
+        self.thread = Thread(name="stargate-audio-mixer", target=self.run, daemon=True)
+        self.thread.start()
+        return True
+
+    def open_device(self):
+        """
+        This method opens the ALSA output stream.
+        :return: True if the stream was opened, False if not.
+        """
+        try:
+            self.pcm = self.alsaaudio.PCM(type=self.alsaaudio.PCM_PLAYBACK, mode=self.alsaaudio.PCM_NORMAL,
+                                          rate=self.sample_rate, channels=self.channels,
+                                          format=self.alsaaudio.PCM_FORMAT_S16_LE, periodsize=self.period_frames,
+                                          device=self.device)
+        except self.alsaaudio.ALSAAudioError as ex:
+            self.log.log(f"Failed to open the audio output stream: {ex}. Using simpleaudio for the sounds.")
+            return False
+        return True
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.pcm is not None:
+            self.pcm.close()
+            self.pcm = None
+
+    def is_running(self):
+        return self.running
+
+    def run(self):
+        silence = bytes(self.period_frames * self.frame_size)
+        failures = 0
+        reopens = 0
+        while self.running:
+            period = self.mix_period() or silence
+            try:
+                # This blocks until the device has room for the period, so it also paces the mixer.
+                self.pcm.write(period)
+                failures = reopens = 0
+            except Exception as ex: # pylint: disable=broad-except
+                failures += 1
+                if failures == 1:
+                    self.log.log(f"Audio output error: {ex}")
+
+                # Don't spin on a device that's gone: wait for one period, then try to reopen it
+                sleep(self.period_frames / self.sample_rate)
+                if failures >= self.MAX_WRITE_FAILURES:
+                    failures = 0
+                    reopens += 1
+                    if reopens > self.MAX_REOPENS or not self.reopen():
+                        self.log.log("Audio output stream lost. Using simpleaudio for the sounds.")
+                        self.running = False
+                        self.stop_all()
+
+    def reopen(self):
+        """
+        This method closes the output stream, and opens it again.
+        :return: True if the stream was opened, False if not.
+        """
+        self.log.log("Reopening the audio output stream")
+        try:
+            self.pcm.close()
+        except Exception: # pylint: disable=broad-except
+            pass
+        return self.open_device()
+
+    def mix_period(self):
+        """
+        This method mixes the next period of all the voices.
+        :return: the mixed audio as bytes, or None if nothing is playing.
+        """
+        chunks = []
+        with self.lock:
+            period_start = self.frame_position
+            self.frame_position += self.period_frames
+
+            for voice in self.voices:
+                chunk = voice.read(period_start, self.period_frames)
+                if chunk is not None:
+                    chunks.append(chunk)
+
+            for voice in self.voices:
+                if not voice.is_playing():
+                    voice.close()
+            self.voices = [voice for voice in self.voices if voice.is_playing()]
+        return mix(chunks) if chunks else None
+
+    def play(self, wave_object, volume=1.0, loop=False, delay=0.0):
+        """
+        This method starts playing a clip.
+        :param wave_object: the clip as a simpleaudio WaveObject
+        :param volume: the volume of this clip, from 0.0 to 1.0
+        :param loop: True to play the clip again and again, until it is stopped.
+        :param delay: how long to wait before the clip starts, in seconds. The start is accurate to one sample.
+        :return: the MixerVoice is returned. It can be used like a simpleaudio PlayObject.
+        """
+        audio_data = self.get_audio_data(wave_object)
+        with self.lock:
+            start_frame = self.frame_position + round(delay * self.sample_rate)
+            voice = MixerVoice(audio_data, self.frame_size, volume, loop, start_frame)
+            self.voices.append(voice)
+        return voice
+
+    def play_stream(self, file_path, volume=1.0, loop=False, delay=0.0):
+        """
+        This method starts playing a long clip, streamed from the file instead of loaded into memory.
+        :param file_path: the path to the WAV file
+        :param volume: the volume of this clip, from 0.0 to 1.0
+        :param loop: True to play the clip again and again, until it is stopped.
+        :param delay: how long to wait before the clip starts, in seconds. The start is accurate to one sample.
+        :return: the StreamingVoice is returned. It can be used like a simpleaudio PlayObject, and can seek().
+        """
+        wave_file = WaveFile(file_path)
+        if not self.can_convert(wave_file):
+            wave_file.close()
+            raise ValueError(f"Can't resample {file_path} from {wave_file.sample_rate} Hz without audioop")
+        with self.lock:
+            start_frame = self.frame_position + round(delay * self.sample_rate)
+            voice = StreamingVoice(wave_file, self, volume, loop, start_frame)
+            self.voices.append(voice)
+        return voice
+
+    def stop_all(self):
+        with self.lock:
+            for voice in self.voices:
+                voice.stop()
+
+    def get_latency(self):
+        """
+        This method returns how long it takes for a clip started now to be heard, at most.
+        :return: the latency in seconds
+        """
+        return 2 * self.period_frames / self.sample_rate
+
+    def get_audio_data(self, wave_object):
+        """
+        This method converts the audio of a clip to the format of the output stream. The result is kept with the clip.
+        :param wave_object: the clip as a simpleaudio WaveObject
+        :return: the audio data as bytes
+        """
+        try:
+            return self.converted[wave_object]
+        except KeyError:
+            pass
+
+        audio_data = bytes(self.convert(wave_object.audio_data, wave_object)[0])
+        self.converted[wave_object] = audio_data
+        return audio_data
+
+    def can_convert(self, audio_format):
+        """
+        This method checks if audio can be converted to the format of the output stream. Resampling needs audioop.
+        :return: True if it can be converted, False if not.
+        """
+        return audioop is not None or audio_format.sample_rate == self.sample_rate
+
+    def convert(self, audio_data, audio_format, state=None):
+        """
+        This method converts audio to the format of the output stream.
+        :param audio_data: the audio as bytes
+        :param audio_format: the format of audio_data. An object with num_channels, bytes_per_sample and sample_rate.
+        :param state: the state returned by the previous call, when converting a clip in chunks. None to start.
+        :return: a tuple of the converted audio, and the state for the next chunk.
+        """
+        width = audio_format.bytes_per_sample
+        channels = audio_format.num_channels
+
+        if width == 1:
+            # 8 bit WAV files are unsigned
+            samples = array('h', [(sample - 128) << 8 for sample in audio_data])
+        else:
+            if width != self.sample_width:
+                # Keep the 2 most significant bytes of each sample
+                data = memoryview(audio_data)
+                converted = bytearray(len(data) // width * self.sample_width)
+                converted[0::2] = data[width - 2::width]
+                converted[1::2] = data[width - 1::width]
+                audio_data = converted
+            samples = to_samples(audio_data)
+
+        if channels == 1 and self.channels == 2:
+            stereo = array('h', bytes(len(samples) * 2 * self.sample_width))
+            stereo[0::2] = samples
+            stereo[1::2] = samples
+            samples = stereo
+        elif channels == 2 and self.channels == 1:
+            samples = array('h', [(left + right) >> 1 for left, right in zip(samples[0::2], samples[1::2])])
+        audio_data = from_samples(samples)
+
+        if audio_format.sample_rate != self.sample_rate:
+            if not self.can_convert(audio_format):
+                raise ValueError(f"Can't resample from {audio_format.sample_rate} Hz without audioop")
+            audio_data, state = audioop.ratecv(audio_data, self.sample_width, self.channels, audio_format.sample_rate, self.sample_rate, state)
+        return audio_data, state
@@ -0,0 +1,115 @@
+import math
+import subprocess
+from threading import Lock
+
+class AudioVolumeControl:
+    """
+    This class sets the volume of the sound card, through the ALSA mixer controls.
+    The controls are opened once, and kept. If pyalsaaudio is not available, amixer is used instead.
+    The volume is mapped like `amixer -M`, so a percentage sounds the same either way.
+    """
+
+    CONTROLS = ['Headphone', 'PCM', 'Speaker']
+
+    def __init__(self, log):
+        self.log = log
+        self.alsaaudio = False
+        self.mixers = None # The open mixer controls. None until they are first needed.
+        self.lock = Lock() # The volume is set from the audio loader and the volume timer threads.
+        self.import_alsaaudio()
+
+    def import_alsaaudio(self):
+        try:
+            import alsaaudio  # pylint: disable=import-outside-toplevel
+            self.alsaaudio = alsaaudio
+        except ModuleNotFoundError:
+            self.alsaaudio = False
+
+    def get_mixers(self):
+        """
+        This method opens the mixer controls the sound card has. Cards don't have all of them.
+        :return: a list of alsaaudio.Mixer objects
+        """
+        if self.mixers is None:
+            self.mixers = []
+            for control in self.CONTROLS:
+                try:
+                    self.mixers.append(self.alsaaudio.Mixer(control))
+                except self.alsaaudio.ALSAAudioError:
+                    pass
+        return self.mixers
+
+    def reset(self):
+        """
+        This method closes the mixer controls, so they are opened again next time. eg: if the sound card changed.
+        :return: Nothing is returned
+        """
+        for mixer in self.mixers or []:
+            mixer.close()
+        self.mixers = None
+
+    def set_volume(self, percent_value):
+        """
+        This method sets the volume on all the mixer controls.
+        :param percent_value: an integer between 0 and 100.
+        :return: True if the volume was set, False if not.
+        """
+        if not self.alsaaudio:
+            return self.set_volume_amixer(percent_value)
+
+        with self.lock:
+            mixers = self.get_mixers()
+            for mixer in mixers:
+                try:
+                    self.set_mixer_volume(mixer, percent_value)
+                except self.alsaaudio.ALSAAudioError as ex:
+                    self.log.log(f"Unable to set the volume of {mixer.mixer()}: {ex}")
+                    self.reset()
+                    return False
+            return bool(mixers)
+
+    def set_mixer_volume(self, mixer, percent_value):
+        """
+        This method sets the volume of one mixer control, mapped like `amixer -M` does.
+        :param mixer: the alsaaudio.Mixer
+        :param percent_value: an integer between 0 and 100.
+        :return: Nothing is returned
+        """
+        alsaaudio = self.alsaaudio
+        volume = percent_value / 100
+        try:
+            # The dB values are in 1/100 dB
+            min_db, max_db = mixer.getrange(units=alsaaudio.VOLUME_UNITS_DB)
+        except alsaaudio.ALSAAudioError:
+            # No dB range for this control, the percentage is linear
+            mixer.setvolume(percent_value, units=alsaaudio.VOLUME_UNITS_PERCENTAGE)
+            return
+
+        if max_db - min_db <= 2400:
+            # Small ranges are linear in dB
+            db_value = min_db + (max_db - min_db) * volume
+        elif volume == 0:
+            db_value = min_db
+        else:
+            # Larger ranges are mapped so the volume sounds linear to the ear
+            min_norm = 10 ** ((min_db - max_db) / 6000)
+            db_value = 6000 * math.log10(volume * (1 - min_norm) + min_norm) + max_db
+        mixer.setvolume(round(db_value), units=alsaaudio.VOLUME_UNITS_DB)
+
+    def set_volume_amixer(self, percent_value):
+        """
+        This method sets the volume with the amixer command, when pyalsaaudio is not available.
+        amixer fails for the controls the sound card doesn't have, so one control set is enough.
+        :param percent_value: an integer between 0 and 100.
+        :return: True if the volume was set on at least one control, False if not.
+        """
+        volume_set = False
+        for control in self.CONTROLS:
+            try:
+                subprocess.run(['amixer', '-M', 'set', control, f'{str(percent_value)}%'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+                volume_set = True
+            except subprocess.CalledProcessError:
+                pass
+            except FileNotFoundError:
+                return False
+        return volume_set
@@ -0,0 +1,174 @@
+"""
+The clock of the gate. The gate code reads the time and sleeps through this module, instead of the time module, so
+the clock can be replaced by a VirtualClock when the electronics are simulated:
+
+    import gate_clock
+    gate_clock.sleep(0.5)
+    started = gate_clock.monotonic()
+
+A VirtualClock can run faster than real time (eg speed=10 for 10x), or be stepped: with speed=0 the time only moves
+when advance() is called, and every sleep and timeout in the gate waits for it. This makes the dialing deterministic
+and fast, for tests and benchmarks.
+
+The audio stays on the real clock: the sound card plays the sounds in real time, whatever the speed of the gate.
+"""
+import time as _time
+from threading import Lock, Condition
+
+class GateClock:
+    """
+    The real clock.
+    """
+
+    speed = 1
+
+    def time(self):
+        return _time.time()
+
+    def monotonic(self):
+        return _time.monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            _time.sleep(seconds)
+
+    def wait(self, condition, timeout=None):
+        """
+        This method waits on a threading.Condition, like condition.wait(). The condition must be held.
+        :param timeout: the most seconds to wait, or None to wait until notified.
+        :return: False if the timeout expired, True if not.
+        """
+        return condition.wait(timeout)
+
+    def wait_for(self, condition, predicate, timeout=None):
+        """
+        This method waits on a threading.Condition until predicate is true, like condition.wait_for().
+        :return: the last value of predicate is returned. It's false if the timeout expired.
+        """
+        end_time = None
+        result = predicate()
+        while not result:
+            if timeout is not None:
+                if end_time is None:
+                    end_time = self.monotonic() + timeout
+                remaining = end_time - self.monotonic()
+                if remaining <= 0:
+                    break
+                self.wait(condition, remaining)
+            else:
+                self.wait(condition)
+            result = predicate()
+        return result
+
+    def wait_event(self, event, timeout=None):
+        """
+        This method waits for a threading.Event, like event.wait().
+        :return: True if the event is set, False if the timeout expired.
+        """
+        return event.wait(timeout)
+
+
+class VirtualClock(GateClock):
+    """
+    A clock for the simulated electronics, that runs faster than real time, or is stepped with advance().
+    """
+
+    EVENT_POLL_INTERVAL = 0.005 # In real seconds. A set Event doesn't notify the clock, so stepped waits poll for it.
+
+    def __init__(self, speed=0.0, start_time=None):
+        """
+        :param speed: how many virtual seconds pass in each real second. 0 stops the time, until advance() is called.
+        :param start_time: the virtual time() at the start, defaults to the real time.
+        """
+        self.speed = speed
+        self.lock = Lock()
+        self.changed = Condition(self.lock)     # Notified when the time is advanced
+        self.conditions = set()                 # The conditions waited on, to notify when the time is advanced
+
+        self.real_start = _time.monotonic()
+        self.monotonic_start = self.real_start
+        self.time_offset = (_time.time() if start_time is None else start_time) - self.monotonic_start
+        self.advanced = 0
+
+    def monotonic(self):
+        return self.monotonic_start + (_time.monotonic() - self.real_start) * self.speed + self.advanced
+
+    def time(self):
+        return self.monotonic() + self.time_offset
+
+    def advance(self, seconds):
+        """
+        This method moves the time forward, and wakes up the sleeps and timeouts that are due.
+        :return: Nothing is returned
+        """
+        with self.lock:
+            self.advanced += seconds
+            self.changed.notify_all()
+            conditions = list(self.conditions)
+        for condition in conditions:
+            with condition:
+                condition.notify_all()
+
+    def get_real_timeout(self, seconds):
+        # How long a timeout in virtual seconds takes in real time. None waits until the time is advanced.
+        if not self.speed:
+            return None
+        return max(seconds, 0) / self.speed
+
+    def sleep(self, seconds):
+        if seconds <= 0:
+            return
+        end_time = self.monotonic() + seconds
+        with self.lock:
+            remaining = seconds
+            while remaining > 0:
+                self.changed.wait(self.get_real_timeout(remaining))
+                remaining = end_time - self.monotonic()
+
+    def wait(self, condition, timeout=None):
+        with self.lock:
+            self.conditions.add(condition)
+        try:
+            if timeout is None:
+                return condition.wait()
+            end_time = self.monotonic() + timeout
+            condition.wait(self.get_real_timeout(timeout))
+            return self.monotonic() < end_time
+        finally:
+            with self.lock:
+                self.conditions.discard(condition)
+
+    def wait_event(self, event, timeout=None):
+        if timeout is None:
+            return event.wait()
+        end_time = self.monotonic() + timeout
+        while not event.is_set():
+            remaining = end_time - self.monotonic()
+            if remaining <= 0:
+                return False
+            real_timeout = self.get_real_timeout(remaining)
+            event.wait(self.EVENT_POLL_INTERVAL if real_timeout is None else real_timeout)
+        return True
+
+
+_clock = GateClock()
+
+def get_clock():
+    return _clock
+
+def set_clock(clock):
+    """
+    This function replaces the clock of the gate, eg with a VirtualClock. Set it before starting the gate.
+    :return: Nothing is returned
+    """
+    global _clock # pylint: disable=global-statement
+    _clock = clock
+
+def time():
+    return _clock.time()
+
+def monotonic():
+    return _clock.monotonic()
+
+def sleep(seconds):
+    _clock.sleep(seconds)
@@ -0,0 +1,137 @@
+from collections import deque
+from threading import Condition
+from gate_clock import monotonic, get_clock
+
+class InputEvent: # pylint: disable=too-few-public-methods
+    """
+    One input for the gate, eg a DHD key press. The time is from gate_clock.monotonic(), when the event was published.
+    """
+
+    __slots__ = ('type', 'value', 'source', 'time')
+
+    def __init__(self, event_type, value=None, source=None):
+        self.type = event_type
+        self.value = value
+        self.source = source
+        self.time = monotonic()
+
+    def __repr__(self):
+        return f"InputEvent({self.type!r}, {self.value!r}, source={self.source!r})"
+
+
+class InputEventBus:
+    """
+    This class passes the inputs to the main loop: DHD and keyboard presses, web requests and subspace messages.
+    Any thread can publish an event. The main loop waits on the bus, and wakes up as soon as an event is published.
+    The time from publishing an event to the main loop reacting to it is measured.
+    """
+
+    # The event types
+    SYMBOL = 'symbol'                                  # A symbol was pressed on the DHD. The value is the symbol number.
+    CENTER_BUTTON = 'center_button'                    # The center button was pressed on the DHD.
+    ABORT_DIALING = 'abort_dialing'                    # Stop dialing, eg from the web interface.
+    SHUTDOWN = 'shutdown'                              # Shut the gate down, back to idle.
+    INCOMING_SYMBOLS = 'incoming_symbols'              # A remote gate dialed symbols. The value is the list of symbols.
+    INCOMING_CENTER_BUTTON = 'incoming_center_button'  # A remote gate pressed the center button. The value is its IP.
+    WAKE = 'wake'                                      # Nothing to do, but the main loop should check its state.
+
+    LATENCY_SAMPLES = 100
+
+    def __init__(self):
+        self.condition = Condition()
+        self.events = deque()
+
+        self.latencies = deque(maxlen=self.LATENCY_SAMPLES) # The latest reaction times, in seconds
+        self.reactions = 0
+        self.max_latency = 0
+
+    def publish(self, event_type, value=None, source=None):
+        """
+        This method queues an event, and wakes up the main loop.
+        :param event_type: one of the event types, eg InputEventBus.SYMBOL
+        :param value: the value of the event, eg the symbol number
+        :param source: where the event comes from: "keyboard", "web", "subspace"...
+        :return: the InputEvent is returned
+        """
+        event = InputEvent(event_type, value, source)
+        with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+        return event
+
+    def wait(self, timeout=None):
+        """
+        This method waits until an event is queued.
+        :param timeout: the most seconds to wait, or None to wait forever.
+        :return: True if there is an event, False if the timeout expired.
+        """
+        with self.condition:
+            return get_clock().wait_for(self.condition, lambda: self.events, timeout)
+
+    def get(self, timeout=None):
+        """
+        This method takes the oldest event, and waits for one if there are none.
+        :param timeout: the most seconds to wait. 0 doesn't wait, None waits forever.
+        :return: the InputEvent is returned, or None if the timeout expired.
+        """
+        with self.condition:
+            if not get_clock().wait_for(self.condition, lambda: self.events, timeout):
+                return None
+            return self.events.popleft()
+
+    def get_all(self):
+        """
+        This method takes all the queued events, without waiting.
+        :return: a list of InputEvents, oldest first.
+        """
+        with self.condition:
+            events = list(self.events)
+            self.events.clear()
+            return events
+
+    def discard(self, *event_types):
+        """
+        This method drops the queued events of some types, without handling them.
+        :param event_types: the event types to drop, eg InputEventBus.SYMBOL
+        :return: the number of dropped events is returned
+        """
+        with self.condition:
+            kept = [event for event in self.events if event.type not in event_types]
+            dropped = len(self.events) - len(kept)
+            self.events = deque(kept)
+            return dropped
+
+    def record_reaction(self, event):
+        """
+        This method records the time it took for the main loop to react to an event.
+        :param event: the InputEvent the main loop reacted to
+        :return: the latency in seconds is returned
+        """
+        latency = monotonic() - event.time
+        self.latencies.append(latency)
+        self.reactions += 1
+        self.max_latency = max(self.max_latency, latency)
+        return latency
+
+    def reset_statistics(self):
+        self.latencies.clear()
+        self.reactions = 0
+        self.max_latency = 0
+
+    def get_latency_statistics(self):
+        """
+        This method summarizes the press-to-reaction latency.
+        :return: a dict, with the times in milliseconds
+        """
+        latencies = list(self.latencies)
+        if not latencies:
+            return { "reactions": 0 }
+
+        latencies.sort()
+        return {
+            "reactions": self.reactions,
+            "last_ms": round(self.latencies[-1] * 1000, 2),
+            "average_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+            "median_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+            "max_ms": round(self.max_latency * 1000, 2)
+        }
@@ -3,6 +3,7 @@ from threading import Thread
 import tty
 import termios
 import subspace_messages
+from input_event_bus import InputEventBus
 
 class KeyboardManager:
 
@@ -16,6 +17,10 @@ class KeyboardManager:
         self.addr_manager = stargate.addr_manager
         self.address_book = stargate.addr_manager.get_book()
         self.symbol_manager = stargate.symbol_manager
+        self.input_events = stargate.input_events
+
+        # The DHD sends its key presses as a keyboard
+        self.input_source = "dhd" if stargate.dialer.type == "DHDv2" else "keyboard"
 
         self.dhd_test_enable = False
         self.dhd_test_active_buttons = []
@@ -116,23 +121,22 @@ class KeyboardManager:
             self.log.log(f'DHD Test: Pressed Key {key} --> Symbol {symbol_number}')
         except KeyError:
             if key == self.center_button_key:
-                self.log.log(f'DHD Test: Pressed Center Button {key} --> Symbol {symbol_number}')
                 symbol_number = 0
+                self.log.log(f'DHD Test: Pressed Center Button {key} --> Symbol {symbol_number}')
             else:
                 self.log.log(f'DHD Test: Key NOT RECOGNIZED {key}')
+                return
 
         if symbol_number not in self.dhd_test_active_buttons:
             self.dhd_test_active_buttons.append(symbol_number)
             if symbol_number == 0:
-                self.stargate.dialer.hardware.set_pixel(symbol_number, 255, 0, 0) # TODO: Use colors in config
-                self.stargate.dialer.hardware.latch()
+                self.stargate.dialer.hardware.stage_pixel(symbol_number, 255, 0, 0) # TODO: Use colors in config
             else:
-                self.stargate.dialer.hardware.set_pixel(symbol_number, 250, 117, 0) # TODO: Use colors in config
-                self.stargate.dialer.hardware.latch()
+                self.stargate.dialer.hardware.stage_pixel(symbol_number, 250, 117, 0) # TODO: Use colors in config
         else:
             self.dhd_test_active_buttons.remove(symbol_number)
-            self.stargate.dialer.hardware.clear_pixel(symbol_number)
-            self.stargate.dialer.hardware.latch()
+            self.stargate.dialer.hardware.stage_pixel(symbol_number, 0, 0, 0)
+        self.stargate.dialer.hardware.flush()
 
     def keypress_handler( self, key ):
         """
@@ -149,46 +153,49 @@ class KeyboardManager:
             self.log.log("Abort Requested: Shutting down any active wormholes, stopping the gate.")
             self.stargate.wormhole_active = False # Shutdown any open wormholes (particularly if turned on via web interface)
             self.stargate.running = False  # Stop the stargate object from running.
+            self.input_events.publish(InputEventBus.WAKE, source=self.input_source) # Don't wait for the main loop to notice
             return
 
         # Center Button
         if key == self.center_button_key:
             symbol_number = 'centre_button_outgoing'
             self.log.log(f'key: {key} -> symbol: {symbol_number} CENTER')
-            self.queue_center_button()
+            self.queue_center_button(self.input_source)
             return
 
         # Try to convert other key presses to symbol_number
         try:
             symbol_number = self.symbol_manager.get_symbol_key_map()[key]
-            self.queue_symbol(symbol_number)
+            self.queue_symbol(symbol_number, self.input_source)
             return
         except KeyError:
             # The key pressed is not a symbol
             self.log.log(f'Unknown key: {key}')
 
-    def queue_symbol(self, symbol_number):
+    def queue_symbol(self, symbol_number, source="keyboard"):
+        """
+        This method passes a symbol press to the main loop to dial. The main loop decides if the symbol can be
+        dialed, from the current state, and lights it on the DHD.
+        :param symbol_number: the symbol number
+        :param source: where the press comes from: "keyboard", "dhd" or "web"
+        :return: Nothing is returned
+        """
         self.audio.play_random_clip("DHD")
-        if symbol_number != 'unknown' and symbol_number not in self.stargate.address_buffer_outgoing:
-            # If we have not yet activated the centre_button
-            if not (self.stargate.centre_button_outgoing or self.stargate.centre_button_incoming):
-                self.stargate.dialer.hardware.set_symbol_on( symbol_number ) # Light this symbol on the DHD
-
-                # Append the symbol to the outgoing address buffer
-                self.stargate.address_buffer_outgoing.append(symbol_number)
-                self.log.log(f'address_buffer_outgoing: {self.stargate.address_buffer_outgoing}') # Log the address_buffer
+        if symbol_number != 'unknown':
+            self.input_events.publish(InputEventBus.SYMBOL, symbol_number, source)
 
-    def queue_center_button(self):
+    def queue_center_button(self, source="keyboard"):
         self.audio.play_random_clip("DHD")
-        # If we are dialing
-        if len(self.stargate.address_buffer_outgoing) > 0 and not self.stargate.wormhole_active:
-            self.stargate.centre_button_outgoing = True
-            self.stargate.dialer.hardware.set_center_on() # Activate the centre_button_outgoing light
+        state = self.stargate.state.get()
+        # If we are dialing, the main loop decides if the center button can be activated, and lights it.
+        if not state.wormhole_active:
+            self.input_events.publish(InputEventBus.CENTER_BUTTON, source=source)
         # If an outgoing wormhole is established
-        if self.stargate.wormhole_active == 'outgoing':
+        if state.wormhole_active == 'outgoing':
+            address = list(state.address_buffer_outgoing)
             # TODO: We shouldn't be doing subspace-y stuff in the keyboard manager
-            if self.addr_manager.is_fan_made_stargate(self.stargate.address_buffer_outgoing) \
-             and self.stargate.fan_gate_online_status: # If we are connected to a fan_gate
-                self.stargate.subspace_client.send_to_remote_stargate(self.addr_manager.get_ip_from_stargate_address(self.stargate.address_buffer_outgoing), subspace_messages.DIAL_CENTER_INCOMING)
-            if not self.stargate.black_hole: # If we did not dial the black hole.
+            if self.addr_manager.is_fan_made_stargate(address) \
+             and state.fan_gate_online_status: # If we are connected to a fan_gate
+                self.stargate.subspace_client.send_to_remote_stargate(self.addr_manager.get_ip_from_stargate_address(address), subspace_messages.DIAL_CENTER_INCOMING)
+            if not state.black_hole: # If we did not dial the black hole.
                 self.stargate.wormhole_active = False # cancel outgoing wormhole
@@ -1,50 +1,144 @@
-from os import listdir, path
+from os import path
 from random import choice
+from threading import Thread, Lock, Timer
+from time import time
 import subprocess
 import simpleaudio as sa
+from stargate_config import StargateConfig
+from audio_clip_library import AudioClipLibrary
+from audio_mixer import AudioMixer
+from audio_volume_control import AudioVolumeControl
 
-class StargateAudio:
+class StargateAudio: # pylint: disable=too-many-public-methods
+
+    # How long to wait for more volume changes before updating the sound card and the config
+    VOLUME_UPDATE_DELAY = 0.3
 
     def __init__(self, app, base_path):
 
+        start_time = time()
         self.log = app.log
         self.cfg = app.cfg
         self.galaxy_path = app.galaxy_path
 
         self.sound_fx_root = base_path + "/soundfx/" + self.galaxy_path # No trailing slash
 
-        # Make ready the sound effects
+        # The sound effects. They are loaded in the background by load_sounds(), in this order. The large ones come last.
         self.sounds = {}
-        self.sounds['rolling_ring'] = { 'file': sa.WaveObject.from_wave_file(str(self.sound_fx_root + "/roll.wav")) }
+        self.sounds['chevron_1'] = { 'path': "/chev_usual_1.wav" }
+        self.sounds['chevron_2'] = { 'path': "/chev_usual_2.wav" }
+        self.sounds['chevron_3'] = { 'path': "/chev_usual_3.wav" }
+        self.sounds['chevron_4'] = { 'path': "/chev_usual_4.wav" }
+        self.sounds['chevron_5'] = { 'path': "/chev_usual_5.wav" }
+        self.sounds['chevron_6'] = { 'path': "/chev_usual_6.wav" }
+        self.sounds['chevron_7'] = { 'path': "/chev_usual_7.wav" }
+        self.incoming_chevron_sounds = [ 'chevron_4', 'chevron_5', 'chevron_6', 'chevron_7' ]
 
-        self.sounds['dialing_cancel'] = { 'file': self.init_wav_file( "/cancel.wav" ) }
-        self.sounds['dialing_fail'] =   { 'file': self.init_wav_file( "/dial_fail_sg1.wav" ) }
+        self.sounds['rolling_ring'] = { 'path': "/roll.wav", 'loop': True }
 
-        self.sounds['wormhole_open'] =        { 'file': self.init_wav_file( "/eh_usual_open.wav" ) }
-        self.sounds['wormhole_established'] = { 'file': self.init_wav_file( "/wormhole-loop.wav" ) }
-        self.sounds['wormhole_close'] =       { 'file': self.init_wav_file( "/eh_usual_close.wav" ) }
+        self.sounds['dialing_cancel'] = { 'path': "/cancel.wav" }
+        self.sounds['dialing_fail'] =   { 'path': "/dial_fail_sg1.wav" }
 
-        self.sounds['chevron_1'] = { 'file': self.init_wav_file( "/chev_usual_1.wav" ) }
-        self.sounds['chevron_2'] = { 'file': self.init_wav_file( "/chev_usual_2.wav" ) }
-        self.sounds['chevron_3'] = { 'file': self.init_wav_file( "/chev_usual_3.wav" ) }
-        self.sounds['chevron_4'] = { 'file': self.init_wav_file( "/chev_usual_4.wav" ) }
-        self.sounds['chevron_5'] = { 'file': self.init_wav_file( "/chev_usual_5.wav" ) }
-        self.sounds['chevron_6'] = { 'file': self.init_wav_file( "/chev_usual_6.wav" ) }
-        self.sounds['chevron_7'] = { 'file': self.init_wav_file( "/chev_usual_7.wav" ) }
-        self.incoming_chevron_sounds = [ self.sounds['chevron_4'],  self.sounds['chevron_5'],  self.sounds['chevron_6'],  self.sounds['chevron_7'] ]
+        self.sounds['wormhole_open'] =        { 'path': "/eh_usual_open.wav" }
+        self.sounds['wormhole_close'] =       { 'path': "/eh_usual_close.wav" }
+        self.sounds['wormhole_established'] = { 'path': "/wormhole-loop.wav", 'loop': True }
+        self.sounds_lock = Lock()
 
         self.random_clip = None
 
+        # Clips larger than this are streamed, instead of being loaded into memory.
+        self.stream_threshold = self.cfg.get('audio_stream_threshold_kb') * 1024
+
+        # The random clips are indexed and kept in memory, so a DHD key press doesn't have to read the SD card.
+        self.clip_library = AudioClipLibrary(self.sound_fx_root, self.cfg.get('audio_clip_cache_kb') * 1024, self.log)
+
+        # The audio device detected on the last boot
+        self.device_store = StargateConfig(base_path, "audio_devices", self.galaxy_path)
+        self.device_store.set_log(self.log)
+        self.device_store.load()
+
         # Check/set the correct USB audio adapter. This is necessary because different raspberries detects the USB audio adapter differently.
         self.set_correct_audio_output_device()
 
+        # Play all the sounds through one persistent output stream, if we can.
+        # If the mixer stops (eg the audio device is gone), the sounds are played through simpleaudio again.
+        self.mixer = AudioMixer(self.log)
+        if self.cfg.get('audio_mixer_enable'):
+            self.mixer.start()
+
+        # Set the volume and load the clips in the background, so they don't hold up the startup.
         self.volume = self.cfg.get('audio_volume')
-        self.set_volume(self.volume)
+        self.volume_control = AudioVolumeControl(self.log)
+        self.volume_lock = Lock()
+        self.volume_timer = None
+        self.loader_thread = Thread(name="stargate-audio-loader", target=self.load_sounds, daemon=True)
+        self.loader_thread.start()
+
+        self.log.log(f"Audio initialized in {time() - start_time:.2f} seconds")
+
+    def load_sounds(self):
+        """
+        This method sets the volume, and loads all the sound effects and the DHD clips. It runs in the loader thread.
+        :return: Nothing is returned
+        """
+        start_time = time()
+        self.apply_volume(self.volume)
+
+        for clip_name, sound in self.sounds.items():
+            try:
+                if self.is_streamed(path.getsize(self.sound_fx_root + sound['path'])):
+                    continue
+                self.get_sound_file(clip_name)
+            except Exception as ex: # pylint: disable=broad-except
+                self.log.log(f"Unable to load the {clip_name} sound: {ex}")
+        self.clip_library.preload("DHD")
+
+        self.log.log(f"Audio clips loaded in {time() - start_time:.2f} seconds")
+
+    def is_streamed(self, file_size):
+        """
+        This method checks if a clip is large enough to be streamed from the SD card, instead of loaded into memory.
+        Streaming needs the audio mixer.
+        :param file_size: the size of the WAV file in bytes
+        :return: True to stream the clip, False to load it.
+        """
+        return self.mixer.is_running() and file_size > self.stream_threshold
+
+    def get_sound_file(self, clip_name):
+        """
+        This method returns the WaveObject of a sound effect. If the loader thread hasn't loaded it yet, it's loaded now.
+        :param clip_name: the name of the sound, eg: 'chevron_1'
+        :return: the simpleaudio WaveObject is returned
+        """
+        sound = self.sounds[clip_name]
+        if 'file' not in sound:
+            with self.sounds_lock:
+                if 'file' not in sound:
+                    sound['file'] = self.init_wav_file(sound['path'])
+        return sound['file']
+
+    def play(self, wave_object, loop=False, delay=0.0):
+        """
+        This method starts playing a clip, through the mixer if it's running.
+        Looping and delay are only available with the mixer. Without it, the clip is played once, right away.
+        :param wave_object: the clip as a simpleaudio WaveObject
+        :param loop: True to play the clip again and again, until it is stopped.
+        :param delay: how long to wait before the clip starts, in seconds.
+        :return: the play object is returned. It has is_playing(), stop() and wait_done().
+        """
+        if self.mixer.is_running() and self.mixer.can_convert(wave_object):
+            return self.mixer.play(wave_object, loop=loop, delay=delay)
+        return wave_object.play()
 
-    def sound_start(self, clip_name):
+    def sound_start(self, clip_name, delay=0.0):
         if self.cfg.get('audio_enable'):
             try:
-                self.sounds[clip_name]['obj'] = self.sounds[clip_name]['file'].play()
+                sound = self.sounds[clip_name]
+                file_path = self.sound_fx_root + sound['path']
+                if self.is_streamed(path.getsize(file_path)):
+                    sound['obj'] = self.mixer.play_stream(file_path, loop=sound.get('loop', False), delay=delay)
+                else:
+                    sound['obj'] = self.play(self.get_sound_file(clip_name), sound.get('loop', False), delay)
             except: #pylint: disable=bare-except
                 self.log.log("Failed to start audio file - is the USB Audio adapter installed?")
 
@@ -63,7 +157,7 @@ class StargateAudio:
     def incoming_chevron(self):
         if self.cfg.get('audio_enable'):
             try:
-                choice(self.incoming_chevron_sounds)['file'].play()
+                self.play(self.get_sound_file(choice(self.incoming_chevron_sounds)))
             except: #pylint: disable=bare-except
                 self.log.log("Failed to start audio file - is the USB Audio adapter installed?")
 
@@ -82,17 +176,16 @@ class StargateAudio:
         if self.random_clip_is_playing():
             return
 
-        path_to_folder = self.sound_fx_root + "/" + directory
-        rand_file = choice(listdir(path_to_folder))
-        filepath =  path.join(path_to_folder, rand_file)
-
-        while not path.isfile(filepath): # If the rand_file is not a file. (If it's a directory)
-            rand_file = choice(listdir(path_to_folder)) # Choose a new one.
-            filepath = path.join(path_to_folder, rand_file) # Update Filepath
-        clip = sa.WaveObject.from_wave_file(path_to_folder + '/' + rand_file)
+        clip = self.clip_library.choose_clip(directory)
+        if clip is None:
+            self.log.log(f"No audio clips found in {directory}")
+            return
 
         try:
-            self.random_clip = clip.play()
+            if self.is_streamed(clip[2]):
+                self.random_clip = self.mixer.play_stream(clip[0])
+            else:
+                self.random_clip = self.play(self.clip_library.get_wave_object(clip))
         except: #pylint: disable=bare-except
             self.log.log("Failed to start audio file - is the USB Audio adapter installed?")
 
@@ -122,9 +215,38 @@ class StargateAudio:
             for line in audio_devices:
                 if 'USB' in line:
                     return line[5]
-                return 1
+            return '1'
         except FileNotFoundError:
-            return 1
+            return '1'
+
+    @staticmethod
+    def get_audio_cards():
+        """
+        This function reads the list of sound cards from the kernel. It's much quicker than running aplay.
+        :return: the list as a string, or None if it's not available.
+        """
+        try:
+            with open('/proc/asound/cards', 'r', encoding="utf8") as cards_file:
+                return cards_file.read()
+        except OSError:
+            return None
+
+    def get_cached_usb_audio_device_card_number(self):
+        """
+        This function gets the card number for the USB audio adapter. If the sound cards are the same as on the last
+        boot, the card number from the last boot is used, instead of running aplay.
+        :return: the card number is returned as a string
+        """
+        cards = self.get_audio_cards()
+        if cards is not None and cards == self.device_store.get('audio_cards'):
+            return self.device_store.get('usb_card_number')
+
+        card_number = self.get_usb_audio_device_card_number()
+        if cards is not None:
+            self.device_store.set_non_persistent('audio_cards', cards)
+            self.device_store.set_non_persistent('usb_card_number', card_number)
+            self.device_store.save()
+        return card_number
 
     @staticmethod
     def get_active_audio_card_number():
@@ -153,11 +275,12 @@ class StargateAudio:
 
         try:
             # If the wrong card is set in the alsa.conf file
-            if self.get_usb_audio_device_card_number() != self.get_active_audio_card_number():
-                self.log.log(f'Updating the alsa.conf file with card {self.get_usb_audio_device_card_number()}')
+            usb_card_number = self.get_cached_usb_audio_device_card_number()
+            if usb_card_number != self.get_active_audio_card_number():
+                self.log.log(f'Updating the alsa.conf file with card {usb_card_number}')
 
-                ctl = 'defaults.ctl.card ' + str(self.get_usb_audio_device_card_number())
-                pcm = 'defaults.pcm.card ' + str(self.get_usb_audio_device_card_number())
+                ctl = 'defaults.ctl.card ' + str(usb_card_number)
+                pcm = 'defaults.pcm.card ' + str(usb_card_number)
                 # replace the lines in the alsa.conf file.
                 subprocess.run(['sudo', 'sed', '-i', f"/defaults.ctl.card /c\{ctl}", '/usr/share/alsa/alsa.conf'], check=False) #TODO: Check should be true
                 subprocess.run(['sudo', 'sed', '-i', f"/defaults.pcm.card /c\{pcm}", '/usr/share/alsa/alsa.conf'], check=False) #TODO: Check should be true
@@ -167,20 +290,40 @@ class StargateAudio:
     def set_volume(self, percent_value):
         """
         Attempt to set the audio volume level according to the percent_value.
+        Quick repeated changes (eg volume_up presses) are coalesced: the sound card and the config file are
+        only updated once the volume stops changing for VOLUME_UPDATE_DELAY seconds.
         :param percent_value: an integer between 0 and 100. 65 seems good.
         :return: Nothing is returned.
         """
+        with self.volume_lock:
+            self.volume = percent_value
+            if self.volume_timer is not None:
+                self.volume_timer.cancel()
+            self.volume_timer = Timer(self.VOLUME_UPDATE_DELAY, self.update_volume)
+            self.volume_timer.daemon = True
+            self.volume_timer.start()
+
+    def update_volume(self):
+        """
+        This method applies the volume to the sound card, and saves it in the config. It runs in the volume timer thread.
+        :return: Nothing is returned.
+        """
+        with self.volume_lock:
+            self.volume_timer = None
+            volume = self.volume
 
-        # Update the config
-        self.volume = percent_value
-        self.cfg.set("audio_volume", self.volume)
+        self.apply_volume(volume)
+        self.cfg.set("audio_volume", volume)
 
-        try:
-            subprocess.run(['amixer', '-M', 'set', 'Headphone', f'{str(self.volume)}%'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False) #TODO: Check should be true
-            subprocess.run(['amixer', '-M', 'set', 'PCM', f'{str(self.volume)}%'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False) #TODO: Check should be true
-            subprocess.run(['amixer', '-M', 'set', 'Speaker', f'{str(self.volume)}%'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False) #TODO: Check should be true
-            self.log.log(f'Audio set to {self.volume}%')
-        except (FileNotFoundError, subprocess.CalledProcessError):
+    def apply_volume(self, volume):
+        """
+        Attempt to set the audio volume level of the sound card.
+        :param volume: an integer between 0 and 100.
+        :return: Nothing is returned.
+        """
+        if self.volume_control.set_volume(volume):
+            self.log.log(f'Audio set to {volume}%')
+        else:
             self.log.log('Unable to set the volume. You can set the volume level manually by running the alsamixer command.')
 
     def volume_up(self, step=5):
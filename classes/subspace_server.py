@@ -1,9 +1,10 @@
 import socket
 from threading import Thread
-from time import sleep
 from icmplib import ping
 
+from gate_clock import sleep
 import subspace_messages
+from input_event_bus import InputEventBus
 
 class SubspaceServer:
     """
@@ -109,16 +110,13 @@ class SubspaceServer:
                         return
 
                     # If a wormhole is already established, and we are receiving DIAL_CENTER_INCOMING from the same gate.
-                    if self.stargate.wormhole_active and addr[0] == self.stargate.fan_gate_incoming_ip:
-                        self.stargate.centre_button_incoming = False
-                        self.stargate.wormhole_active = False
+                    state = self.stargate.state.get()
+                    if state.wormhole_active and addr[0] == state.fan_gate_incoming_ip:
+                        self.stargate.state.update(centre_button_incoming=False, wormhole_active=False)
                     # If we are dialling (no wormhole established)
                     else:
                         self.log.log("Received Center Button Incoming")
-                        self.stargate.centre_button_incoming = True
-                        # If there are not already a saved IP, or if we dialed an none fan_gate
-                        if not self.stargate.fan_gate_incoming_ip:
-                            self.stargate.fan_gate_incoming_ip = addr[0] # Save the IO address when establishing a wormhole.
+                        self.stargate.input_events.publish(InputEventBus.INCOMING_CENTER_BUTTON, addr[0], "subspace")
 
                     planet_name = self.addr_manager.get_planet_name_from_ip(addr[0])
                     if self.logging == "verbose":
@@ -127,9 +125,10 @@ class SubspaceServer:
                 # If we are asked about the status (wormhole already active from a different gate or actively dialing out)
                 elif msg == subspace_messages.CHECK_STATUS:
                     # If the wormhole is already established, or if we are dialing out.
-                    if self.stargate.wormhole_active or len(self.stargate.address_buffer_outgoing) > 0:
+                    state = self.stargate.state.get()
+                    if state.wormhole_active or len(state.address_buffer_outgoing) > 0:
                         # If the established wormhole is from the remote gate
-                        if addr[0] == self.stargate.fan_gate_incoming_ip:
+                        if addr[0] == state.fan_gate_incoming_ip:
                             status = False
                         else:
                             status = True
@@ -150,9 +149,7 @@ class SubspaceServer:
                         return
 
                     address = self.addr_manager.is_valid(msg)
-                    for symbol in address:
-                        if not symbol in self.stargate.address_buffer_incoming:
-                            self.stargate.address_buffer_incoming.append(symbol)
+                    self.stargate.input_events.publish(InputEventBus.INCOMING_SYMBOLS, list(address), "subspace")
 
                     planet_name = self.addr_manager.get_planet_name_from_ip(addr[0])
                     if self.logging == "verbose":
@@ -0,0 +1,171 @@
+import heapq
+from itertools import count
+from threading import Thread, Condition, Event, Lock
+from gate_clock import monotonic, get_clock
+
+class Timer: # pylint: disable=too-few-public-methods
+    """
+    A callback scheduled on the TimerWheel. It can be cancelled until it runs.
+    """
+
+    __slots__ = ('due_time', 'callback', 'args', 'cancelled')
+
+    def __init__(self, due_time, callback, args):
+        self.due_time = due_time
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerSequence:
+    """
+    A sequence of timed steps, scheduled together on the TimerWheel. eg: the motor and LED steps of a chevron.
+    Steps can be named, so the caller can wait for a milestone (eg "locked") instead of the whole sequence.
+    A step runs under the lock of its sequence, so once cancel() returns, no step is running and none will run.
+    """
+
+    def __init__(self):
+        self.timers = []
+        self.milestones = {}
+        self.done = Event()
+        self.lock = Lock()
+        self.cancelled = False
+
+    def wait(self, milestone=None, timeout=None):
+        """
+        This method waits until the sequence, or one of its milestones, is done.
+        :param milestone: the name of the step to wait for, or None to wait for the whole sequence
+        :param timeout: the most seconds to wait, or None to wait forever.
+        :return: True if it's done, False if the timeout expired.
+        """
+        event = self.milestones[milestone] if milestone else self.done
+        return get_clock().wait_event(event, timeout)
+
+    def is_done(self):
+        return self.done.is_set()
+
+    def cancel(self):
+        """
+        This method cancels the steps that have not run yet. The sequence is considered done.
+        If a step is running, this waits until it's done.
+        :return: Nothing is returned
+        """
+        with self.lock:
+            self.cancelled = True
+            for timer in self.timers:
+                timer.cancel()
+        for event in self.milestones.values():
+            event.set()
+        self.done.set()
+
+
+class TimerWheel:
+    """
+    This class runs timed callbacks from a single shared thread, so timed hardware effects (chevrons, ...) can overlap
+    without a thread, or a blocking sleep, each.
+    The timers are kept in a heap ordered by due time, and the thread sleeps until the next one is due. It doesn't
+    tick while there is nothing to do.
+    The callbacks should be short. They run one at a time, in due time order.
+    """
+
+    def __init__(self, log, name="stargate-timer-wheel"):
+        self.log = log
+        self.name = name
+        self.condition = Condition()
+        self.timers = [] # A heap of (due_time, sequence number, Timer)
+        self.counter = count()
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def call_at(self, due_time, callback, *args):
+        """
+        This method schedules a callback.
+        :param due_time: when to call it, as a gate_clock.monotonic() value
+        :param callback: the function to call
+        :return: the Timer is returned, to cancel it.
+        """
+        if not self.running:
+            self.start()
+
+        timer = Timer(due_time, callback, args)
+        with self.condition:
+            heapq.heappush(self.timers, (due_time, next(self.counter), timer))
+            # Wake up the thread if this timer is now the next one due
+            if self.timers[0][2] is timer:
+                self.condition.notify_all()
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(monotonic() + delay, callback, *args)
+
+    def schedule_sequence(self, steps, start_time=None):
+        """
+        This method schedules a sequence of steps.
+        :param steps: a list of (offset in seconds, callback, milestone name or None) tuples. The callback can be None
+            for a step that is only a milestone.
+        :param start_time: when the sequence starts, as a gate_clock.monotonic() value. Defaults to now.
+        :return: the TimerSequence is returned
+        """
+        if start_time is None:
+            start_time = monotonic()
+
+        sequence = TimerSequence()
+        last_offset = 0
+        for offset, callback, milestone in steps:
+            if milestone:
+                sequence.milestones[milestone] = Event()
+            sequence.timers.append(self.call_at(start_time + offset, self.run_step, sequence, callback, milestone))
+            last_offset = max(last_offset, offset)
+        sequence.timers.append(self.call_at(start_time + last_offset, sequence.done.set))
+        return sequence
+
+    def run_step(self, sequence, callback, milestone):
+        try:
+            # The sequence may have been cancelled since the wheel popped this step
+            with sequence.lock:
+                if callback and not sequence.cancelled:
+                    callback()
+        finally:
+            if milestone:
+                sequence.milestones[milestone].set()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    if not self.timers:
+                        get_clock().wait(self.condition)
+                        continue
+                    delay = self.timers[0][0] - monotonic()
+                    if delay <= 0:
+                        break
+                    get_clock().wait(self.condition, delay)
+                if not self.running:
+                    return
+                timer = heapq.heappop(self.timers)[2]
+
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception as ex: # pylint: disable=broad-except
+                self.log.log(f"Timer callback {getattr(timer.callback, '__name__', timer.callback)} failed: {ex}")
@@ -1,10 +1,11 @@
 import os
 import json
-from time import sleep
 import urllib.parse
 import collections
 import platform
 from http.server import SimpleHTTPRequestHandler
+from gate_clock import sleep
+from input_event_bus import InputEventBus
 
 class StargateWebServer(SimpleHTTPRequestHandler):
 
@@ -46,21 +47,25 @@ class StargateWebServer(SimpleHTTPRequestHandler):
                 data = self.stargate.addr_manager.get_book().get_local_address()
 
             elif request_path == "/get/dialing_status":
+                state = self.stargate.state.get() # One consistent snapshot of the gate state
                 data = {
                     "gate_name":                self.stargate.addr_manager.get_book().get_local_gate_name(),
                     "local_address":            self.stargate.addr_manager.get_book().get_local_address(),
-                    "address_buffer_outgoing":  self.stargate.address_buffer_outgoing,
-                    "locked_chevrons_outgoing": self.stargate.locked_chevrons_outgoing,
-                    "address_buffer_incoming":  self.stargate.address_buffer_incoming,
-                    "locked_chevrons_incoming": self.stargate.locked_chevrons_incoming,
-                    "wormhole_active":          self.stargate.wormhole_active,
-                    "black_hole_connected":     self.stargate.black_hole,
-                    "connected_planet":         self.stargate.connected_planet_name,
+                    "address_buffer_outgoing":  list(state.address_buffer_outgoing),
+                    "locked_chevrons_outgoing": state.locked_chevrons_outgoing,
+                    "address_buffer_incoming":  list(state.address_buffer_incoming),
+                    "locked_chevrons_incoming": state.locked_chevrons_incoming,
+                    "wormhole_active":          state.wormhole_active,
+                    "state_version":            state.version,
+                    "phase":                    self.stargate.phase.value,
+                    "black_hole_connected":     state.black_hole,
+                    "connected_planet":         state.connected_planet_name,
                     "wormhole_open_time":       self.stargate.wh_manager.open_time,
                     "wormhole_max_time":        self.stargate.wh_manager.wormhole_max_time,
                     "wormhole_time_till_close": self.stargate.wh_manager.get_time_remaining(),
                     "ring_position":            self.stargate.ring.get_position(),
-                    "speed_dial_full_address":  self.stargate.cfg.get('dialing_address_book_dials_full_address')
+                    "speed_dial_full_address":  self.stargate.cfg.get('dialing_address_book_dials_full_address'),
+                    "dialing_timing":           self.stargate.dialing_pipeline.get_timing_report()
                 }
 
             elif request_path == "/get/system_info":
@@ -95,7 +100,17 @@ class StargateWebServer(SimpleHTTPRequestHandler):
             elif request_path == "/get/hardware_status":
                 data = {
                     "chevrons":                       self.stargate.chevrons.get_status(),
-                    "glyph_ring":                     self.stargate.ring.get_status()
+                    "glyph_ring":                     self.stargate.ring.get_status(),
+                    "input_latency":                  self.stargate.input_events.get_latency_statistics()
+                }
+
+            elif request_path == "/get/hardware_profile":
+                electronics = self.stargate.electronics
+                enabled = hasattr(electronics, 'get_profile')
+                data = {
+                    "enabled":                        enabled,
+                    "profile":                        electronics.get_profile() if enabled else {},
+                    "dialing_timing":                 self.stargate.dialing_pipeline.get_timing_report()
                 }
 
             elif request_path == "/get/dhd_symbols":
@@ -179,7 +194,7 @@ class StargateWebServer(SimpleHTTPRequestHandler):
                 return
 
             if self.path == "/do/chevron_cycle":
-                self.stargate.chevrons.get(int(data['chevron_number'])).cycle_outgoing()
+                self.stargate.chevrons.get(int(data['chevron_number'])).cycle_outgoing(wait=False)
                 data = { "success": True }
 
             elif self.path == "/do/all_chevron_leds_off":
@@ -192,8 +207,8 @@ class StargateWebServer(SimpleHTTPRequestHandler):
                 data = { "success": True }
 
             elif self.path == "/do/wormhole_on":
-                if not self.stargate.wormhole_active:
-                    self.stargate.wormhole_active = True
+                if self.stargate.state.transition(lambda state: None if state.wormhole_active else { "wormhole_active": True }):
+                    self.stargate.input_events.publish(InputEventBus.WAKE, source="web")
                     data = { "success": True }
                 else:
                     data = { "success": False, "message": "A wormhole is already established." }
@@ -221,13 +236,12 @@ class StargateWebServer(SimpleHTTPRequestHandler):
                 data = { "success": True }
 
             elif self.path == "/do/simulate_incoming":
-                if not self.stargate.wormhole_active: # If we don't already have an established wormhole
+                if not self.stargate.state.get().wormhole_active: # If we don't already have an established wormhole
                     # Get the loopback address and dial it
-                    for symbol_number in self.stargate.addr_manager.get_book().get_local_loopback_address():
-                        self.stargate.address_buffer_incoming.append(symbol_number)
-
-                    self.stargate.address_buffer_incoming.append(7) # Point of origin
-                    self.stargate.centre_button_incoming = True
+                    address = list(self.stargate.addr_manager.get_book().get_local_loopback_address())
+                    address.append(7) # Point of origin
+                    self.stargate.input_events.publish(InputEventBus.INCOMING_SYMBOLS, address, "web")
+                    self.stargate.input_events.publish(InputEventBus.INCOMING_CENTER_BUTTON, source="web")
                     data = { "success": True }
                 else:
                     data = { "success": False, "message": "A wormhole is already established." }
@@ -244,18 +258,17 @@ class StargateWebServer(SimpleHTTPRequestHandler):
                 symbol_number = int(data['symbol'])
 
                 if symbol_number > 0:
-                    self.stargate.keyboard.queue_symbol(symbol_number)
+                    self.stargate.keyboard.queue_symbol(symbol_number, "web")
                 elif symbol_number == 0:
-                    self.stargate.keyboard.queue_center_button()
-                elif symbol_number == -1 and self.stargate.wormhole_active is False and len(self.stargate.address_buffer_outgoing) > 0:
+                    self.stargate.keyboard.queue_center_button("web")
+                elif symbol_number == -1:
                     # Abort dialing
-                    self.stargate.dialing_log.dialing_fail(self.stargate.address_buffer_outgoing)
-                    self.stargate.shutdown(cancel_sound=False, wormhole_fail_sound=False)
+                    self.stargate.input_events.publish(InputEventBus.ABORT_DIALING, source="web")
 
                 data = { "success": True }
 
             elif self.path == "/do/clear_outgoing_buffer":
-                self.stargate.shutdown(cancel_sound=False, wormhole_fail_sound=False)
+                self.stargate.input_events.publish(InputEventBus.SHUTDOWN, source="web")
                 data = { "success": True }
 
             elif self.path == "/do/set_glyph_ring_zero":
@@ -270,6 +283,11 @@ class StargateWebServer(SimpleHTTPRequestHandler):
                 self.stargate.keyboard.enable_dhd_test(False)
                 data = { "success": True }
 
+            elif self.path == "/do/hardware_profile_reset":
+                if hasattr(self.stargate.electronics, 'reset_profile'):
+                    self.stargate.electronics.reset_profile()
+                data = { "success": True }
+
             ##### UPDATE DATA HANDLERS BELOW ####
             elif self.path == '/update/local_stargate_address':
 
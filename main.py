@@ -8,7 +8,7 @@ This main.py file is run automatically on boot. It is executed in a systemd daem
 
 import sys
 import os
-from time import sleep
+from time import sleep, monotonic
 from http.server import HTTPServer
 import threading
 import atexit
@@ -34,11 +34,14 @@ if GALAXY == "Milky Way":
 from stargate import Stargate
 from electronics import Electronics
 from network_tools import NetworkTools
+from gate_clock import VirtualClock, set_clock
 
 class GateApplication:
 
     def __init__(self):
 
+        self.boot_start_time = monotonic() # To measure the boot time
+
         # Configure Rollbar for uncaught exception logging and basic usage info
         ROLLBAR_POST_ACCESS_TOKEN = os.getenv("ROLLBAR_TOKEN") # pylint: disable=invalid-name
         rollbar.init(ROLLBAR_POST_ACCESS_TOKEN, 'production')
@@ -97,6 +100,11 @@ class GateApplication:
         ### Detect our electronics and initialize the hardware
         self.electronics = Electronics(self)
 
+        ### Run the simulated electronics faster than real time, for testing
+        if getattr(self.electronics, 'simulated', False) and self.cfg.get("simulation_clock_speed") != 1:
+            set_clock(VirtualClock(self.cfg.get("simulation_clock_speed")))
+            self.log.log(f'Simulation clock running at {self.cfg.get("simulation_clock_speed")}x')
+
         ### Initialize the Audio class and do some setup
         self.audio = StargateAudio(self, self.base_path)
 
@@ -123,6 +131,7 @@ class GateApplication:
             self.httpd_thread.daemon = True
             self.httpd_thread.start()
             self.log.log(f'Web Services API running on: {self.net_tools.get_local_ip()}:{self.cfg.get("control_api_server_port")}')
+            self.log.log(f'Boot time to gate ready: {monotonic() - self.boot_start_time:.2f}s')
         except:
             self.log.log("Failed to start webserver. Is the port in use?")
             rollbar.report_message('API Server: Failed to start', 'error')
@@ -0,0 +1,229 @@
+# pylint: disable=wrong-import-position
+"""
+A headless benchmark of the wormhole animations, using NeopixelSim instead of the physical led strip.
+
+Run it from the root of the repo:
+    python test/animation_benchmark.py [--output results.json] [--brightness 0.61] [--cycles 1] [--seed 1] [--no-alloc]
+
+Each animation is played in real time, like on the gate. The results are written as JSON, so they can be compared
+between releases:
+  - frames:               how many frames were sent to the strip
+  - duration:             end-to-end time in seconds
+  - fps:                  frames sent per second
+  - cpu_per_frame_us:     CPU time (process_time) per frame, in microseconds
+  - dropped_frames:       frames skipped by the FrameScheduler to keep up
+  - alloc_{cold,warm}_peak_bytes:     the most memory allocated at once while playing, above what was allocated before
+  - alloc_{cold,warm}_retained_bytes: memory still allocated after playing (eg new entries in the frame cache)
+  - alloc_{cold,warm}_blocks_per_frame: memory blocks still allocated after playing, per frame
+The allocations are measured with tracemalloc in two more runs, so they don't slow down the timed run: a cold run
+with an empty frame cache, where the sequences are rendered, then a warm run where they are replayed from the cache.
+"""
+import sys
+import os
+import json
+import random
+import argparse
+import platform
+import tracemalloc
+from time import time, process_time
+from types import SimpleNamespace
+
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_PATH)
+sys.path.append(BASE_PATH + '/classes')
+sys.path.append(BASE_PATH + '/classes/StargateMilkyWay')
+
+from version import VERSION
+from stargate_config import StargateConfig
+from hardware_simulation import NeopixelSim
+from wormhole_animation_manager import WormholeAnimationManager
+
+LED_COUNT = 122
+
+class CountingNeopixelSim(NeopixelSim):
+    """
+    A NeopixelSim that counts the frames and bytes sent to the strip.
+    """
+
+    def __init__(self, n):
+        super().__init__(n)
+        self.transmits = 0
+        self.transmitted_bytes = 0
+
+    def _transmit(self, buffer):
+        self.transmits += 1
+        self.transmitted_bytes += len(buffer)
+
+    def reset_counters(self):
+        self.transmits = 0
+        self.transmitted_bytes = 0
+
+
+class BenchmarkLog:
+    """
+    Collects the log messages, instead of writing them to the log files.
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def log(self, msg, print_to_console_override=False): # pylint: disable=unused-argument
+        self.messages.append(msg)
+
+
+def create_animation_manager(brightness):
+    """
+    This function sets up a WormholeAnimationManager on a CountingNeopixelSim, with the default configuration.
+    The local config files are not read or written.
+    :return: the WormholeAnimationManager is returned
+    """
+    log = BenchmarkLog()
+    cfg = StargateConfig(BASE_PATH, "config", "milkyway")
+    cfg.set_log(log)
+    cfg.load_defaults()
+    cfg.config = cfg.config_defaults
+
+    stargate = SimpleNamespace(cfg=cfg, log=log, base_path=BASE_PATH, galaxy_path="milkyway", wormhole_active=True)
+    pixels = CountingNeopixelSim(LED_COUNT)
+    pixels.brightness = brightness
+    wh_manager = SimpleNamespace(tot_leds=LED_COUNT, pixels=pixels)
+
+    animation_manager = WormholeAnimationManager(stargate)
+    animation_manager.after_init(wh_manager)
+    return animation_manager
+
+
+def get_scenarios(animation_manager, cycles):
+    """
+    This function lists the animations to benchmark.
+    :return: a list of (name, function) tuples
+    """
+    patterns = animation_manager.pattern_manager.get_patterns()
+    frame_cache = animation_manager.frame_cache
+
+    def sweep(direction):
+        new_frame = animation_manager.pattern_manager.pattern_to_frame(patterns[3])
+        animation_manager.play_sequence(frame_cache.get_sweep(animation_manager.current_frame, new_frame, direction))
+
+    def random_cycles():
+        for cycle in range(cycles): # pylint: disable=unused-variable
+            animation_manager.do_random_transitions()
+
+    scenarios = [
+        ('kawoosh', animation_manager.animate_kawoosh),
+        ('set_pattern', lambda: [animation_manager.set_wormhole_pattern(pattern) for pattern in patterns]),
+        ('fade', lambda: animation_manager.fade_transition(patterns[6])),
+        ('sweep_forward', lambda: sweep('forward')),
+        ('sweep_backwards', lambda: sweep('backwards')),
+        ('rotate_cw', lambda: animation_manager.rotate_pattern(direction='cw')),
+        ('rotate_ccw', lambda: animation_manager.rotate_pattern(direction='ccw')),
+    ]
+    for timeline in animation_manager.timeline_library.get_timelines():
+        scenarios.append(('timeline:' + timeline['name'], lambda timeline=timeline: animation_manager.play_timeline(timeline)))
+    scenarios.append(('random_transitions', random_cycles))
+    return scenarios
+
+
+def run_scenario(animation_manager, function, seed):
+    """
+    This function plays one animation, and measures it.
+    :return: a dict with the results
+    """
+    pixels = animation_manager.pixels
+    scheduler = animation_manager.scheduler
+
+    # Always start from the same frame, so the runs are comparable
+    random.seed(seed)
+    animation_manager.set_wormhole_pattern(animation_manager.pattern_manager.get_patterns()[0])
+    pixels.reset_counters()
+    scheduler.reset_statistics()
+
+    start_time = time()
+    start_cpu = process_time()
+    function()
+    cpu_time = process_time() - start_cpu
+    duration = time() - start_time
+
+    frames = pixels.transmits
+    return {
+        "frames": frames,
+        "duration": round(duration, 4),
+        "fps": round(frames / duration, 2) if duration else 0,
+        "cpu_per_frame_us": round(cpu_time / frames * 1e6, 2) if frames else 0,
+        "dropped_frames": scheduler.dropped_frames,
+        "transmitted_bytes": pixels.transmitted_bytes
+    }
+
+
+def measure_allocations(animation_manager, function, seed, frames, cold):
+    """
+    This function plays the animation again with tracemalloc, and measures the memory allocations.
+    :param cold: True to empty the frame cache first, False to replay with the cache filled by the previous run.
+    :return: a dict with the results
+    """
+    prefix = "alloc_cold_" if cold else "alloc_warm_"
+    if cold:
+        animation_manager.frame_cache.clear()
+
+    random.seed(seed)
+    animation_manager.set_wormhole_pattern(animation_manager.pattern_manager.get_patterns()[0])
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    function()
+    current, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    return {
+        prefix + "peak_bytes": peak - baseline,
+        prefix + "retained_bytes": current - baseline,
+        prefix + "blocks_per_frame": round(blocks / frames, 3) if frames else 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the wormhole animations on a simulated led strip.")
+    parser.add_argument('--output', help="write the JSON results to this file, instead of stdout")
+    parser.add_argument('--brightness', type=float, default=0.61, help="the strip brightness (the gate uses 0.61)")
+    parser.add_argument('--cycles', type=int, default=1, help="how many do_random_transitions cycles to run")
+    parser.add_argument('--seed', type=int, default=1, help="the random seed, for repeatable transitions")
+    parser.add_argument('--no-alloc', action='store_true', help="skip measuring the allocations")
+    parser.add_argument('--only', help="only run the scenarios with this text in their name")
+    args = parser.parse_args()
+
+    animation_manager = create_animation_manager(args.brightness)
+    results = {}
+    for name, function in get_scenarios(animation_manager, args.cycles):
+        if args.only and args.only not in name:
+            continue
+        print(f"Running {name}...", file=sys.stderr)
+        result = run_scenario(animation_manager, function, args.seed)
+        if not args.no_alloc:
+            result.update(measure_allocations(animation_manager, function, args.seed, result['frames'], cold=True))
+            result.update(measure_allocations(animation_manager, function, args.seed, result['frames'], cold=False))
+        results[name] = result
+
+    report = {
+        "version": VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "led_count": LED_COUNT,
+        "brightness": args.brightness,
+        "animation_fps": animation_manager.fps,
+        "seed": args.seed,
+        "results": results
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding="utf8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# pylint: disable=wrong-import-position
+"""
+A micro-benchmark of the CmdMessenger command encoding, without a DHD attached.
+
+Run it from the root of the repo:
+    python test/cmdmessenger_benchmark.py [--seconds 1]
+
+Each DHD command is encoded as many times as possible, with the precompiled encoders ("after") and with the
+generic encoding send() used before ("before"). The results are printed as messages/sec.
+"""
+import sys
+import os
+import argparse
+from time import perf_counter
+
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_PATH + '/classes')
+sys.path.append(BASE_PATH + '/classes/StargateMilkyWay')
+
+import StargateCmdMessenger
+from dialers import DHDv2
+
+class NullBoard(StargateCmdMessenger.ArduinoBoard):
+    """
+    An ArduinoBoard that doesn't open the serial port, and drops what is written to it.
+    """
+
+    def open(self):
+        self._is_connected = True
+
+    def write(self, msg):
+        pass
+
+
+def get_commands():
+    """
+    This function lists the commands to benchmark, like the DHD sends them.
+    :return: a list of (name, command, args) tuples
+    """
+    return [
+        ('set_pixel', 'set_pixel', (21, 250, 117, 0)),
+        ('set_pixel (large index)', 'set_pixel', (300, 250, 117, 0)),
+        ('clear_pixel', 'clear_pixel', (21,)),
+        ('set_all', 'set_all', (0, 0, 0)),
+        ('latch', 'latch', ()),
+    ]
+
+
+def measure(function, seconds):
+    """
+    This function calls function repeatedly for about the given number of seconds.
+    :return: the number of calls per second
+    """
+    calls = 0
+    batch = 1000
+    start_time = perf_counter()
+    while True:
+        for _ in range(batch):
+            function()
+        calls += batch
+        elapsed = perf_counter() - start_time
+        if elapsed >= seconds:
+            return calls / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CmdMessenger command encoding.")
+    parser.add_argument('--seconds', type=float, default=1.0, help="how long to run each measurement")
+    args = parser.parse_args()
+
+    board = NullBoard("/dev/null", settle_time=0, log=None)
+    messenger = StargateCmdMessenger.CmdMessenger(board, DHDv2.COMMANDS)
+    formats = dict(DHDv2.COMMANDS)
+
+    print(f"{'command':<26}{'before':>14}{'after':>14}{'speedup':>10}")
+    for name, command, command_args in get_commands():
+        arg_formats = formats[command]
+        generic = messenger.encode(command, *command_args, arg_formats=arg_formats)
+        compiled = messenger.encode(command, *command_args)
+        if generic != compiled:
+            raise AssertionError(f"{name}: {compiled!r} is not {generic!r}")
+
+        before = measure(lambda command=command, command_args=command_args, arg_formats=arg_formats:
+                         messenger.send(command, *command_args, arg_formats=arg_formats), args.seconds)
+        after = measure(lambda command=command, command_args=command_args:
+                        messenger.send(command, *command_args), args.seconds)
+        print(f"{name:<26}{before:>10.0f} /s {after:>10.0f} /s {after / before:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# pylint: disable=wrong-import-position
+"""
+A DHDv2 emulator on a pseudo-terminal, for testing the DHD code without the ItsyBitsy attached.
+
+It speaks the CmdMessenger protocol with the DHDv2 command table, and keeps the state of the virtual LEDs.
+
+Run it from the root of the repo:
+    python test/dhd_emulator.py                  # Print the port, and the LEDs each time they are latched
+    python test/dhd_emulator.py --benchmark 5    # Drive it with DHDv2 for 5 seconds, and print the throughput
+
+To point the gate (or test/dhd_test.py) at it, use the printed port as the dhd_serial_port.
+
+The real DHD sends its key presses as a USB keyboard, not over serial. DHDEmulator.press_key() passes them to
+the key_handler instead, eg KeyboardManager.keypress_handler when the emulator runs in the same process.
+"""
+import sys
+import os
+import tty
+import select
+import argparse
+from threading import Lock
+from time import sleep, perf_counter
+
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_PATH + '/classes')
+sys.path.append(BASE_PATH + '/classes/StargateMilkyWay')
+
+import StargateCmdMessenger
+from dialers import DHDv2
+
+class PtyBoard(StargateCmdMessenger.ArduinoBoard):
+    """
+    An ArduinoBoard on the master side of a pseudo-terminal.
+    """
+
+    def __init__(self, master_fd, timeout=0.2):
+        self.master_fd = master_fd
+        super().__init__("pty", timeout=timeout, settle_time=0, log=None)
+
+    def open(self):
+        self._is_connected = True
+
+    def read_available(self):
+        readable = select.select([self.master_fd], [], [], self.timeout)[0]
+        if not readable:
+            return b''
+        try:
+            return os.read(self.master_fd, 4096)
+        except OSError:
+            # The pty was closed
+            return b''
+
+    def read(self):
+        return self.read_available()[:1]
+
+    def write(self, msg):
+        os.write(self.master_fd, msg)
+
+    def close(self):
+        self._is_connected = False
+
+
+class DHDEmulator:
+    """
+    This class emulates a DHDv2 on a pseudo-terminal. The port attribute is the path to open, like /dev/ttyACM0.
+    """
+
+    FIRMWARE_VERSION = "emulator"
+    HARDWARE_VERSION = "DHDv2 emulator"
+    IDENTIFIER = "DHDv2"
+
+    def __init__(self, pixel_count=DHDv2.LED_COUNT, key_handler=None, on_latch=None):
+        self.pixel_count = pixel_count
+        self.key_handler = key_handler
+        self.on_latch = on_latch
+
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd) # No echo or line editing, like a USB serial device
+        self.port = os.ttyname(self.slave_fd)
+
+        self.lock = Lock()
+        self.ram = []
+        self.pixels = []
+        self.brightness_symbols = 255
+        self.brightness_center = 255
+        self.reset()
+        self.commands_received = 0
+        self.latches = 0
+
+        self.board = PtyBoard(self.master_fd)
+        self.messenger = StargateCmdMessenger.CmdMessenger(self.board, DHDv2.COMMANDS)
+
+    def start(self):
+        self.messenger.start_receiving(self.handle_message)
+
+    def stop(self):
+        self.messenger.stop_receiving()
+        self.board.close()
+        os.close(self.slave_fd)
+        os.close(self.master_fd)
+
+    def reset(self):
+        with self.lock:
+            self.ram = [(0, 0, 0)] * self.pixel_count # The RAM buffer, changed by the set/clear commands
+            self.pixels = list(self.ram)              # What the LEDs show, updated by latch
+
+    def get_pixels(self):
+        with self.lock:
+            return list(self.pixels)
+
+    def get_pixel(self, symbol_number):
+        """
+        This method returns the color of the LED of a symbol, as shown on the DHD.
+        :param symbol_number: the symbol number. The center button is 0.
+        :return: the color is returned as a (red, green, blue) tuple
+        """
+        with self.lock:
+            return self.pixels[DHDv2.SYMBOL_NUMBER_TO_DHD_LIGHT_MAP[symbol_number]]
+
+    def press_key(self, key):
+        """
+        This method presses a DHD key.
+        :param key: the character the DHD sends for the key, eg: "A" for the center button.
+        :return: Nothing is returned
+        """
+        if self.key_handler:
+            self.key_handler(key)
+
+    def handle_message(self, message):
+        """
+        This method runs a command from the host, in the receive thread.
+        :param message: the (command name, arguments, time) tuple from CmdMessenger
+        :return: True, the messages are never queued
+        """
+        cmd_name, arguments = message[0], message[1]
+        self.commands_received += 1
+
+        with self.lock:
+            if cmd_name == "set_pixel":
+                self.set_ram(arguments[0], tuple(arguments[1:4]))
+            elif cmd_name == "clear_pixel":
+                self.set_ram(arguments[0], (0, 0, 0))
+            elif cmd_name == "set_all":
+                self.ram = [tuple(arguments)] * self.pixel_count
+            elif cmd_name == "clear_all":
+                self.ram = [(0, 0, 0)] * self.pixel_count
+            elif cmd_name == "set_brightness_symbols":
+                self.brightness_symbols = arguments[0]
+            elif cmd_name == "set_brightness_center":
+                self.brightness_center = arguments[0]
+            elif cmd_name == "latch":
+                self.pixels = list(self.ram)
+                self.latches += 1
+
+        if cmd_name == "latch":
+            if self.on_latch:
+                self.on_latch(self.get_pixels())
+        elif cmd_name == "reset":
+            self.reset()
+        elif cmd_name == "get_fw_version":
+            self.messenger.send("get_fw_version", self.FIRMWARE_VERSION)
+        elif cmd_name == "get_hw_version":
+            self.messenger.send("get_hw_version", self.HARDWARE_VERSION)
+        elif cmd_name == "get_identifier":
+            self.messenger.send("get_identifier", self.IDENTIFIER)
+        elif cmd_name == "get_pixel_count":
+            self.messenger.send("get_pixel_count", self.pixel_count)
+        elif cmd_name not in ("set_pixel", "clear_pixel", "set_all", "clear_all", "set_brightness_symbols",
+                              "set_brightness_center"):
+            self.messenger.send("evt_error", f"Unknown command {cmd_name}")
+        return True
+
+    def set_ram(self, pixel_index, color):
+        if 0 <= pixel_index < self.pixel_count:
+            self.ram[pixel_index] = color
+        else:
+            self.messenger.send("evt_error", f"Invalid pixel index {pixel_index}")
+
+
+class ConsoleLog:
+    """
+    Prints the log messages, for the DHDv2 driven by the benchmark.
+    """
+
+    @staticmethod
+    def log(msg, print_to_console_override=False): # pylint: disable=unused-argument
+        print(msg)
+
+
+def format_pixels(pixels):
+    """
+    This function shows the lit LEDs, as led_id:rrggbb.
+    :return: the text is returned
+    """
+    lit = [f"{led}:{red:02x}{green:02x}{blue:02x}" for led, (red, green, blue) in enumerate(pixels) if red or green or blue]
+    return " ".join(lit) or "(all off)"
+
+
+def benchmark(emulator, seconds):
+    """
+    This function drives the emulator with DHDv2 over the pty, like a fast speed-dial, and prints the throughput.
+    :return: Nothing is returned
+    """
+    dhd = DHDv2(emulator.port, 115200, ConsoleLog())
+    dhd.set_color_center([255, 0, 0])
+    dhd.set_color_symbols([250, 117, 0])
+    print(f"Firmware: {dhd.get_firmware_version()}, pixels: {dhd.get_pixel_count()}")
+
+    symbols = [symbol for symbol in DHDv2.SYMBOL_NUMBER_TO_DHD_LIGHT_MAP if symbol != 0]
+    flushes = 0
+    start_time = perf_counter()
+    while perf_counter() - start_time < seconds:
+        # Dial 7 symbols and the center button, then clear the DHD
+        for index in range(7):
+            dhd.set_symbol_on(symbols[(flushes + index) % len(symbols)])
+        dhd.set_center_on()
+        dhd.clear_lights()
+        flushes += 9
+
+    # Wait for the emulator to catch up
+    commands_received = -1
+    while commands_received != emulator.commands_received:
+        commands_received = emulator.commands_received
+        sleep(0.1)
+    elapsed = perf_counter() - start_time - 0.1
+    dhd.c.stop_receiving()
+    dhd.board.close()
+
+    print(f"{flushes} DHD updates in {elapsed:.2f}s: {flushes / elapsed:.0f} updates/s")
+    print(f"The emulator received {emulator.commands_received} commands and {emulator.latches} latches: "
+          f"{emulator.commands_received / elapsed:.0f} commands/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate a DHDv2 on a pseudo-terminal.")
+    parser.add_argument('--benchmark', type=float, metavar='SECONDS', help="drive the emulator with DHDv2 and measure it")
+    args = parser.parse_args()
+
+    emulator = DHDEmulator(on_latch=None if args.benchmark else lambda pixels: print(format_pixels(pixels)))
+    emulator.start()
+    try:
+        if args.benchmark:
+            benchmark(emulator, args.benchmark)
+        else:
+            print(f"DHD emulator listening on {emulator.port}. Ctrl-C to stop.")
+            while True:
+                sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.stop()
+
+if __name__ == "__main__":
+    main()
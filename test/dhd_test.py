@@ -1,27 +1,47 @@
-from classes.DHD import DHDv2
+# pylint: disable=wrong-import-position
+"""
+Lights up all the DHD keys, then toggles the light of each key you press.
+
+Run it from the root of the repo:
+    python test/dhd_test.py [port]
+The port defaults to the DHDv2 USB serial device. Use the port printed by test/dhd_emulator.py to run it without a DHD.
+"""
+import sys
+import os
 from time import sleep
 
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_PATH + '/classes')
+sys.path.append(BASE_PATH + '/classes/StargateMilkyWay')
+
+from dialers import DHDv2
+
+class ConsoleLog:
+    @staticmethod
+    def log(msg, print_to_console_override=False): # pylint: disable=unused-argument
+        print(msg)
+
 # Initiate the DHD object.
-dhd_port = "/dev/serial/by-id/usb-Adafruit_ItsyBitsy_32u4_5V_16MHz_HIDPC-if00"
+dhd_port = sys.argv[1] if len(sys.argv) > 1 else "/dev/serial/by-id/usb-Adafruit_ItsyBitsy_32u4_5V_16MHz_HIDPC-if00"
 dhd_serial_baud_rate = 115200
-dhd = DHDv2(dhd_port, dhd_serial_baud_rate)
-dhd.setBrightnessCenter(100)
-dhd.setBrightnessSymbols(3)
-dhd.setAllPixelsToColor(0, 0, 0)
+dhd = DHDv2(dhd_port, dhd_serial_baud_rate, ConsoleLog())
+dhd.set_brightness_center(100)
+dhd.set_brightness_symbols(3)
+dhd.set_all_pixels_to_color(0, 0, 0)
 dhd.latch()
 
 # Run through all the DHD key lights
 for led in reversed(range(1, 39,)):
-    dhd.setPixel_use_LED_id(led, 250, 117, 0)
+    dhd.set_pixel_use_led_id(led, 250, 117, 0)
     dhd.latch()
     sleep(0.15)
-    dhd.setPixel_use_LED_id(led, 0, 0, 0)
+    dhd.set_pixel_use_led_id(led, 0, 0, 0)
     dhd.latch()
 # The centre button
-dhd.setPixel_use_LED_id(0, 255, 0, 0)
+dhd.set_pixel_use_led_id(0, 255, 0, 0)
 dhd.latch()
 sleep(2)
-dhd.clearAllPixels()
+dhd.clear_all_pixels()
 dhd.latch()
 
 ## the dictionary containing the key to symbol-number relations. https://thestargateproject.com/symbols_overview.pdf
@@ -54,21 +74,28 @@ def ask_for_input():
     while True:  # Keep running
         key = key_press()  # Save the input as a variable
 
+        # Stop on Ctrl-C or '-'
+        if key in ('\x03', '-'):
+            return
+
         # convert key press to symbol_number. https://thestargateproject.com/symbols_overview.pdf
-        symbol_number = key_symbol_map[str(key)]
+        try:
+            symbol_number = key_symbol_map[str(key)]
+        except KeyError:
+            continue
 
         # Toggle the light for the pressed key
         if symbol_number not in active:
             active.append(symbol_number)
             if symbol_number == 0:
-                dhd.setPixel(symbol_number, 255, 0, 0)
+                dhd.set_pixel(symbol_number, 255, 0, 0)
                 dhd.latch()
             else:
-                dhd.setPixel(symbol_number, 250, 117, 0)
+                dhd.set_pixel(symbol_number, 250, 117, 0)
                 dhd.latch()
         else:
             active.remove(symbol_number)
-            dhd.setPixel(symbol_number, 0, 0, 0)
+            dhd.set_pixel(symbol_number, 0, 0, 0)
             dhd.latch()
 
 # Run the DHD test script!
@@ -0,0 +1,599 @@
+# pylint: disable=wrong-import-position
+"""
+An end-to-end benchmark of the dialing, on the simulated electronics (ElectronicsNone), without audio, a DHD or a network.
+
+Run it from the root of the repo:
+    python test/dialing_benchmark.py [--output results.json] [--compare previous.json] [--pipeline fast] [--speed 10]
+
+The whole Stargate is booted, in a temporary copy of the config and logs folders, and the main loop runs like on the
+gate. A LAN gate is added to the address book, and played by a FakeSubspacePeer instead of the SubspaceClient sockets.
+The scenarios are scripted:
+  - keyboard_dial:  an address typed on the keyboard, the center button, then the center button again to close
+  - speed_dial:     an address book speed dial to the LAN gate, like the web interface, with subspace messages
+  - incoming_dial:  the LAN gate dials this gate over subspace
+  - wormhole:       a wormhole opened and closed from the web interface, without dialing
+
+Each scenario reports:
+  - chevrons:           per chevron, the time from the key press to the chevron locking (press_to_lock_ms), and the
+                        time of each stage of the DialingPipeline
+  - wake_latency:       the time from an input event to the main loop reacting to it. The main loop reads the inputs
+                        between two chevrons, so the presses made while a chevron locks wait for it
+  - subspace:           the round trips to the LAN gate, by message
+  - config_writes:      the config files saved, by file name
+  - log_lines:          the lines logged
+  - open_ms / close_ms: the time to open the wormhole after the center button, and to be back to idle after closing it
+
+The times are in gate clock milliseconds. With --speed, the gate runs on a VirtualClock faster than real time: the
+dialing times are unchanged, but the latencies of the Python code are multiplied by the speed.
+The results are written as JSON, so they can be compared between runs with --compare.
+"""
+import sys
+import os
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import schedule
+import rollbar
+from time import perf_counter
+from threading import Thread
+
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_PATH)
+sys.path.append(BASE_PATH + '/classes')
+sys.path.append(BASE_PATH + '/classes/StargateMilkyWay')
+
+from version import VERSION
+import gate_clock
+import subspace_messages
+from gate_clock import VirtualClock, monotonic
+from stargate_config import StargateConfig
+from ancients_log_book import AncientsLogBook
+from input_event_bus import InputEventBus
+from keyboard_manager import KeyboardManager
+from electronics_none import ElectronicsNone
+from stargate import Stargate, StargatePhase
+
+GALAXY = "Milky Way"
+GALAXY_PATH = "milkyway"
+
+PEER_NAME = "BENCHMARK PEER"
+PEER_ADDRESS = [9, 22, 35, 4, 17, 30]
+PEER_IP = "192.168.100.2"
+POINT_OF_ORIGIN = 1
+
+class CountingLog(AncientsLogBook):
+    """
+    An AncientsLogBook that counts the lines logged.
+    """
+
+    def __init__(self, base_path, log_file, print_to_console=False):
+        super().__init__(base_path, log_file, print_to_console)
+        self.lines = 0
+
+    def log(self, msg, print_to_console_override=False):
+        self.lines += 1
+        super().log(msg, print_to_console_override)
+
+
+class SilentAudio:
+    """
+    Stands in for StargateAudio, without the sound files or an audio device. It counts the sounds started.
+    """
+
+    def __init__(self):
+        self.volume = 0
+        self.sounds_started = 0
+
+    def sound_start(self, clip_name, delay=0.0): # pylint: disable=unused-argument
+        self.sounds_started += 1
+
+    def sound_stop(self, clip_name):
+        pass
+
+    def is_playing(self, clip_name): # pylint: disable=unused-argument
+        return False
+
+    def incoming_chevron(self):
+        self.sounds_started += 1
+
+    def play_random_clip(self, directory): # pylint: disable=unused-argument
+        self.sounds_started += 1
+
+    @staticmethod
+    def random_clip_is_playing():
+        return False
+
+    def random_clip_wait_done(self):
+        pass
+
+    def volume_up(self):
+        pass
+
+    def volume_down(self):
+        pass
+
+
+class OfflineNetworkTools:
+    """
+    Stands in for NetworkTools, without internet access. The SubspaceServer is not started.
+    """
+
+    @staticmethod
+    def has_internet_access():
+        return False
+
+    @staticmethod
+    def get_local_ip():
+        return "127.0.0.1"
+
+
+class NoSoftwareUpdate:
+    """
+    Stands in for SoftwareUpdateV2.
+    """
+
+    @staticmethod
+    def get_current_version():
+        return VERSION
+
+
+class BenchmarkApp: # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """
+    Stands in for the GateApplication of main.py, in a temporary folder with a copy of the default configuration.
+    """
+
+    def __init__(self, pipeline_mode, verbose):
+        self.boot_start_time = perf_counter()
+        self.galaxy = GALAXY
+        self.galaxy_path = GALAXY_PATH
+        self.is_daemon = False
+
+        self.base_path = tempfile.mkdtemp(prefix="stargate-benchmark-")
+        shutil.copytree(BASE_PATH + "/config/defaults-" + self.galaxy_path,
+                        self.base_path + "/config/defaults-" + self.galaxy_path)
+        os.mkdir(self.base_path + "/logs")
+
+        self.cfg = StargateConfig(self.base_path, "config", self.galaxy_path)
+        self.log = CountingLog(self.base_path, self.galaxy_path + ".log", print_to_console=verbose)
+        self.cfg.set_log(self.log)
+        self.cfg.load()
+
+        # No DHD, and nothing scheduled from the network
+        self.cfg.set_non_persistent("dhd_enable", False)
+        self.cfg.set_non_persistent("fan_gate_refresh_enable", False)
+        self.cfg.set_non_persistent("dialing_pipeline_mode", pipeline_mode)
+
+        self.electronics = ElectronicsNone()
+        self.audio = SilentAudio()
+        self.net_tools = OfflineNetworkTools()
+        self.schedule = schedule
+        self.sw_updater = NoSoftwareUpdate()
+
+        self.stargate = None
+
+    def boot(self):
+        self.stargate = Stargate(self)
+        return perf_counter() - self.boot_start_time
+
+    def cleanup(self):
+        shutil.rmtree(self.base_path, ignore_errors=True)
+
+
+class ConfigWriteCounter:
+    """
+    Counts the config files saved, by file name.
+    """
+
+    def __init__(self):
+        self.writes = {}
+        self.save = StargateConfig.save
+
+    def install(self):
+        counter = self
+        def counted_save(config, sort=False):
+            counter.writes[config.file_name] = counter.writes.get(config.file_name, 0) + 1
+            counter.save(config, sort)
+        StargateConfig.save = counted_save
+
+    def reset(self):
+        self.writes = {}
+
+
+class FakeSubspacePeer:
+    """
+    A LAN gate on the other end of subspace. It replaces the sockets of the SubspaceClient, and records the round trips.
+    It can also dial this gate, with the messages the SubspaceServer would receive.
+    """
+
+    def __init__(self, stargate, round_trip):
+        self.stargate = stargate
+        self.round_trip = round_trip
+        self.busy = False
+        self.messages = {}
+        self.round_trips = 0
+        self.total_time = 0
+
+    def install(self):
+        self.stargate.addr_manager.get_book().set_lan_gate(PEER_NAME, PEER_ADDRESS, PEER_IP)
+        self.stargate.subspace_client.send_to_remote_stargate = self.send_to_remote_stargate
+
+    def send_to_remote_stargate(self, server_ip, message_string):
+        """
+        This method answers like SubspaceClient.send_to_remote_stargate().
+        :return: a tuple: is there a connection, and the remote gate status if CHECK_STATUS was sent.
+        """
+        if server_ip != PEER_IP:
+            return False, False
+
+        start_time = monotonic()
+        gate_clock.sleep(self.round_trip)
+        kind = message_string if message_string in (subspace_messages.CHECK_STATUS, subspace_messages.DIAL_CENTER_INCOMING) \
+            else "address"
+        self.messages[kind] = self.messages.get(kind, 0) + 1
+        self.round_trips += 1
+        self.total_time += monotonic() - start_time
+
+        if message_string == subspace_messages.CHECK_STATUS:
+            return True, str(self.busy)
+        return True, None
+
+    def dial(self, address, symbol_interval, timeout):
+        """
+        This method dials this gate from the peer, one symbol at a time, like the SubspaceServer receives it.
+        :return: a list of the times from sending a symbol to its chevron locking, in seconds
+        """
+        stargate = self.stargate
+        lock_times = []
+        for count in range(1, len(address) + 1):
+            gate_clock.sleep(symbol_interval)
+            sent_time = monotonic()
+            message = str(address[0:count])
+            stargate.input_events.publish(InputEventBus.INCOMING_SYMBOLS, list(stargate.addr_manager.is_valid(message)),
+                                          "subspace")
+            wait_for_state(stargate, lambda state, count=count: state.locked_chevrons_incoming >= count, timeout)
+            lock_times.append(monotonic() - sent_time)
+        return lock_times
+
+    def press_center_button(self):
+        self.stargate.input_events.publish(InputEventBus.INCOMING_CENTER_BUTTON, PEER_IP, "subspace")
+
+    def get_statistics(self):
+        return {
+            "round_trips": self.round_trips,
+            "messages": dict(sorted(self.messages.items())),
+            "total_ms": round(self.total_time * 1000, 1),
+            "average_ms": round(self.total_time / self.round_trips * 1000, 2) if self.round_trips else 0
+        }
+
+    def reset_statistics(self):
+        self.messages = {}
+        self.round_trips = 0
+        self.total_time = 0
+
+
+def get_point_of_origin(address):
+    """
+    This function picks the point of origin of a gate. It can't be a symbol of the address.
+    :return: the symbol number is returned
+    """
+    return next(symbol for symbol in range(POINT_OF_ORIGIN, 39) if symbol not in address)
+
+
+def wait_for_state(stargate, predicate, timeout):
+    """
+    This function waits until the gate state matches a predicate.
+    :param timeout: the most real seconds to wait
+    :return: the GateState is returned
+    """
+    deadline = perf_counter() + timeout
+    state = stargate.state.get()
+    while not predicate(state):
+        remaining = deadline - perf_counter()
+        if remaining <= 0:
+            raise TimeoutError(f"The gate did not reach the expected state in {timeout}s: {state}")
+        state = stargate.state.wait_for_change(state.version, min(remaining, 0.1))
+    return state
+
+
+def wait_for_idle(stargate, timeout):
+    deadline = perf_counter() + timeout
+    wait_for_state(stargate, lambda state: not state.wormhole_active and not state.address_buffer_outgoing and \
+                   not state.address_buffer_incoming, timeout)
+    while stargate.phase != StargatePhase.IDLE:
+        if perf_counter() > deadline:
+            raise TimeoutError(f"The gate is not idle after {timeout}s: {stargate.phase}")
+        gate_clock.sleep(0.01)
+
+
+class DialingBenchmark:
+    """
+    This class runs the scenarios on a booted gate, and collects the measurements.
+    """
+
+    def __init__(self, app, peer, config_writes, args):
+        self.app = app
+        self.stargate = app.stargate
+        self.peer = peer
+        self.config_writes = config_writes
+        self.key_interval = args.key_interval
+        self.hold = args.hold
+        self.timeout = args.timeout
+        self.press_times = []
+
+    def get_scenarios(self):
+        """
+        This method lists the scenarios.
+        :return: a list of (name, function) tuples
+        """
+        return [
+            ('keyboard_dial', self.keyboard_dial),
+            ('speed_dial', self.speed_dial),
+            ('incoming_dial', self.incoming_dial),
+            ('wormhole', self.wormhole),
+        ]
+
+    def run_scenario(self, function):
+        """
+        This method runs one scenario from an idle gate, and measures it.
+        :return: a dict with the results
+        """
+        stargate = self.stargate
+        wait_for_idle(stargate, self.timeout)
+        stargate.input_events.reset_statistics()
+        self.peer.reset_statistics()
+        self.config_writes.reset()
+        self.press_times = []
+        log_lines = self.app.log.lines
+
+        start_time = perf_counter()
+        start_gate_time = monotonic()
+        result = function()
+        wait_for_idle(stargate, self.timeout)
+
+        result.update({
+            "duration": round(perf_counter() - start_time, 3),
+            "gate_duration": round(monotonic() - start_gate_time, 3),
+            "wake_latency": stargate.input_events.get_latency_statistics(),
+            "subspace": self.peer.get_statistics(),
+            "config_writes": dict(sorted(self.config_writes.writes.items())),
+            "log_lines": self.app.log.lines - log_lines
+        })
+        return result
+
+    def press(self, function, *args):
+        gate_clock.sleep(self.key_interval)
+        self.press_times.append(monotonic())
+        function(*args)
+
+    def get_outgoing_chevrons(self):
+        """
+        This method matches the DialingPipeline timing of each chevron with the time its symbol was pressed.
+        :return: a dict with the chevron timings
+        """
+        pipeline = self.stargate.dialing_pipeline
+        report = pipeline.get_timing_report()
+        chevrons = []
+        for timing in report['chevrons']:
+            chevron = dict(timing)
+            locked_time = pipeline.dial_start_time + timing['elapsed_ms'] / 1000
+            chevron['press_to_lock_ms'] = round((locked_time - self.press_times[timing['chevron'] - 1]) * 1000, 1)
+            chevrons.append(chevron)
+        return {
+            "pipeline": report['mode'],
+            "dial_ms": report['total_ms'],
+            "chevrons": chevrons
+        }
+
+    def dial_outgoing(self, address, press_symbol, press_center):
+        """
+        This method presses the symbols and the center button, and waits for the wormhole.
+        :return: a dict with the chevron timings and open_ms
+        """
+        pipeline = self.stargate.dialing_pipeline
+        for symbol in address:
+            self.press(press_symbol, symbol)
+        wait_for_state(self.stargate, lambda state: len(pipeline.timings) == len(address), self.timeout)
+
+        open_start = gate_clock.time()
+        press_center()
+        result = self.get_outgoing_chevrons()
+        result['open_ms'] = self.wait_for_wormhole(open_start)
+        return result
+
+    def wait_for_wormhole(self, start_time):
+        """
+        This method waits until the wormhole is open: the kawoosh is done, and it's stable.
+        :param start_time: the gate_clock.time() of the center button press
+        :return: the time to open, in milliseconds
+        """
+        deadline = perf_counter() + self.timeout
+        while not self.stargate.wh_manager.open_time:
+            if perf_counter() > deadline:
+                raise TimeoutError(f"The wormhole did not open in {self.timeout}s")
+            gate_clock.sleep(0.01)
+        return round((self.stargate.wh_manager.open_time - start_time) * 1000, 1)
+
+    def close_wormhole(self, close):
+        """
+        This method holds the wormhole open for a while, closes it and waits for the gate to be idle.
+        :return: the time to close, in milliseconds
+        """
+        gate_clock.sleep(self.hold)
+        start_time = monotonic()
+        close()
+        wait_for_idle(self.stargate, self.timeout)
+        return round((monotonic() - start_time) * 1000, 1)
+
+    def close_from_web(self):
+        # Like /do/wormhole_off
+        self.stargate.wormhole_active = False
+
+    def keyboard_dial(self):
+        keyboard = self.stargate.keyboard
+        symbol_keys = { symbol: key for key, symbol in self.stargate.symbol_manager.get_symbol_key_map().items() if key }
+        address = self.stargate.addr_manager.get_book().get_standard_gates()['ABYDOS']['gate_address']
+        address = address + [get_point_of_origin(address)]
+
+        result = self.dial_outgoing(address, lambda symbol: keyboard.keypress_handler(symbol_keys[symbol]),
+                                    lambda: keyboard.keypress_handler(keyboard.center_button_key))
+        result['close_ms'] = self.close_wormhole(lambda: keyboard.keypress_handler(keyboard.center_button_key))
+        return result
+
+    def speed_dial(self):
+        # Like the speed dial of the web interface, with dialing_address_book_dials_full_address on
+        keyboard = self.stargate.keyboard
+        address = PEER_ADDRESS + [get_point_of_origin(PEER_ADDRESS)]
+        self.stargate.input_events.publish(InputEventBus.SHUTDOWN, source="web") # Clear the buffer first
+
+        result = self.dial_outgoing(address, lambda symbol: keyboard.queue_symbol(symbol, "web"),
+                                    lambda: keyboard.queue_center_button("web"))
+        result['close_ms'] = self.close_wormhole(self.close_from_web)
+        return result
+
+    def incoming_dial(self):
+        address = self.stargate.addr_manager.get_book().get_local_loopback_address()
+        address = address + [get_point_of_origin(address)]
+        lock_times = self.peer.dial(address, self.key_interval, self.timeout)
+        open_start = gate_clock.time()
+        self.peer.press_center_button()
+        open_ms = self.wait_for_wormhole(open_start)
+
+        return {
+            "chevrons": [ { "chevron": chevron, "symbol": symbol, "send_to_lock_ms": round(lock_time * 1000, 1) }
+                          for chevron, (symbol, lock_time) in enumerate(zip(address, lock_times), start=1) ],
+            "open_ms": open_ms,
+            "close_ms": self.close_wormhole(self.close_from_web)
+        }
+
+    def wormhole(self):
+        # Like /do/wormhole_on and /do/wormhole_off
+        stargate = self.stargate
+        open_start = gate_clock.time()
+        stargate.state.transition(lambda state: None if state.wormhole_active else { "wormhole_active": True })
+        stargate.input_events.publish(InputEventBus.WAKE, source="web")
+
+        return {
+            "open_ms": self.wait_for_wormhole(open_start),
+            "close_ms": self.close_wormhole(self.close_from_web)
+        }
+
+
+def get_summary(result):
+    """
+    This function picks the main figures of a scenario, to compare the runs.
+    :return: a dict of name: value
+    """
+    summary = {}
+    for name in ('dial_ms', 'open_ms', 'close_ms'):
+        if name in result:
+            summary[name] = result[name]
+    chevrons = result.get('chevrons')
+    if chevrons:
+        key = 'press_to_lock_ms' if 'press_to_lock_ms' in chevrons[0] else 'send_to_lock_ms'
+        summary[key.replace('_ms', '_avg_ms')] = round(sum(chevron[key] for chevron in chevrons) / len(chevrons), 1)
+    summary['wake_avg_ms'] = result['wake_latency'].get('average_ms', 0)
+    summary['wake_max_ms'] = result['wake_latency'].get('max_ms', 0)
+    summary['subspace_round_trips'] = result['subspace']['round_trips']
+    summary['config_writes'] = sum(result['config_writes'].values())
+    summary['log_lines'] = result['log_lines']
+    return summary
+
+
+def print_comparison(report, previous):
+    """
+    This function prints the main figures of this run next to a previous one.
+    :return: Nothing is returned
+    """
+    print(f"{'scenario':<16}{'metric':<24}{'previous':>12}{'current':>12}{'change':>10}", file=sys.stderr)
+    for name, result in report['results'].items():
+        previous_result = previous.get('results', {}).get(name)
+        previous_summary = get_summary(previous_result) if previous_result else {}
+        for metric, value in get_summary(result).items():
+            before = previous_summary.get(metric)
+            if before is None:
+                print(f"{name:<16}{metric:<24}{'-':>12}{value:>12}{'':>10}", file=sys.stderr)
+                continue
+            change = f"{(value - before) / before * 100:+.1f}%" if before else ""
+            print(f"{name:<16}{metric:<24}{before:>12}{value:>12}{change:>10}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dialing end to end, on the simulated electronics.")
+    parser.add_argument('--output', help="write the JSON results to this file, instead of stdout")
+    parser.add_argument('--compare', help="compare the results with a previous JSON results file")
+    parser.add_argument('--pipeline', choices=['canon', 'fast'], default='canon', help="the dialing_pipeline_mode")
+    parser.add_argument('--speed', type=float, default=1.0, help="run the gate clock this many times faster")
+    parser.add_argument('--key-interval', type=float, default=0.3, help="the seconds between two key presses")
+    parser.add_argument('--hold', type=float, default=2.0, help="the seconds to keep each wormhole open")
+    parser.add_argument('--round-trip', type=float, default=0.02, help="the subspace round trip time, in seconds")
+    parser.add_argument('--timeout', type=float, default=180.0, help="the most real seconds to wait for the gate")
+    parser.add_argument('--verbose', action='store_true', help="print the gate log")
+    parser.add_argument('--only', help="only run the scenarios with this text in their name")
+    args = parser.parse_args()
+
+    if args.speed <= 0:
+        parser.error("--speed must be more than 0")
+    if args.speed != 1:
+        gate_clock.set_clock(VirtualClock(args.speed))
+
+    rollbar.init(None, 'benchmark', enabled=False) # Don't report the dials
+
+    # The benchmark presses the keys itself, instead of reading them from STDIN
+    KeyboardManager.stdin_thread_start = lambda keyboard: None
+
+    config_writes = ConfigWriteCounter()
+    config_writes.install()
+
+    app = BenchmarkApp(args.pipeline, args.verbose)
+    try:
+        print("Booting the gate...", file=sys.stderr)
+        boot_time = app.boot()
+        stargate = app.stargate
+        peer = FakeSubspacePeer(stargate, args.round_trip)
+        peer.install()
+
+        main_loop = Thread(name="stargate-main-loop", target=stargate.update, daemon=True)
+        main_loop.start()
+
+        benchmark = DialingBenchmark(app, peer, config_writes, args)
+        results = {}
+        for name, function in benchmark.get_scenarios():
+            if args.only and args.only not in name:
+                continue
+            print(f"Running {name}...", file=sys.stderr)
+            results[name] = benchmark.run_scenario(function)
+
+        stargate.running = False
+        stargate.input_events.publish(InputEventBus.WAKE, source="benchmark")
+        main_loop.join(args.timeout)
+    finally:
+        app.cleanup()
+
+    report = {
+        "version": VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "pipeline": args.pipeline,
+        "clock_speed": args.speed,
+        "key_interval": args.key_interval,
+        "hold": args.hold,
+        "round_trip": args.round_trip,
+        "boot_ms": round(boot_time * 1000, 1),
+        "results": results
+    }
+
+    if args.compare:
+        with open(args.compare, 'r', encoding="utf8") as file:
+            print_comparison(report, json.load(file))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding="utf8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -38,3 +38,31 @@ function initialize_button_handlers(){
       });
   });
 }
+
+function update_hardware_profile(){
+  $.get('stargate/get/hardware_profile')
+    .done(function(data) {
+      if (!data.enabled){
+        $('#hardwareProfile').html("<p>The electronics profiler is disabled. Set electronics_profiler_enable in the Configuration, and restart.</p>")
+        return
+      }
+
+      html = "<table class='table table-sm'><tr><th>Call</th><th>Calls</th><th>Total (ms)</th><th>Average (us)</th><th>Max (us)</th></tr>"
+      $.each(data.profile, function(name, stats) {
+        html += "<tr><td>" + name + "</td><td>" + stats.calls + "</td><td>" + stats.total_ms + "</td><td>" + stats.average_us + "</td><td>" + stats.max_us + "</td></tr>"
+      });
+      html += "</table>"
+
+      if (data.dialing_timing.chevrons.length){
+        html += "<p>Last dial (" + data.dialing_timing.mode + "): " + data.dialing_timing.total_ms + " ms</p>"
+      }
+      $('#hardwareProfile').html(html)
+    })
+    .fail(function() {
+      console.log("Failed to communicate with Stargate")
+    });
+}
+
+$( function() {
+  $('#hardwareProfileRefresh').click(update_hardware_profile)
+})